@@ -0,0 +1,357 @@
+# aabbtree.py
+# A dynamic AABB tree, for finding which boxes touch a given box without
+# looking at every box.
+#
+# An AABB (axis-aligned bounding box) is a box with its sides along the x,
+# y and z axes, given as (x1, y1, z1, x2, y2, z2). The tree is a binary
+# tree: every box we put in is a leaf, and every other node holds the
+# smallest box around both of its children. To find the boxes which touch
+# a box we start at the top and only go down into nodes whose box touches
+# it, so in a big world we skip almost all of the tree.
+#
+# Unlike the grid in floorindex.py, boxes can be added, removed and moved
+# one at a time. New boxes go next to whichever node makes the tree's
+# boxes grow the least (by surface area), and the tree is rebalanced on
+# the way back up, like an AVL tree, so it never gets more than a few
+# levels deeper than it has to be. This is the same way Box2D's
+# b2DynamicTree works.
+#
+# The tree is a dict of lists, with one entry in each list per node:
+#   box         the node's box
+#   parent      the parent node, or -1 for the top (root) node
+#   left, right the child nodes, or -1 for a leaf
+#   height      0 for a leaf, otherwise one more than its highest child
+#   item        for a leaf, the item it is for, otherwise None
+# and also:
+#   root        the root node, or -1 if the tree is empty
+#   free        node numbers which aren't being used, to use again
+#   leaf        the leaf node for each item
+
+# Make a new empty tree.
+def aabb_tree_new():
+    return {
+        "box":      [],
+        "parent":   [],
+        "left":     [],
+        "right":    [],
+        "height":   [],
+        "item":     [],
+        "root":     -1,
+        "free":     [],
+        "leaf":     {},
+    }
+
+# Build a tree holding a list of boxes all at once. Item i is boxes[i].
+# This is quicker than adding them one at a time, and makes a tree which
+# is as shallow as possible.
+def aabb_tree_build(boxes):
+    tree    = aabb_tree_new()
+    items   = list(range(len(boxes)))
+    if items:
+        tree["root"] = aabb_tree_build_node(tree, boxes, items, -1)
+    return tree
+
+# Make a node for a list of items, and the nodes below it. We split the
+# items in half along whichever axis their middles are most spread out
+# on. Returns the node number.
+def aabb_tree_build_node(tree, boxes, items, parent):
+    if len(items) == 1:
+        node = aabb_tree_node(tree, tuple(boxes[items[0]]), parent, items[0])
+        tree["leaf"][items[0]] = node
+        return node
+
+    middles = [(boxes[i][0] + boxes[i][3], boxes[i][1] + boxes[i][4],
+                boxes[i][2] + boxes[i][5]) for i in items]
+    spread  = [max(m[a] for m in middles) - min(m[a] for m in middles)
+                for a in range(3)]
+    axis    = spread.index(max(spread))
+    order   = sorted(range(len(items)), key=lambda k: middles[k][axis])
+    half    = len(items) // 2
+
+    node    = aabb_tree_node(tree, None, parent, None)
+    left    = aabb_tree_build_node(tree, boxes,
+                [items[k] for k in order[:half]], node)
+    right   = aabb_tree_build_node(tree, boxes,
+                [items[k] for k in order[half:]], node)
+    tree["left"][node]  = left
+    tree["right"][node] = right
+    aabb_tree_refit(tree, node)
+    return node
+
+# Get a node to use, either one from the free list or a new one.
+def aabb_tree_node(tree, box, parent, item):
+    if tree["free"]:
+        node = tree["free"].pop()
+        tree["box"][node]       = box
+        tree["parent"][node]    = parent
+        tree["left"][node]      = -1
+        tree["right"][node]     = -1
+        tree["height"][node]    = 0
+        tree["item"][node]      = item
+    else:
+        node = len(tree["box"])
+        tree["box"].append(box)
+        tree["parent"].append(parent)
+        tree["left"].append(-1)
+        tree["right"].append(-1)
+        tree["height"].append(0)
+        tree["item"].append(item)
+    return node
+
+# Put a node on the free list.
+def aabb_tree_free(tree, node):
+    tree["box"][node]   = None
+    tree["item"][node]  = None
+    tree["free"].append(node)
+
+# The smallest box around boxes a and b.
+def aabb_union(a, b):
+    return (min(a[0], b[0]), min(a[1], b[1]), min(a[2], b[2]),
+            max(a[3], b[3]), max(a[4], b[4]), max(a[5], b[5]))
+
+# The surface area of a box.
+def aabb_area(b):
+    dx = b[3] - b[0]
+    dy = b[4] - b[1]
+    dz = b[5] - b[2]
+    return 2 * (dx*dy + dy*dz + dz*dx)
+
+# Do boxes a and b touch? Boxes which only meet at an edge count.
+def aabb_overlap(a, b):
+    return (a[0] <= b[3] and b[0] <= a[3] and a[1] <= b[4] and b[1] <= a[4]
+            and a[2] <= b[5] and b[2] <= a[5])
+
+# Work out a node's box and height from its children.
+def aabb_tree_refit(tree, node):
+    left    = tree["left"][node]
+    right   = tree["right"][node]
+    tree["box"][node]       = aabb_union(tree["box"][left], tree["box"][right])
+    tree["height"][node]    = 1 + max(tree["height"][left],
+                                      tree["height"][right])
+
+# Add an item with the given box. Each item can only be in the tree once.
+def aabb_tree_insert(tree, item, box):
+    if item in tree["leaf"]:
+        raise KeyError("%r is already in the tree" % (item,))
+    box     = tuple(box)
+    leaf    = aabb_tree_node(tree, box, -1, item)
+    tree["leaf"][item] = leaf
+    if tree["root"] == -1:
+        tree["root"] = leaf
+        return
+
+    # Go down the tree to find the best node to put the new leaf next to.
+    # Putting it next to a node costs the area of the new parent node,
+    # plus how much bigger every node above has to get; going further
+    # down costs the same growth above, plus whatever it costs below.
+    boxes   = tree["box"]
+    node    = tree["root"]
+    while tree["left"][node] != -1:
+        left        = tree["left"][node]
+        right       = tree["right"][node]
+        area        = aabb_area(boxes[node])
+        combined    = aabb_area(aabb_union(boxes[node], box))
+        cost        = 2 * combined
+        inherit     = 2 * (combined - area)
+        cost_left   = aabb_tree_descend_cost(tree, left, box) + inherit
+        cost_right  = aabb_tree_descend_cost(tree, right, box) + inherit
+        if cost < cost_left and cost < cost_right:
+            break
+        node = left if cost_left < cost_right else right
+
+    # Make a new parent for the node we found and the new leaf.
+    sibling = node
+    old     = tree["parent"][sibling]
+    parent  = aabb_tree_node(tree, aabb_union(boxes[sibling], box), old, None)
+    tree["left"][parent]    = sibling
+    tree["right"][parent]   = leaf
+    tree["height"][parent]  = tree["height"][sibling] + 1
+    tree["parent"][sibling] = parent
+    tree["parent"][leaf]    = parent
+    if old == -1:
+        tree["root"] = parent
+    elif tree["left"][old] == sibling:
+        tree["left"][old] = parent
+    else:
+        tree["right"][old] = parent
+
+    aabb_tree_fix_up(tree, tree["parent"][leaf])
+
+# How much it costs to put a box somewhere under node (see
+# aabb_tree_insert).
+def aabb_tree_descend_cost(tree, node, box):
+    joined = aabb_area(aabb_union(tree["box"][node], box))
+    if tree["left"][node] == -1:
+        return joined
+    return joined - aabb_area(tree["box"][node])
+
+# Go up the tree from node to the root, rebalancing and working out the
+# boxes and heights again.
+def aabb_tree_fix_up(tree, node):
+    while node != -1:
+        node = aabb_tree_balance(tree, node)
+        aabb_tree_refit(tree, node)
+        node = tree["parent"][node]
+
+# Take an item out of the tree.
+def aabb_tree_remove(tree, item):
+    leaf = tree["leaf"].pop(item)
+    if leaf == tree["root"]:
+        tree["root"] = -1
+        aabb_tree_free(tree, leaf)
+        return
+
+    # The leaf's parent goes, and its sibling takes the parent's place.
+    parent  = tree["parent"][leaf]
+    grand   = tree["parent"][parent]
+    if tree["left"][parent] == leaf:
+        sibling = tree["right"][parent]
+    else:
+        sibling = tree["left"][parent]
+
+    tree["parent"][sibling] = grand
+    if grand == -1:
+        tree["root"] = sibling
+    else:
+        if tree["left"][grand] == parent:
+            tree["left"][grand] = sibling
+        else:
+            tree["right"][grand] = sibling
+        aabb_tree_fix_up(tree, grand)
+    aabb_tree_free(tree, parent)
+    aabb_tree_free(tree, leaf)
+
+# Change the box of an item which is already in the tree.
+def aabb_tree_move(tree, item, box):
+    aabb_tree_remove(tree, item)
+    aabb_tree_insert(tree, item, box)
+
+# If one side of node a is more than one level deeper than the other,
+# rotate the deeper child up to take a's place. Returns whichever node is
+# now where a was.
+def aabb_tree_balance(tree, a):
+    left    = tree["left"]
+    right   = tree["right"]
+    parent  = tree["parent"]
+    height  = tree["height"]
+    box     = tree["box"]
+    if left[a] == -1 or height[a] < 2:
+        return a
+
+    b = left[a]
+    c = right[a]
+    balance = height[c] - height[b]
+
+    if balance > 1:
+        # Rotate c up: a becomes c's left child, and c's lower child
+        # becomes a's right child.
+        (f, g) = (left[c], right[c])
+        left[c]     = a
+        parent[c]   = parent[a]
+        parent[a]   = c
+        aabb_tree_relink(tree, parent[c], a, c)
+        if height[f] > height[g]:
+            right[c]    = f
+            right[a]    = g
+            parent[g]   = a
+        else:
+            right[c]    = g
+            right[a]    = f
+            parent[f]   = a
+        aabb_tree_refit(tree, a)
+        aabb_tree_refit(tree, c)
+        return c
+
+    if balance < -1:
+        # Rotate b up, the same way round the other side.
+        (d, e) = (left[b], right[b])
+        left[b]     = a
+        parent[b]   = parent[a]
+        parent[a]   = b
+        aabb_tree_relink(tree, parent[b], a, b)
+        if height[d] > height[e]:
+            right[b]    = d
+            left[a]     = e
+            parent[e]   = a
+        else:
+            right[b]    = e
+            left[a]     = d
+            parent[d]   = a
+        aabb_tree_refit(tree, a)
+        aabb_tree_refit(tree, b)
+        return b
+
+    return a
+
+# Node old has been replaced by node new under node up (or at the root, if
+# up is -1); point up at new.
+def aabb_tree_relink(tree, up, old, new):
+    if up == -1:
+        tree["root"] = new
+    elif tree["left"][up] == old:
+        tree["left"][up] = new
+    else:
+        tree["right"][up] = new
+
+# Find every item whose box touches box q. Returns a list of items.
+def aabb_tree_query(tree, q):
+    found   = []
+    root    = tree["root"]
+    if root == -1:
+        return found
+    boxes   = tree["box"]
+    left    = tree["left"]
+    right   = tree["right"]
+    item    = tree["item"]
+    (qx1, qy1, qz1, qx2, qy2, qz2) = q
+    todo    = [root]
+    while todo:
+        node = todo.pop()
+        b = boxes[node]
+        if (b[0] > qx2 or b[3] < qx1 or b[1] > qy2 or b[4] < qy1
+                or b[2] > qz2 or b[5] < qz1):
+            continue
+        if left[node] == -1:
+            found.append(item[node])
+        else:
+            todo.append(left[node])
+            todo.append(right[node])
+    return found
+
+# How deep the tree is: 0 for a tree with one item, -1 for an empty one.
+def aabb_tree_height(tree):
+    if tree["root"] == -1:
+        return -1
+    return tree["height"][tree["root"]]
+
+# Check that the tree is put together properly: every node's box holds its
+# children, the heights are right and every item can be found. Raises
+# AssertionError if not. This is slow; it is for testing.
+def aabb_tree_check(tree):
+    root = tree["root"]
+    if root == -1:
+        assert not tree["leaf"], "empty tree has items"
+        return
+    assert tree["parent"][root] == -1, "root has a parent"
+    leaves  = 0
+    todo    = [root]
+    while todo:
+        node    = todo.pop()
+        left    = tree["left"][node]
+        right   = tree["right"][node]
+        if left == -1:
+            assert right == -1, "leaf %d has one child" % node
+            assert tree["height"][node] == 0, "leaf %d height" % node
+            assert tree["leaf"][tree["item"][node]] == node, \
+                "leaf %d not in leaf table" % node
+            leaves += 1
+            continue
+        for child in (left, right):
+            assert tree["parent"][child] == node, "bad parent of %d" % child
+        assert tree["box"][node] == aabb_union(tree["box"][left],
+            tree["box"][right]), "box of %d doesn't fit" % node
+        assert tree["height"][node] == 1 + max(tree["height"][left],
+            tree["height"][right]), "height of %d is wrong" % node
+        todo.append(left)
+        todo.append(right)
+    assert leaves == len(tree["leaf"]), "items missing from tree"
@@ -0,0 +1,373 @@
+# batch.py
+# Run the physics for lots of players at once, using NumPy.
+#
+# player_physics in physics.py moves the one Player. This does the same
+# thing for a whole crowd of players (agents) in one go: instead of a dict
+# per player we keep one NumPy array per field, with one row per agent, and
+# every step works on all the rows together. Each agent ends up exactly
+# where player_physics would have put it.
+#
+# The agents all live in the same World as the Player, but each has its
+# own camera angle, so they can all walk in different directions.
+
+from math           import radians, sin, cos, pi
+import numpy as np
+
+from physics        import World, Speed, FLOOR_STAND, PLAYER_RADIUS, \
+                           PLAYER_HEIGHT, world_floor_index, \
+                           world_wall_index, wall_collide
+from level          import level_columns
+from vecs           import vecs_scale, vecs_add_scaled
+
+# Floors
+
+# The grid from floorindex.py, turned into arrays. We build this from the
+# index physics.py keeps over World.floors and rebuild it whenever that
+# index is rebuilt.
+Grid = {}
+
+# Cell keys are made into single numbers as cx*KEY_SCALE + cy, so they can
+# be found with np.searchsorted.
+KEY_SCALE = 1 << 32
+
+# Turn a list of index entries (-z, n, x1, y1, x2, y2) into a dict of arrays.
+def grid_entries(entries):
+    a = np.array([e[:6] for e in entries], dtype=np.float64).reshape(-1, 6)
+    return {
+        "negz": a[:,0],
+        "n":    a[:,1].astype(np.int64),
+        "x1":   a[:,2],
+        "y1":   a[:,3],
+        "x2":   a[:,4],
+        "y2":   a[:,5],
+    }
+
+# Build the arrays for an index. The cells are laid end to end in one set
+# of entry arrays; cell i has entries start[i] to start[i]+length[i].
+def grid_build(index):
+    keys    = sorted(index["cells"])
+    flat    = []
+    start   = []
+    length  = []
+    for key in keys:
+        (entries, negz) = index["cells"][key]
+        start.append(len(flat))
+        length.append(len(entries))
+        flat.extend(entries)
+
+    Grid["index"]   = index
+    Grid["cell"]    = index["cell"]
+    Grid["keys"]    = np.array([cx*KEY_SCALE + cy for (cx, cy) in keys],
+                        dtype=np.int64)
+    Grid["start"]   = np.array(start, dtype=np.int64)
+    Grid["length"]  = np.array(length, dtype=np.int64)
+    Grid["entries"] = grid_entries(flat)
+    Grid["big"]     = grid_entries(index["big"][0])
+    # The height of each floor and whether it wins, with an extra entry on
+    # the end so that floor number -1 (no floor) can be looked up too.
+    (coords, colour, win) = level_columns(index["floors"])
+    Grid["floor_z"]     = np.append(coords[:,4].astype(np.float64), 0)
+    Grid["floor_win"]   = np.append(win != 0, False)
+
+# Make sure Grid matches World.floors.
+def grid_update():
+    index = world_floor_index()
+    if Grid.get("index") is not index:
+        grid_build(index)
+
+# Find the floor below each of a set of positions. pos is an (N, 3) array.
+# Returns an array of N floor numbers (indexes into World.floors), with
+# -1 where there is no floor. This gives the same floors as
+# find_floor_below.
+def batch_find_floor(pos):
+    grid_update()
+
+    x   = pos[:,0]
+    y   = pos[:,1]
+    z   = pos[:,2]
+    n   = len(pos)
+
+    found   = np.full(n, -1, dtype=np.int64)
+    found_k = np.full(n, np.inf)
+
+    # Find which cell each position is in. The positions in cells with no
+    # floors get a length of 0.
+    cell    = Grid["cell"]
+    q       = (np.floor(x/cell).astype(np.int64)*KEY_SCALE
+                + np.floor(y/cell).astype(np.int64))
+    keys    = Grid["keys"]
+    length  = np.zeros(n, dtype=np.int64)
+    start   = np.zeros(n, dtype=np.int64)
+    if len(keys):
+        i       = np.minimum(np.searchsorted(keys, q), len(keys) - 1)
+        hit     = keys[i] == q
+        start   = np.where(hit, Grid["start"][i], 0)
+        length  = np.where(hit, Grid["length"][i], 0)
+
+    # The entries in each cell are sorted highest first, so step through
+    # them together and take the first one which contains each position.
+    e = Grid["entries"]
+    todo = np.nonzero(length)[0]
+    k = 0
+    while len(todo):
+        j = start[todo] + k
+        ok = ((-e["negz"][j] <= z[todo])
+            & (x[todo] >= e["x1"][j]) & (y[todo] >= e["y1"][j])
+            & (x[todo] <= e["x2"][j]) & (y[todo] <= e["y2"][j]))
+        done = todo[ok]
+        found[done]     = e["n"][j[ok]]
+        found_k[done]   = e["negz"][j[ok]]
+        k += 1
+        todo = todo[~ok & (length[todo] > k)]
+
+    # Then check the big floors, which aren't in the cells. A big floor
+    # wins if it is higher, or the same height but earlier in the list.
+    b = Grid["big"]
+    if len(b["n"]):
+        ok = ((-b["negz"][None,:] <= z[:,None])
+            & (x[:,None] >= b["x1"][None,:]) & (y[:,None] >= b["y1"][None,:])
+            & (x[:,None] <= b["x2"][None,:]) & (y[:,None] <= b["y2"][None,:]))
+        first   = np.argmax(ok, axis=1)
+        has     = ok[np.arange(n), first]
+        bk      = b["negz"][first]
+        bn      = b["n"][first]
+        better  = has & ((found < 0) | (bk < found_k)
+                    | ((bk == found_k) & (bn < found)))
+        found[better] = bn[better]
+
+    return found
+
+# Find the first floor each of a set of points goes down through the top
+# of, moving in a straight line from a to b (both (N, 3) arrays, with every
+# b lower than its a). Returns (found, x, y): the floor numbers, with -1
+# where there is none, and where each point was when it hit the floor.
+# This gives the same answers as floor_index_sweep.
+def batch_sweep_floor(a, b):
+    grid_update()
+
+    n       = len(a)
+    found   = np.full(n, -1, dtype=np.int64)
+    found_k = np.full(n, np.inf)
+    hx      = np.zeros(n)
+    hy      = np.zeros(n)
+
+    # The cells each line passes over. Most lines only cross one or two, so
+    # we go through the cells as offsets from the lowest one, all the lines
+    # together, until the widest line is done.
+    cell    = Grid["cell"]
+    cx1     = np.floor(np.minimum(a[:,0], b[:,0])/cell).astype(np.int64)
+    cy1     = np.floor(np.minimum(a[:,1], b[:,1])/cell).astype(np.int64)
+    cx2     = np.floor(np.maximum(a[:,0], b[:,0])/cell).astype(np.int64)
+    cy2     = np.floor(np.maximum(a[:,1], b[:,1])/cell).astype(np.int64)
+    keys    = Grid["keys"]
+    if len(keys) and n:
+        for dx in range(int((cx2 - cx1).max()) + 1):
+            for dy in range(int((cy2 - cy1).max()) + 1):
+                rows    = np.nonzero((cx1 + dx <= cx2) & (cy1 + dy <= cy2))[0]
+                q       = (cx1[rows] + dx)*KEY_SCALE + cy1[rows] + dy
+                i       = np.minimum(np.searchsorted(keys, q), len(keys) - 1)
+                hit     = keys[i] == q
+                rows    = rows[hit]
+                batch_sweep_cells(a, b, rows, Grid["start"][i[hit]],
+                    Grid["length"][i[hit]], Grid["entries"],
+                    found, found_k, hx, hy)
+
+    # Then the big floors, which are all in one list.
+    big = Grid["big"]
+    if len(big["n"]) and n:
+        batch_sweep_cells(a, b, np.arange(n), np.zeros(n, dtype=np.int64),
+            np.full(n, len(big["n"]), dtype=np.int64), big,
+            found, found_k, hx, hy)
+
+    return (found, hx, hy)
+
+# Search one cell for each of the lines in rows, like
+# floor_index_sweep_search: the cell for each has entries start to
+# start+length in e. Where a floor is found which is higher (or the same
+# height and earlier in the list) than the one in found, it replaces it.
+def batch_sweep_cells(a, b, rows, start, length, e, found, found_k, hx, hy):
+    (x0, y0, z0) = (a[rows,0], a[rows,1], a[rows,2])
+    (x1, y1, z1) = (b[rows,0], b[rows,1], b[rows,2])
+    todo    = np.nonzero(length)[0]
+    k       = 0
+    while len(todo):
+        j   = start[todo] + k
+        top = -e["negz"][j] + FLOOR_STAND
+        # Floors above where we started don't count, and once we get to one
+        # below where we end up, the rest are lower still.
+        above   = top > z0[todo]
+        below   = ~above & (top <= z1[todo])
+        t   = (z0[todo] - top) / (z0[todo] - z1[todo])
+        x   = x0[todo] + (x1[todo] - x0[todo])*t
+        y   = y0[todo] + (y1[todo] - y0[todo])*t
+        ok  = (~above & ~below
+            & (x >= e["x1"][j]) & (y >= e["y1"][j])
+            & (x <= e["x2"][j]) & (y <= e["y2"][j]))
+
+        r       = rows[todo[ok]]
+        en      = e["n"][j[ok]]
+        ek      = e["negz"][j[ok]]
+        better  = (found[r] < 0) | (ek < found_k[r]) \
+                    | ((ek == found_k[r]) & (en < found[r]))
+        r       = r[better]
+        found[r]    = en[better]
+        found_k[r]  = ek[better]
+        hx[r]       = x[ok][better]
+        hy[r]       = y[ok][better]
+
+        k += 1
+        todo = todo[~ok & ~below & (length[todo] > k)]
+
+# Walls
+
+# Stop agents going through walls, moving from a to b (both (N, 3)
+# arrays). b is changed to where they stop. Returns two arrays of True or
+# False: whether each agent was stopped along x and along y. Walls are
+# rare next to floors, so rather than doing this in NumPy we pick out the
+# agents which are anywhere near a wall and use wall_collide for each one,
+# which gives exactly the same answers as player_physics.
+def batch_wall_collide(a, b):
+    n       = len(a)
+    stop_x  = np.zeros(n, dtype=bool)
+    stop_y  = np.zeros(n, dtype=bool)
+    index   = world_wall_index()
+    if not index["count"] or not n:
+        return (stop_x, stop_y)
+
+    # The box around all the walls is the box at the top of the tree.
+    tree    = index["tree"]
+    (x1, y1, z1, x2, y2, z2) = tree["box"][tree["root"]]
+    r       = PLAYER_RADIUS
+    near    = ((np.minimum(a[:,0], b[:,0]) - r <= x2)
+             & (np.maximum(a[:,0], b[:,0]) + r >= x1)
+             & (np.minimum(a[:,1], b[:,1]) - r <= y2)
+             & (np.maximum(a[:,1], b[:,1]) + r >= y1)
+             & (np.minimum(a[:,2], b[:,2]) <= z2)
+             & (np.maximum(a[:,2], b[:,2]) + PLAYER_HEIGHT >= z1))
+    for i in np.nonzero(near)[0]:
+        to = b[i].tolist()
+        (stop_x[i], stop_y[i]) = wall_collide(a[i].tolist(), to)
+        b[i] = to
+    return (stop_x, stop_y)
+
+# Agents
+
+# Make a set of n agents, all standing at pos (a 3-element list, or an
+# (n, 3) array), looking along angle 0. The agents are a dict of arrays,
+# with one row per agent:
+#   pos         position, (n, 3)
+#   vel         velocity, (n, 3)
+#   walk        walk speed, like Player.walk
+#   strafe      strafe speed, like Player.strafe
+#   jump        True if the agent is trying to jump
+#   walk_vec    the direction the agent walks, like Camera.walk_vec
+#   strafe_vec  the direction the agent strafes
+#   alive       False once the agent has fallen below World.doom_z or won
+#   won         True once the agent has stood on a winning platform
+def agents_new(n, pos=(-1, 0, 0)):
+    agents = {
+        "pos":          np.empty((n, 3)),
+        "vel":          np.zeros((n, 3)),
+        "walk":         np.zeros(n),
+        "strafe":       np.zeros(n),
+        "jump":         np.zeros(n, dtype=bool),
+        "walk_vec":     np.zeros((n, 3)),
+        "strafe_vec":   np.zeros((n, 3)),
+        "alive":        np.ones(n, dtype=bool),
+        "won":          np.zeros(n, dtype=bool),
+    }
+    agents["pos"][:] = pos
+    agents_look(agents, np.zeros(n))
+    return agents
+
+# Set the horizontal camera angle (in degrees) of each agent. This works
+# out the walk and strafe vectors the same way as
+# camera_update_movement_vectors. We use math.sin and math.cos rather than
+# NumPy's so we get exactly the same numbers as the Camera does.
+def agents_look(agents, angles):
+    for i, a in enumerate(angles):
+        walk    = radians(a)
+        strafe  = walk - pi/2
+        agents["walk_vec"][i]   = (cos(walk), sin(walk), 0)
+        agents["strafe_vec"][i] = (cos(strafe), sin(strafe), 0)
+
+# Set how the agents are trying to move, like player_walk, player_strafe
+# and player_jump. Each argument can be one value for all the agents, or an
+# array with one value per agent.
+def agents_walk(agents, to):
+    agents["walk"][:] = to * Speed["walk"]
+
+def agents_strafe(agents, to):
+    agents["strafe"][:] = to * Speed["walk"]
+
+def agents_jump(agents, to):
+    agents["jump"][:] = to
+
+# Run one tick of physics for all the agents which are still alive. This
+# does for every agent what player_physics does for the Player.
+def agents_physics(agents):
+    alive   = np.nonzero(agents["alive"])[0]
+    pos     = agents["pos"][alive]
+    vel     = agents["vel"][alive]
+
+    # Find the floor below each agent, and whether it is standing on it.
+    floor   = batch_find_floor(pos)
+    has     = floor >= 0
+    floor_z = np.where(has, Grid["floor_z"][floor] + FLOOR_STAND, -np.inf)
+    falling = ~(has & (pos[:,2] <= floor_z))
+
+    # Agents standing on a winning platform have won, and stop there.
+    won     = ~falling & Grid["floor_win"][floor]
+    if won.any():
+        agents["won"][alive[won]]   = True
+        agents["alive"][alive[won]] = False
+        keep    = ~won
+        alive   = alive[keep]
+        pos     = pos[keep]
+        vel     = vel[keep]
+        has     = has[keep]
+        floor_z = floor_z[keep]
+        falling = falling[keep]
+
+    # Agents in the air fall faster.
+    vel[falling,2] -= Speed["fall"]
+
+    # Agents on the ground walk, strafe and maybe jump.
+    ground  = alive[~falling]
+    gvel    = vecs_scale(agents["walk_vec"][ground], agents["walk"][ground])
+    vecs_add_scaled(gvel, agents["strafe_vec"][ground],
+        agents["strafe"][ground], out=gvel)
+    jump    = agents["jump"][ground]
+    gvel[jump,2] = Speed["jump"]
+    agents["jump"][ground[jump]] = False
+    vel[~falling] = gvel
+
+    # Move. Like player_physics, agents which aren't moving are left
+    # exactly where they are, and walls stop agents moving sideways.
+    # Agents coming down land on the first floor they go through the top
+    # of, where they hit it, and agents on the ground step up onto the
+    # floor they are just below.
+    moved   = np.any(vel != 0, axis=1)
+    new     = pos + vel
+    (stop_x, stop_y) = batch_wall_collide(pos, new)
+    vel[stop_x,0] = 0
+    vel[stop_y,1] = 0
+    # A tiny downwards speed can round away to nothing, so check the new
+    # position really is lower.
+    down    = np.nonzero((vel[:,2] < 0) & (new[:,2] < pos[:,2]))[0]
+    (hit, hx, hy) = batch_sweep_floor(pos[down], new[down])
+    ok      = hit >= 0
+    land    = down[ok]
+    new[land,0] = hx[ok]
+    new[land,1] = hy[ok]
+    new[land,2] = Grid["floor_z"][hit[ok]] + FLOOR_STAND
+    step    = moved & (vel[:,2] >= 0) & has & (new[:,2] < floor_z)
+    new[step,2] = floor_z[step]
+    pos     = new
+
+    agents["pos"][alive] = pos
+    agents["vel"][alive] = vel
+
+    # Agents which fall too far die, and stop moving.
+    dead = moved & (pos[:,2] < World.doom_z)
+    agents["alive"][alive[dead]] = False
@@ -0,0 +1,624 @@
+# bench.py
+# Benchmarks for the maze game.
+#
+# Run this as 'python bench.py'. It prints how long things take so we can
+# see whether changes make them faster or slower. The benchmarks are:
+#   find_floor  find_floor_below, with and without the index
+#   batch       the NumPy batch physics, for different numbers of agents
+#   physics     player_physics ticks per second on generated levels
+#   walls       finding walls near the Player, with and without the AABB
+#               tree, and player_physics ticks per second among the walls
+#   tick        how long one physics tick takes, and how many new vectors
+#               it makes
+#   world       how long init_world takes to build the world for drawing,
+#               and how many OpenGL calls it makes (see glcount.py)
+#   frame       how long it takes to draw a frame, and how many OpenGL
+#               calls, draws, vertices and state changes it takes
+#   capture     how long it takes to draw a frame and get its pixels back,
+#               with glReadPixels and with pixel buffers (see capture.py)
+#   startup     how long a new Python takes to import the physics, and to
+#               import maze.py and draw the first frame, in debug and
+#               release mode (see glconfig.py)
+# The last four need OpenGL. They draw into an offscreen framebuffer (see
+# offscreen.py), so they work without a display; if we can't get an
+# OpenGL context they are skipped.
+#
+# Options:
+#   --only NAME     run only this benchmark (can be given more than once)
+#   --quick         use smaller sizes, for a quick check
+#   --json FILE     save the results to FILE
+#   --compare FILE  compare the results with ones saved earlier
+#
+# Saved results have the times for every row of every benchmark, so saving
+# them for each version and comparing shows when something got slower.
+
+import os
+import sys
+import json
+import random
+import platform
+import argparse
+import subprocess
+from contextlib     import redirect_stdout
+from time           import perf_counter, strftime
+
+from floorindex     import find_floor_linear, floor_index_build, \
+                           floor_index_find
+from aabbtree       import aabb_tree_build, aabb_tree_query, \
+                           aabb_tree_height, aabb_overlap
+
+# Set by main: True to use smaller sizes.
+Options = {"quick": False}
+
+# Pick the sizes to run a benchmark with.
+def sizes(full, quick):
+    return quick if Options["quick"] else full
+
+# Make a list of n random floors, in the same format as World.floors.
+# The floors are scattered over a square which grows with n, so the
+# number of floors in any one place stays about the same.
+def random_floors(n, seed=1):
+    rng     = random.Random(seed)
+    side    = (n ** 0.5) * 8
+    floors  = []
+    for i in range(n):
+        x = rng.uniform(-side/2, side/2)
+        y = rng.uniform(-side/2, side/2)
+        w = rng.uniform(1, 10)
+        h = rng.uniform(1, 10)
+        z = rng.randint(-5, 20)
+        floors.append({
+            "coords":   (x, y, x + w, y + h, z),
+            "colour":   (0.5, 0.5, 0.5),
+            "win":      False,
+        })
+    return floors
+
+# Make a list of n random points over the same area as random_floors.
+def random_points(n, count, seed=2):
+    rng     = random.Random(seed)
+    side    = (n ** 0.5) * 8
+    return [[rng.uniform(-side/2, side/2),
+             rng.uniform(-side/2, side/2),
+             rng.uniform(-5, 25)]
+            for i in range(count)]
+
+# Call find(v) for every point and return the average time per call,
+# in microseconds.
+def time_lookups(find, points):
+    start = perf_counter()
+    for v in points:
+        find(v)
+    return (perf_counter() - start) / len(points) * 1e6
+
+# Work out the median and 99th percentile of a list of times.
+def percentiles(times):
+    times = sorted(times)
+    return (times[len(times)//2], times[min(len(times) - 1,
+                                            int(len(times) * 0.99))])
+
+# Compare find_floor_below with and without the index, for different
+# numbers of floors. The linear search gets slow with lots of floors so
+# we give it fewer points to look up.
+def bench_find_floor():
+    rows = []
+    for n in sizes((10, 100, 1000, 10000, 100000), (10, 1000)):
+        floors  = random_floors(n)
+        points  = random_points(n, 20000)
+
+        start   = perf_counter()
+        index   = floor_index_build(floors)
+        build   = (perf_counter() - start) * 1000
+
+        few     = points[:max(20, 200000 // n)]
+        linear  = time_lookups(lambda v: find_floor_linear(floors, v), few)
+        indexed = time_lookups(lambda v: floor_index_find(index, v), points)
+
+        # The index must give exactly the same answers.
+        for v in few:
+            if floor_index_find(index, v) is not find_floor_linear(floors, v):
+                raise AssertionError("index disagrees at %r" % (v,))
+
+        rows.append({"floors": n, "build_ms": build,
+            "linear_us": linear, "index_us": indexed})
+    return rows
+
+# Time the batch physics for different numbers of agents, walking around
+# on 10000 random floors.
+def bench_batch():
+    import numpy as np
+    import physics
+    from batch import agents_new, agents_walk, agents_look, agents_physics
+
+    physics.World.floors = random_floors(10000)
+
+    rows = []
+    for n in sizes((100, 1000, 10000, 100000), (100, 10000)):
+        rng     = np.random.default_rng(1)
+        side    = (10000 ** 0.5) * 8
+        pos     = np.column_stack((rng.uniform(-side/2, side/2, n),
+                                   rng.uniform(-side/2, side/2, n),
+                                   np.full(n, 20.0)))
+        agents  = agents_new(n, pos)
+        agents_look(agents, rng.uniform(0, 360, n))
+        agents_walk(agents, 1)
+
+        # Run one tick first, so building the grid isn't counted.
+        agents_physics(agents)
+
+        ticks   = 50
+        start   = perf_counter()
+        for i in range(ticks):
+            agents_physics(agents)
+        ms      = (perf_counter() - start) / ticks * 1000
+
+        rows.append({"agents": n, "ms_per_tick": ms})
+    return rows
+
+# A script for headless.run which keeps the Player busy: walk, turning
+# and jumping now and then.
+def busy_script(ticks):
+    script = [(0, ["player_walk", 1])]
+    for t in range(0, ticks, 50):
+        script.append((t, ["camera_look_leftright", 90]))
+        script.append((t + 20, ["player_jump", True]))
+    return script
+
+# Time player_physics on generated mazes of different sizes. The Player
+# walks round in squares, jumping. If it falls off the maze we put it back
+# at the start and carry on.
+def bench_physics():
+    import physics
+    import headless
+    from mazegen import gen_level
+
+    rows = []
+    for n in sizes((100, 10000, 100000), (100, 10000)):
+        physics.World.load(gen_level("maze", n))
+        physics.world_floor_index()
+
+        ticks   = 5000
+        script  = busy_script(ticks)
+        with open(os.devnull, "w") as null, redirect_stdout(null):
+            done    = 0
+            start   = perf_counter()
+            while done < ticks:
+                physics.player_reset()
+                done += headless.run(ticks - done, script)
+            elapsed = perf_counter() - start
+
+        rows.append({"floors": n, "ticks": done,
+            "ticks_per_sec": done / elapsed})
+    return rows
+
+# Make a list of n random walls, in the same format as World.walls,
+# scattered over the same area as random_floors. Each wall runs along x or
+# along y, and is tall enough to stop the Player.
+def random_walls(n, seed=3):
+    rng     = random.Random(seed)
+    side    = (n ** 0.5) * 8
+    walls   = []
+    for i in range(n):
+        x = rng.uniform(-side/2, side/2)
+        y = rng.uniform(-side/2, side/2)
+        l = rng.uniform(1, 10)
+        if rng.random() < 0.5:
+            coords = (x, y, -1, x + l, y + 0.2, 2)
+        else:
+            coords = (x, y, -1, x + 0.2, y + l, 2)
+        walls.append({"coords": coords, "colour": (0.6, 0.6, 0.6)})
+    return walls
+
+# Find the walls near each of a list of points, with and without the
+# tree, for different numbers of walls, and time player_physics walking
+# around among them on one big floor. The boxes we look for are about the
+# size of the Player moving for a tick.
+def bench_walls():
+    import physics
+    import headless
+
+    rows = []
+    for n in sizes((100, 1000, 10000, 50000), (100, 10000)):
+        walls   = random_walls(n)
+        boxes   = [w["coords"] for w in walls]
+        queries = [(x - 0.4, y - 0.4, z, x + 0.4, y + 0.4, z + 1)
+                    for (x, y, z) in random_points(n, 20000)]
+
+        start   = perf_counter()
+        tree    = aabb_tree_build(boxes)
+        build   = (perf_counter() - start) * 1000
+
+        few     = queries[:max(20, 200000 // n)]
+        linear  = time_lookups(lambda q: [i for (i, b) in enumerate(boxes)
+                                          if aabb_overlap(b, q)], few)
+        indexed = time_lookups(lambda q: aabb_tree_query(tree, q), queries)
+
+        # The tree must find exactly the same walls.
+        for q in few:
+            if (sorted(aabb_tree_query(tree, q))
+                    != [i for (i, b) in enumerate(boxes)
+                        if aabb_overlap(b, q)]):
+                raise AssertionError("tree disagrees at %r" % (q,))
+
+        side = (n ** 0.5) * 8
+        physics.World.load({
+            "floors":   [{"coords": (-side/2, -side/2, side/2, side/2, -1),
+                          "colour": (0.5, 0.5, 0.5), "win": False}],
+            "walls":    walls,
+            "doom_z":   -20,
+        })
+        physics.world_wall_index()
+
+        ticks   = 5000
+        script  = busy_script(ticks)
+        with open(os.devnull, "w") as null, redirect_stdout(null):
+            physics.player_reset()
+            start   = perf_counter()
+            done    = headless.run(ticks, script)
+            elapsed = perf_counter() - start
+
+        rows.append({"walls": n, "build_ms": build, "linear_us": linear,
+            "tree_us": indexed, "height": aabb_tree_height(tree),
+            "ticks_per_sec": done / elapsed})
+    return rows
+
+# Count how many new vectors are made while running f: calls to the vec_
+# functions in physics.py, which each make a new list, and new Vec3s. We
+# watch every function call with sys.setprofile, which is slow, so only
+# run a few ticks like this.
+def count_vectors(f):
+    import physics
+    from vec3 import Vec3
+    makers = {physics.vec_add.__code__, physics.vec_mul.__code__,
+              physics.vec_unit.__code__, physics.vec_cross.__code__,
+              Vec3.__init__.__code__}
+    count = [0]
+    def profile(frame, event, arg):
+        if event == "call" and frame.f_code in makers:
+            count[0] += 1
+    sys.setprofile(profile)
+    try:
+        f()
+    finally:
+        sys.setprofile(None)
+    return count[0]
+
+# Time physics_tick on its own, with the Player standing still, walking,
+# and walking, strafing and jumping, on one big floor. We take the
+# fastest of a few goes, as other programs running can only make it
+# slower. We also count how many new vectors each tick makes.
+def bench_tick():
+    import physics
+
+    physics.World.load({
+        "floors":   [{"coords": (-1000, -1000, 1000, 1000, -1),
+                      "colour": (0.5, 0.5, 0.5), "win": False}],
+        "walls":    [],
+        "doom_z":   -20,
+    })
+    rows = []
+    for (name, moves) in (("stand", ()), ("walk", ("walk",)),
+                          ("jump", ("walk", "strafe", "jump"))):
+        ticks = sizes(20000, 2000)
+
+        def run(ticks):
+            physics.player_reset()
+            for i in range(ticks):
+                if "walk" in moves:
+                    physics.player_walk(1)
+                if "strafe" in moves:
+                    physics.player_strafe(1)
+                if "jump" in moves and i % 50 == 0:
+                    physics.player_jump(True)
+                if i % 500 == 0:
+                    # Keep the Player near the middle of the floor.
+                    physics.Player.pos[0] = 0
+                    physics.Player.pos[1] = 0
+                physics.physics_tick()
+
+        with open(os.devnull, "w") as null, redirect_stdout(null):
+            best = None
+            for go in range(5):
+                start   = perf_counter()
+                run(ticks)
+                elapsed = perf_counter() - start
+                best    = elapsed if best is None else min(best, elapsed)
+            made = count_vectors(lambda: run(1000))
+
+        rows.append({"moves": name, "us_per_tick": best / ticks * 1e6,
+            "vectors_per_tick": made / 1000})
+    return rows
+
+# Get an OpenGL context to draw into, if we haven't already. Returns the
+# maze module, set up to draw, or raises an exception if we can't.
+def gl_setup():
+    import offscreen
+    import maze
+
+    if "context" not in offscreen.Offscreen:
+        maze.Display.winsize = (640, 480)
+        offscreen.offscreen_init(maze.Display.winsize)
+        maze.init_opengl()
+    return maze
+
+# Build the world for drawing with the given renderer, and return how
+# long it took in milliseconds.
+def gl_build_world(maze, renderer):
+    from OpenGL.GL import glFinish, glDeleteLists
+
+    if "world" in maze.DL:
+        glDeleteLists(maze.DL.pop("world"), 1)
+    maze.Display.renderer = renderer
+    glFinish()
+    start = perf_counter()
+    maze.init_world()
+    glFinish()
+    return (perf_counter() - start) * 1000
+
+# Build the world and draw one frame while counting the OpenGL calls (see
+# glcount.py). Counting makes the calls slower, so this is done apart from
+# the timing. Returns the counts for building the world and for the frame.
+def gl_count(maze, renderer):
+    from glcount import GLCount, glcount_end_setup, glcount_end_frame, \
+                        glcount_uninstall
+
+    maze.init_gl_count()
+    try:
+        gl_build_world(maze, renderer)
+        glcount_end_setup()
+        maze.render()
+        glcount_end_frame()
+    finally:
+        glcount_uninstall()
+    return (GLCount["setup"], GLCount["last"])
+
+# The sizes of world and the renderers to use for the GL benchmarks.
+# The display list is slow to build so it doesn't get the biggest world.
+def gl_cases():
+    cases = []
+    for n in sizes((100, 1000, 10000, 100000), (100, 1000)):
+        for renderer in ("list", "vbo"):
+            if renderer == "list" and n > 10000:
+                continue
+            cases.append((n, renderer))
+    return cases
+
+# Time init_world for mazes of different sizes.
+def bench_world():
+    from mazegen import gen_level
+
+    maze = gl_setup()
+    rows = []
+    for (n, renderer) in gl_cases():
+        maze.World.load(gen_level("maze", n))
+        ms = gl_build_world(maze, renderer)
+        (setup, frame) = gl_count(maze, renderer)
+        rows.append({"floors": n, "renderer": renderer, "build_ms": ms,
+            "gl_calls": float(setup["calls"])})
+    return rows
+
+# Time drawing frames of mazes of different sizes, with the camera
+# turning round. We wait for each frame to finish drawing so we time the
+# whole frame, not just sending it to OpenGL.
+def bench_frame():
+    from mazegen import gen_level
+
+    # gl_setup must come before anything imports OpenGL.
+    maze = gl_setup()
+    from OpenGL.GL import glFinish
+    rows = []
+    for (n, renderer) in gl_cases():
+        maze.World.load(gen_level("maze", n))
+        gl_build_world(maze, renderer)
+        with open(os.devnull, "w") as null, redirect_stdout(null):
+            maze.player_reset()
+            maze.camera_look_updown(-20)
+
+        # Draw one frame first, so setting things up isn't counted.
+        maze.render()
+        glFinish()
+
+        frames  = 100
+        times   = []
+        for i in range(frames):
+            maze.Camera.angle[0] = i * 360 / frames
+            start = perf_counter()
+            maze.render()
+            glFinish()
+            times.append((perf_counter() - start) * 1000)
+
+        (p50, p99) = percentiles(times)
+        (setup, counts) = gl_count(maze, renderer)
+        rows.append({"floors": n, "renderer": renderer,
+            "mean_ms": sum(times) / frames, "p50_ms": p50, "p99_ms": p99,
+            "gl_calls": float(counts["calls"]),
+            "draws": float(counts["draws"]),
+            "vertices": float(counts["vertices"]),
+            "state": float(counts["state"] + counts["matrix"])})
+    return rows
+
+# Time drawing frames and getting their pixels back, waiting for each one
+# with glReadPixels, and through the ring of pixel buffers in capture.py.
+def bench_capture():
+    from mazegen import gen_level
+
+    maze = gl_setup()
+    import capture
+    from OpenGL.GL import glFinish, glReadPixels, GL_RGBA, GL_UNSIGNED_BYTE
+    (width, height) = maze.Display.winsize
+    maze.World.load(gen_level("maze", sizes(10000, 1000)))
+    gl_build_world(maze, "vbo" if maze.vbo else "list")
+    with open(os.devnull, "w") as null, redirect_stdout(null):
+        maze.player_reset()
+        maze.camera_look_updown(-20)
+
+    def read_sync():
+        return glReadPixels(0, 0, width, height, GL_RGBA, GL_UNSIGNED_BYTE)
+
+    rows = []
+    for (method, read) in (("none", lambda: None), ("readpixels", read_sync),
+                           ("pbo", capture.capture_read)):
+        capture.capture_init((width, height))
+        maze.render()
+        glFinish()
+        frames  = 100
+        start   = perf_counter()
+        for i in range(frames):
+            maze.Camera.angle[0] = i * 360 / frames
+            maze.render()
+            frame = read()
+            if frame is not None:
+                # Look at the pixels, as something saving them would.
+                frame[0]
+        list(capture.capture_flush())
+        glFinish()
+        ms = (perf_counter() - start) * 1000 / frames
+        capture.capture_quit()
+        rows.append({"read": method, "frame_ms": ms})
+    return rows
+
+# What bench_startup runs in a new Python. It prints how long importing
+# took and how long it then took to draw the first frame, in seconds.
+STARTUP_PHYSICS = """
+from time import perf_counter
+start = perf_counter()
+import physics
+print(perf_counter() - start, 0)
+"""
+STARTUP_FRAME = """
+from time import perf_counter
+start = perf_counter()
+import offscreen
+import maze
+from OpenGL.GL import glFinish
+imported = perf_counter()
+maze.Display.winsize = (640, 480)
+offscreen.offscreen_init(maze.Display.winsize)
+maze.init_opengl()
+maze.init_world()
+maze.init_player()
+maze.camera_init()
+maze.render()
+glFinish()
+print(imported - start, perf_counter() - imported)
+"""
+
+# Time starting a new Python and importing the physics, or importing
+# maze.py and drawing the first frame, in debug mode and in release mode.
+# Release mode is turned on with MAZE_RELEASE rather than python -O, as -O
+# has its own compiled files, which may not have been made. process_ms is
+# the whole time the new Python took, including starting up and shutting
+# down. We take the fastest of a few runs.
+def bench_startup():
+    here    = os.path.dirname(os.path.abspath(__file__))
+    env     = dict(os.environ, SDL_VIDEODRIVER="dummy")
+    rows    = []
+    for (what, code) in (("physics", STARTUP_PHYSICS),
+                         ("frame", STARTUP_FRAME)):
+        for (mode, release) in (("debug", "0"), ("release", "1")):
+            best = None
+            for i in range(sizes(5, 2)):
+                start   = perf_counter()
+                output  = subprocess.run([sys.executable, "-c", code],
+                    cwd=here, env=dict(env, MAZE_RELEASE=release),
+                    check=True, capture_output=True, text=True).stdout
+                process = perf_counter() - start
+                (imported, drawn) = map(float, output.split()[-2:])
+                if best is None or process < best[2]:
+                    best = (imported, drawn, process)
+            rows.append({"what": what, "mode": mode,
+                "import_ms": best[0] * 1000, "first_frame_ms": best[1] * 1000,
+                "process_ms": best[2] * 1000})
+    return rows
+
+BENCHMARKS = {
+    "find_floor":   bench_find_floor,
+    "batch":        bench_batch,
+    "physics":      bench_physics,
+    "walls":        bench_walls,
+    "tick":         bench_tick,
+    "world":        bench_world,
+    "frame":        bench_frame,
+    "capture":      bench_capture,
+    "startup":      bench_startup,
+}
+
+# Print a list of result rows as a table.
+def print_rows(rows):
+    if not rows:
+        return
+    keys = list(rows[0])
+    print(" ".join("%14s" % k for k in keys))
+    for row in rows:
+        print(" ".join("%14.2f" % row[k] if isinstance(row[k], float)
+            else "%14s" % (row[k],) for k in keys))
+
+# The columns of a row which say what was measured, rather than results.
+# Rows with the same values for these are compared with each other.
+def row_key(row):
+    return tuple((k, v) for (k, v) in row.items()
+        if not isinstance(v, float))
+
+# Print how the results have changed since an earlier run. Times (things
+# ending in _ms or _us) and counts of OpenGL calls should go down; rates
+# (per_sec) should go up.
+def compare(old, new):
+    print("Compared with %s:" % old.get("date", "earlier results"))
+    for (name, rows) in new["results"].items():
+        if not isinstance(rows, list):
+            continue
+        before = {row_key(r): r for r in old["results"].get(name, [])
+                    if isinstance(old["results"].get(name), list)}
+        for row in rows:
+            prev = before.get(row_key(row))
+            if not prev:
+                continue
+            for (k, v) in row.items():
+                if not isinstance(v, float) or not prev.get(k):
+                    continue
+                change = (v - prev[k]) / prev[k] * 100
+                print("  %-10s %-30s %-14s %8.2f -> %8.2f (%+.0f%%)"
+                    % (name, ", ".join("%s=%s" % kv for kv in row_key(row)),
+                       k, prev[k], v, change))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the maze game.")
+    parser.add_argument("--only", action="append", choices=BENCHMARKS,
+        help="run only this benchmark")
+    parser.add_argument("--quick", action="store_true",
+        help="use smaller sizes")
+    parser.add_argument("--json", help="save the results to this file")
+    parser.add_argument("--compare", help="compare with results in this file")
+    args = parser.parse_args(argv)
+
+    Options["quick"] = args.quick
+    results = {
+        "date":     strftime("%Y-%m-%d %H:%M:%S"),
+        "python":   platform.python_version(),
+        "machine":  platform.machine(),
+        "quick":    args.quick,
+        "results":  {},
+    }
+
+    for name in args.only or BENCHMARKS:
+        print("==", name)
+        try:
+            rows = BENCHMARKS[name]()
+        except Exception as e:
+            # The OpenGL benchmarks can't run everywhere; note why and go
+            # on with the rest.
+            print("skipped:", e)
+            results["results"][name] = "skipped: %s" % e
+            continue
+        print_rows(rows)
+        results["results"][name] = rows
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+# bot.py
+# A bot which plays the game by following the reachability graph.
+#
+# Every tick the bot looks at where the Player is. If it is standing on a
+# floor, it finds the fewest jumps from there to a winning floor (see
+# reach.py), turns to face the next floor on the way and walks towards
+# it. Before each step it works out where a jump from there would come
+# down, with the same sums player_physics does, and jumps as soon as that
+# is on the next floor. At the edge of a floor it walks off if that lands
+# on the next floor. If neither gets it there, it finds another way which
+# doesn't use that jump, and only jumps and hopes if there isn't one. If
+# it lands somewhere it didn't mean to, it works out a new way from there.
+#
+# The bot can't stand exactly on the edge of a floor, and aims to land
+# BOT_MARGIN in from the edges, so it plans with jumps which still work
+# from and to there (see reach_edge), even if that means more jumps.
+#
+# The bot presses keys by running bindings, the same as the keyboard and
+# headless.py scripts do, so it can't do anything a player couldn't. It
+# walks and strafes at once, because going diagonally is fastest, and
+# that is what reach.py assumes.
+#
+# Use it as the control function for headless.run:
+#   bot_start()
+#   headless.run(ticks, control=bot_control)
+#
+# Run 'python bot.py [COUNT [SEEDS]]' to check that the bot wins every
+# kind of level mazegen.py makes, with COUNT floors (60 by default) and
+# seeds 1 to SEEDS (3 by default). sweep.py uses the bot to try Speed
+# settings, so if the bot loses levels it could have won, a sweep tells
+# us about the bot rather than the settings.
+
+import os
+import sys
+from contextlib     import redirect_stdout
+from math           import atan2, degrees, hypot, sqrt
+
+from physics        import Player, Camera, Speed, World, FLOOR_STAND, \
+                           run_binding
+from floorindex     import floor_coords
+from reach          import reach_graph, reach_floor_at, reach_path_to_win
+
+# How far inside the next floor to aim for, so we don't land on the edge.
+BOT_MARGIN = 0.5
+
+# What the bot is doing:
+#   path        the floors it is going to land on, or None
+#   coords      the coords of every floor, from floor_coords
+#   floor       the floor it is on
+#   target      the floor it is going to next
+#   launch      True once it has set off for the next floor
+#   avoid       the jumps, as (from, to) floor numbers, which it has found
+#               it can't make, so it doesn't plan to use them again
+Bot = {}
+
+# Get ready to play a new game.
+def bot_start():
+    Bot["path"]     = None
+    Bot["coords"]   = floor_coords(World.floors)
+    Bot["floor"]    = None
+    Bot["target"]   = None
+    Bot["launch"]   = False
+    Bot["avoid"]    = set()
+
+# Find the point on floor coords c closest to (x, y), but at least
+# BOT_MARGIN in from the edges where the floor is big enough.
+def bot_aim(c, x, y):
+    (x1, y1, x2, y2, z) = c
+    mx = min(BOT_MARGIN, (x2 - x1) / 2)
+    my = min(BOT_MARGIN, (y2 - y1) / 2)
+    return (min(max(x, x1 + mx), x2 - mx), min(max(y, y1 + my), y2 - my))
+
+# Is (x, y) on floor coords c?
+def bot_inside(c, x, y):
+    return c[0] <= x <= c[2] and c[1] <= y <= c[3]
+
+# Would moving from pos along (dx, dy) each tick, starting with upwards
+# speed vz (Speed["jump"] for a jump, 0 for walking off an edge), come down
+# on floor coords c? This ignores any other floors in the way.
+def bot_lands(pos, dx, dy, vz, c):
+    top = c[4] + FLOOR_STAND
+    (x, y, z) = (pos[0] + dx, pos[1] + dy, pos[2] + vz)
+    while (vz > 0 or z >= top) and z >= World.doom_z:
+        vz -= Speed["fall"]
+        if vz < 0 and z + vz < top <= z:
+            # player_physics lands us where we go down through the top of
+            # the floor, if that is on it.
+            t = (z - top) / -vz
+            return bot_inside(c, x + dx*t, y + dy*t)
+        (x, y, z) = (x + dx, y + dy, z + vz)
+    return False
+
+# Find the way from floor to a winning floor, without the jumps in avoid.
+# We plan with jumps which still work when we jump from and land
+# BOT_MARGIN in from the edges, as that is where we aim for, and only use
+# jumps which need more care if there is no other way.
+def bot_plan(floor, avoid):
+    path = reach_path_to_win(reach_graph(BOT_MARGIN), floor, avoid)
+    if path is None:
+        path = reach_path_to_win(reach_graph(), floor, avoid)
+    return path
+
+# Decide what to press this tick.
+def bot_control():
+    pos     = Player.pos
+    floor   = reach_floor_at(pos)
+    if floor is None:
+        return
+    coords  = Bot["coords"]
+    here    = coords[floor]
+    # We can only change direction or jump while standing on a floor.
+    if pos[2] > here[4] + FLOOR_STAND:
+        return
+
+    path = Bot["path"]
+    if path is None or floor not in path:
+        path = bot_plan(floor, Bot["avoid"])
+        Bot["path"] = path
+    if path is None or path[-1] == floor:
+        # Nowhere to go, or we are there already.
+        bot_stop()
+        return
+    target  = path[path.index(floor) + 1]
+    there   = coords[target]
+
+    # Aim for the nearest point on the next floor. If it touches this one
+    # and isn't higher, just walk onto it.
+    step    = Speed["walk"] * sqrt(2)
+    (ax, ay) = bot_aim(there, pos[0], pos[1])
+    (ux, uy) = bot_unit(ax - pos[0], ay - pos[1])
+    if (there[4] <= here[4] and there[0] <= here[2] and here[0] <= there[2]
+            and there[1] <= here[3] and here[1] <= there[3]):
+        bot_move(ux, uy, False)
+        return
+
+    # If a jump towards it from here would land on it, jump.
+    if bot_lands(pos, ux*step, uy*step, Speed["jump"], there):
+        bot_move(ux, uy, True)
+        return
+
+    # Otherwise walk to where we should jump from: as far back from the
+    # point we are aiming for as a jump goes, but still on this floor.
+    # Once we get there we set off towards the next floor, and keep going
+    # until we leave this one.
+    if (Bot["floor"], Bot["target"]) != (floor, target):
+        Bot["floor"]    = floor
+        Bot["target"]   = target
+        Bot["launch"]   = False
+    if not Bot["launch"]:
+        far = bot_jump_length(there[4] - here[4]) or 0
+        (tx, ty) = bot_aim(here, ax - ux*far, ay - uy*far)
+        if hypot(tx - pos[0], ty - pos[1]) > step:
+            bot_move(*bot_unit(tx - pos[0], ty - pos[1]), False)
+            return
+        Bot["launch"] = True
+
+    # Keep going until the next step takes us off this floor, and then
+    # walk off if that gets us there.
+    (nx, ny) = (pos[0] + ux*step, pos[1] + uy*step)
+    if (bot_inside(here, nx, ny) or bot_inside(there, nx, ny)
+            or bot_lands(pos, ux*step, uy*step, 0, there)):
+        bot_move(ux, uy, False)
+        return
+
+    # We are at the edge and neither jumping nor walking off gets us
+    # there, so we couldn't get to where we should have jumped from. Stop,
+    # and find another way without this jump. If there isn't one, all we
+    # can do is jump and hope.
+    avoid = Bot["avoid"] | {(floor, target)}
+    path  = bot_plan(floor, avoid)
+    if path is None:
+        bot_move(ux, uy, True)
+        return
+    Bot["avoid"]    = avoid
+    Bot["path"]     = path
+    bot_stop()
+
+# Make (dx, dy) length 1. (0, 0) stays as it is.
+def bot_unit(dx, dy):
+    d = hypot(dx, dy)
+    if d == 0:
+        return (0, 0)
+    return (dx / d, dy / d)
+
+# Stand still.
+def bot_stop():
+    run_binding(["player_walk", 0])
+    run_binding(["player_strafe", 0])
+
+# Walk in direction (ux, uy), and jump if jump is True. Walking and
+# strafing at once goes 45 degrees to the right of where we are facing.
+def bot_move(ux, uy, jump):
+    if (ux, uy) == (0, 0):
+        return
+    want = degrees(atan2(uy, ux)) + 45
+    run_binding(["camera_look_leftright", Camera.angle[0] - want])
+    run_binding(["player_walk", 1])
+    run_binding(["player_strafe", 1])
+    if jump:
+        run_binding(["player_jump", True])
+
+# How far along the ground a jump goes before it comes down onto a floor
+# rise higher than where it started, or None if it can't get that high.
+def bot_jump_length(rise):
+    (z, vz, top, ticks) = (Speed["jump"], Speed["jump"], Speed["jump"], 1)
+    while vz > 0 or z >= rise:
+        vz -= Speed["fall"]
+        z  += vz
+        top = max(top, z)
+        ticks += 1
+    if top < rise:
+        return None
+    # We come down on the floor somewhere in the last tick, so to be safe
+    # count from the tick before.
+    return (ticks - 1) * Speed["walk"] * sqrt(2)
+
+# Checking the bot
+
+# How many ticks bot_check gives the bot to win each level.
+BOT_TICKS = 20000
+
+# Play every kind of level mazegen.py makes, with count floors and seeds 1
+# to seeds, at the current Speed settings. Returns a list of (kind, seed,
+# result, ticks), where result is "win", "die" or "timeout".
+def bot_check(count, seeds, ticks=BOT_TICKS):
+    import headless
+    from physics    import Game, player_reset
+    from mazegen    import GENERATORS, gen_level
+
+    results = []
+    for kind in sorted(GENERATORS):
+        for seed in range(1, seeds + 1):
+            World.load(gen_level(kind, count, seed))
+            player_reset()
+            bot_start()
+            # Throw away what the physics prints when we win or die.
+            with open(os.devnull, "w") as null, redirect_stdout(null):
+                done = headless.run(ticks, control=bot_control)
+            results.append((kind, seed, Game.over or "timeout", done))
+    return results
+
+def main(argv):
+    if len(argv) > 3:
+        print("Usage: python bot.py [COUNT [SEEDS]]")
+        return 1
+    count = int(argv[1]) if len(argv) > 1 else 60
+    seeds = int(argv[2]) if len(argv) > 2 else 3
+
+    results = bot_check(count, seeds)
+    for (kind, seed, result, ticks) in results:
+        print("%-8s seed %-4d %-8s %6d ticks" % (kind, seed, result, ticks))
+    won = sum(1 for r in results if r[2] == "win")
+    print("The bot won %d of %d levels" % (won, len(results)))
+    return 0 if won == len(results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,243 @@
+# capture.py
+# Draw frames into a framebuffer and read them back without waiting.
+#
+# To record a video of a replay, or to check that drawing still gives the
+# same picture, we need the pixels of each frame. glReadPixels normally
+# makes Python wait until OpenGL has finished drawing the frame and copied
+# it all back, so nothing else can happen meanwhile. Instead we read each
+# frame into a pixel buffer object (PBO), a buffer OpenGL owns. Reading
+# into a buffer doesn't wait: OpenGL copies the pixels into it in the
+# background when the frame is finished. We keep a ring of these buffers
+# and only look at a frame a couple of frames later, by which time it has
+# usually arrived, so getting it doesn't wait either.
+#
+# The frames are drawn into a framebuffer object (FBO) rather than the
+# window, so they can be any size and don't need a window at all (see
+# offscreen.py). Once capture_init has been called, render in maze.py
+# draws into it.
+#
+# A frame comes back as a NumPy array of shape (height, width, 4), red,
+# green, blue and alpha bytes, with the top row first. The array looks
+# straight at OpenGL's buffer rather than copying it, so it is only good
+# until the next call to capture_read or capture_flush; copy it to keep it.
+#
+# capture_writer_open and capture_write save the frames to a file, either
+# as raw RGBA bytes or as a Y4M video, which ffmpeg and most video players
+# understand:
+#   ffmpeg -i replay.y4m replay.mp4
+#   ffmpeg -f rawvideo -pix_fmt rgba -s 640x480 -r 80 -i replay.rgba out.mp4
+
+import os
+import ctypes
+import numpy as np
+from OpenGL.GL      import *
+
+# How many pixel buffers we keep. Frames come back this many frames minus
+# one after they were drawn.
+CAPTURE_BUFFERS = 3
+
+# The capture target:
+#   size        (width, height) of the frames
+#   framebuffer the framebuffer object we draw into
+#   renderbuffers
+#               its colour and depth buffers
+#   buffers     the ring of pixel buffers
+#   next        which buffer the next frame is read into
+#   waiting     how many buffers have a frame in which we haven't looked at
+#   mapped      the buffer the last frame we gave out is in, or None
+#   previous    the framebuffer we were drawing into before, and its
+#               viewport
+Capture = {}
+
+# Make a framebuffer of size (width, height) to draw into, and pixel
+# buffers to read frames back into, and draw into the framebuffer from
+# now on. Raises RuntimeError if we can't.
+def capture_init(size, buffers=CAPTURE_BUFFERS):
+    (width, height) = size
+
+    previous = (glGetIntegerv(GL_FRAMEBUFFER_BINDING),
+                glGetIntegerv(GL_VIEWPORT))
+    fb = glGenFramebuffers(1)
+    glBindFramebuffer(GL_FRAMEBUFFER, fb)
+    (colour, depth) = glGenRenderbuffers(2)
+
+    glBindRenderbuffer(GL_RENDERBUFFER, colour)
+    glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, width, height)
+    glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0,
+        GL_RENDERBUFFER, colour)
+
+    glBindRenderbuffer(GL_RENDERBUFFER, depth)
+    glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24,
+        width, height)
+    glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT,
+        GL_RENDERBUFFER, depth)
+
+    if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+        raise RuntimeError("capture framebuffer is not complete")
+
+    # glGenBuffers gives a plain number rather than a list for one buffer.
+    pbos = list(np.atleast_1d(glGenBuffers(buffers)))
+    for pbo in pbos:
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+        glBufferData(GL_PIXEL_PACK_BUFFER, width * height * 4, None,
+            GL_STREAM_READ)
+    glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+
+    glViewport(0, 0, width, height)
+    Capture["size"]         = size
+    Capture["framebuffer"]  = fb
+    Capture["renderbuffers"] = (colour, depth)
+    Capture["buffers"]      = pbos
+    Capture["next"]         = 0
+    Capture["waiting"]      = 0
+    Capture["mapped"]       = None
+    Capture["previous"]     = previous
+
+# Start reading back the frame just drawn, without waiting for it. Once
+# all the buffers are in use this gives back the oldest frame, as
+# capture_frame does; until then it gives None.
+def capture_read():
+    # The buffer we read into may be the one the last frame we gave out
+    # is in, so we must stop looking at that first.
+    capture_unmap()
+    buffers = Capture["buffers"]
+    (width, height) = Capture["size"]
+    glBindFramebuffer(GL_READ_FRAMEBUFFER, Capture["framebuffer"])
+    glBindBuffer(GL_PIXEL_PACK_BUFFER, buffers[Capture["next"]])
+    # With a pixel buffer bound, the last argument is where in the buffer
+    # to put the pixels rather than somewhere in memory, and OpenGL does
+    # the copy later.
+    glReadPixels(0, 0, width, height, GL_RGBA, GL_UNSIGNED_BYTE,
+        ctypes.c_void_p(0))
+    glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+    Capture["next"]     = (Capture["next"] + 1) % len(buffers)
+    Capture["waiting"]  += 1
+
+    if Capture["waiting"] < len(buffers):
+        return None
+    # Every buffer has a frame in, so give out the oldest. Its buffer is
+    # the one the next frame will be read into.
+    frame = capture_frame()
+    Capture["waiting"] -= 1
+    return frame
+
+# The oldest frame we haven't looked at yet, as an array (see the top of
+# the file). This waits for OpenGL if the frame isn't ready yet.
+def capture_frame():
+    buffers = Capture["buffers"]
+    oldest  = (Capture["next"] - Capture["waiting"]) % len(buffers)
+    return capture_map(oldest)
+
+# Map pixel buffer i so we can read it, and return it as an array.
+def capture_map(i):
+    capture_unmap()
+    (width, height) = Capture["size"]
+    length = width * height * 4
+    glBindBuffer(GL_PIXEL_PACK_BUFFER, Capture["buffers"][i])
+    address = glMapBufferRange(GL_PIXEL_PACK_BUFFER, 0, length,
+        GL_MAP_READ_BIT)
+    glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+    if not address:
+        raise RuntimeError("can't map the capture buffer")
+    Capture["mapped"] = i
+
+    pixels = np.frombuffer((ctypes.c_ubyte * length).from_address(address),
+        np.uint8)
+    # OpenGL gives the bottom row first, so turn the rows round. This
+    # doesn't copy anything either.
+    return pixels.reshape(height, width, 4)[::-1]
+
+# Stop looking at the last frame we gave out, so OpenGL can use its buffer
+# again.
+def capture_unmap():
+    if Capture["mapped"] is not None:
+        pbo = Capture["buffers"][Capture["mapped"]]
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+        glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        Capture["mapped"] = None
+
+# Get all the frames we haven't looked at yet, oldest first. Each one is
+# only good until the next one is asked for.
+def capture_flush():
+    while Capture["waiting"]:
+        frame = capture_frame()
+        Capture["waiting"] -= 1
+        yield frame
+    capture_unmap()
+
+# Copy the frame just drawn to the window, to show it as well.
+def capture_blit():
+    (width, height) = Capture["size"]
+    glBindFramebuffer(GL_DRAW_FRAMEBUFFER, 0)
+    glBlitFramebuffer(0, 0, width, height, 0, 0, width, height,
+        GL_COLOR_BUFFER_BIT, GL_NEAREST)
+    glBindFramebuffer(GL_DRAW_FRAMEBUFFER, Capture["framebuffer"])
+
+# Stop capturing and draw into whatever we were drawing into before (the
+# window, or offscreen.py's framebuffer) again.
+def capture_quit():
+    if "framebuffer" in Capture:
+        capture_unmap()
+        (fb, viewport) = Capture["previous"]
+        glBindFramebuffer(GL_FRAMEBUFFER, fb)
+        glViewport(*viewport)
+        glDeleteBuffers(len(Capture["buffers"]), Capture["buffers"])
+        glDeleteRenderbuffers(2, Capture["renderbuffers"])
+        glDeleteFramebuffers(1, [Capture["framebuffer"]])
+        Capture.clear()
+
+# Writing frames to files
+
+# The formats capture_writer_open can write, by file extension.
+CAPTURE_FORMATS = {".y4m": "y4m", ".rgba": "raw", ".raw": "raw"}
+
+# Open a file to write frames of size (width, height) to, fps frames a
+# second. format is "raw" or "y4m", or None to go by the extension of
+# path. Returns a writer for capture_write and capture_writer_close.
+def capture_writer_open(path, size, fps, format=None):
+    if format is None:
+        format = CAPTURE_FORMATS.get(os.path.splitext(path)[1].lower(),
+            "raw")
+    if format not in ("raw", "y4m"):
+        raise ValueError("unknown capture format %r" % (format,))
+
+    out = open(path, "wb")
+    if format == "y4m":
+        # C444 means the colour isn't made smaller than the brightness, so
+        # we don't need to worry about odd sizes. XCOLORRANGE=FULL says the
+        # values go from 0 to 255 (see CAPTURE_YUV), not 16 to 235 as
+        # players would otherwise assume.
+        out.write(b"YUV4MPEG2 W%d H%d F%d:1 Ip A1:1 C444 XCOLORRANGE=FULL\n"
+            % (size[0], size[1], round(fps)))
+    return {"file": out, "format": format, "size": size, "frames": 0}
+
+# How to turn red, green and blue into the brightness (Y) and the two
+# colour differences (U and V), as JPEG does, so 0 to 255 in gives 0 to
+# 255 out: each plane is r*R + g*G + b*B + offset.
+CAPTURE_YUV = (
+    ( 0.299,     0.587,     0.114,      0),
+    (-0.168736, -0.331264,  0.5,        128),
+    ( 0.5,      -0.418688, -0.081312,   128))
+
+# Write a frame (an array like capture_read gives) to a writer.
+def capture_write(writer, frame):
+    out = writer["file"]
+    if writer["format"] == "raw":
+        out.write(np.ascontiguousarray(frame))
+    else:
+        # Y4M wants each plane (all the Y values, then U, then V) in turn.
+        (r, g, b) = (frame[:,:,0], frame[:,:,1], frame[:,:,2])
+        out.write(b"FRAME\n")
+        for (rk, gk, bk, offset) in CAPTURE_YUV:
+            plane = r * np.float32(rk)
+            plane += g * np.float32(gk)
+            plane += b * np.float32(bk)
+            plane += offset + 0.5
+            np.clip(plane, 0, 255, out=plane)
+            out.write(plane.astype(np.uint8))
+    writer["frames"] += 1
+
+# Finish writing.
+def capture_writer_close(writer):
+    writer["file"].close()
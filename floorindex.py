@@ -0,0 +1,236 @@
+# floorindex.py
+# A spatial index over the floors, so we can find the floor below a point
+# without looking at every floor in the world.
+
+from math           import floor
+from bisect         import bisect_left, bisect_right
+
+# The index is a uniform 2D grid laid over the XY plane. Each floor is put
+# into every grid cell its rectangle touches, so to find the floors which
+# might contain a point we only have to look in the one cell the point is in.
+#
+# Inside each cell the floors are kept sorted highest first, so the first
+# floor we find that contains the point is the one we want. Floors which
+# are very big compared to the cells would have to go into a lot of cells,
+# so instead they go into a separate 'big' list which is checked as well.
+
+# A floor which would cover more than this many cells goes in the big list.
+BIG_CELLS = 256
+
+# Find the floor below a given position by looking at every floor.
+# floors is a list like World.floors; v is the point to start from.
+# Returns one of the floors, or None. This is the simple way of doing it;
+# the index must always give the same answer as this.
+def find_floor_linear(floors, v):
+    found = None
+    for f in floors:
+        c = f["coords"]
+        if v[0] < c[0] or v[1] < c[1]:
+            continue
+        if v[0] > c[2] or v[1] > c[3]:
+            continue
+        if v[2] < c[4]:
+            continue
+        if found and c[4] <= found["coords"][4]:
+            continue
+        found = f
+    return found
+
+# Get the coords of every floor in a list, as a list. If the floors are
+# stored in columns (see LevelFloors in level.py) we take the coords
+# straight from there rather than making a dict for every floor.
+def floor_coords(floors):
+    if hasattr(floors, "coords"):
+        return floors.coords.tolist()
+    return [f["coords"] for f in floors]
+
+# Pick a cell size for a list of floor coords. We use the median floor
+# size, so a typical floor covers a few cells.
+def floor_index_cell_size(coords):
+    sizes = []
+    for (x1, y1, x2, y2, z) in coords:
+        s = max(x2 - x1, y2 - y1)
+        if s > 0:
+            sizes.append(s)
+    if not sizes:
+        return 1.0
+    sizes.sort()
+    return float(sizes[len(sizes)//2])
+
+# Build an index over a list of floors. The floors are not copied, so if
+# the list is changed the index must be built again; floor_index_stale
+# will tell you when that is needed (as long as the list changes length).
+# cell is the size of a grid cell, or None to pick one automatically.
+def floor_index_build(floors, cell=None):
+    coords = floor_coords(floors)
+    if cell is None:
+        cell = floor_index_cell_size(coords)
+
+    cells   = {}
+    big     = []
+
+    for n, (x1, y1, x2, y2, z) in enumerate(coords):
+        # Each entry is (-z, n, ...) so that sorting puts the highest floor
+        # first, and floors of the same height in the order they appear
+        # in the list. This is the same order the linear search prefers.
+        entry = (-z, n, x1, y1, x2, y2)
+
+        cx1 = floor(x1/cell)
+        cy1 = floor(y1/cell)
+        cx2 = floor(x2/cell)
+        cy2 = floor(y2/cell)
+        # A floor with x2 < x1 or y2 < y1 can never contain a point, so it
+        # doesn't need to go anywhere.
+        if cx2 < cx1 or cy2 < cy1:
+            continue
+
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > BIG_CELLS:
+            big.append(entry)
+            continue
+
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                key = (cx, cy)
+                if key in cells:
+                    cells[key].append(entry)
+                else:
+                    cells[key] = [entry]
+
+    # Sort every cell, and keep a separate list of the -z values so we can
+    # use bisect to skip the floors which are above the point.
+    for key, entries in cells.items():
+        entries.sort()
+        cells[key] = (entries, [e[0] for e in entries])
+    big.sort()
+
+    return {
+        "floors":   floors,
+        "count":    len(floors),
+        "cell":     cell,
+        "cells":    cells,
+        "big":      (big, [e[0] for e in big]),
+    }
+
+# Is this index out of date for this list of floors?
+def floor_index_stale(index, floors):
+    return index["floors"] is not floors or index["count"] != len(floors)
+
+# Look through a sorted list of entries for the first floor which contains
+# the point (x, y) and is not above z. Returns the entry, or None.
+def floor_index_search(entries, keys, x, y, z):
+    for i in range(bisect_left(keys, -z), len(entries)):
+        e = entries[i]
+        if x < e[2] or y < e[3] or x > e[4] or y > e[5]:
+            continue
+        return e
+    return None
+
+# Find the floor below a given position, using an index.
+# Returns one of the floors from the list the index was built from, or None.
+def floor_index_find(index, v):
+    n = floor_index_find_number(index, v)
+    if n is None:
+        return None
+    return index["floors"][n]
+
+# The same as floor_index_find, but returns the number of the floor in the
+# list instead of the floor itself.
+def floor_index_find_number(index, v):
+    return floor_index_find_at(index, v[0], v[1], v[2])
+
+# The same as floor_index_find_number, for the point (x, y, z).
+def floor_index_find_at(index, x, y, z):
+    cell        = index["cell"]
+
+    found = None
+    key = (floor(x/cell), floor(y/cell))
+    if key in index["cells"]:
+        (entries, keys) = index["cells"][key]
+        found = floor_index_search(entries, keys, x, y, z)
+
+    (entries, keys) = index["big"]
+    if entries:
+        e = floor_index_search(entries, keys, x, y, z)
+        if e and (not found or e < found):
+            found = e
+
+    if found is None:
+        return None
+    return found[1]
+
+# Find every floor between heights z1 and z2 whose rectangle might touch
+# the box from (x1, y1) to (x2, y2). Returns a set of floor numbers; it can
+# include some floors which are near the box but don't touch it, so check
+# them if it matters.
+def floor_index_near(index, x1, y1, x2, y2, z1, z2):
+    cell    = index["cell"]
+    cells   = index["cells"]
+    found   = set()
+    for cx in range(floor(x1/cell), floor(x2/cell) + 1):
+        for cy in range(floor(y1/cell), floor(y2/cell) + 1):
+            key = (cx, cy)
+            if key in cells:
+                floor_index_near_z(cells[key], z1, z2, found)
+    floor_index_near_z(index["big"], z1, z2, found)
+    return found
+
+# Add the floors in a sorted list of entries which are between heights z1
+# and z2 to the set found.
+def floor_index_near_z(cell, z1, z2, found):
+    (entries, keys) = cell
+    for i in range(bisect_left(keys, -z2), bisect_right(keys, -z1)):
+        found.add(entries[i][1])
+
+# Find the first floor a point moving from a to b goes down through the
+# top of. The top of a floor counts as being stand above its z, like
+# FLOOR_STAND in physics.py. Returns (n, x, y): the number of the floor and
+# where the point was when it hit it, or None. Only the cells the line
+# from a to b passes over are searched, so moving a long way in one step
+# doesn't miss anything.
+def floor_index_sweep(index, a, b, stand=0):
+    (x0, y0, z0) = (a[0], a[1], a[2])
+    (x1, y1, z1) = (b[0], b[1], b[2])
+    if z1 >= z0:
+        return None
+    line    = (x0, y0, z0, x1, y1, z1)
+    cell    = index["cell"]
+    cells   = index["cells"]
+
+    found = None
+    for cx in range(floor(min(x0, x1)/cell), floor(max(x0, x1)/cell) + 1):
+        for cy in range(floor(min(y0, y1)/cell), floor(max(y0, y1)/cell) + 1):
+            key = (cx, cy)
+            if key in cells:
+                hit = floor_index_sweep_search(cells[key], line, stand)
+                if hit and (not found or hit[0] < found[0]):
+                    found = hit
+    hit = floor_index_sweep_search(index["big"], line, stand)
+    if hit and (not found or hit[0] < found[0]):
+        found = hit
+
+    if found is None:
+        return None
+    return (found[0][1], found[1], found[2])
+
+# Look through a sorted list of entries for the highest floor whose top
+# the line goes down through. line is (x0, y0, z0, x1, y1, z1), from
+# (x0, y0, z0) to (x1, y1, z1). Returns (entry, x, y) or None.
+def floor_index_sweep_search(cell, line, stand):
+    (entries, keys) = cell
+    (x0, y0, z0, x1, y1, z1) = line
+    for i in range(bisect_left(keys, -z0), len(entries)):
+        e   = entries[i]
+        top = -e[0] + stand
+        if top > z0:
+            continue
+        if top <= z1:
+            # The rest are all lower, so we don't reach them.
+            return None
+        # Where we are when we get down to the top of the floor.
+        t = (z0 - top) / (z0 - z1)
+        x = x0 + (x1 - x0)*t
+        y = y0 + (y1 - y0)*t
+        if x < e[2] or y < e[3] or x > e[4] or y > e[5]:
+            continue
+        return (e, x, y)
+    return None
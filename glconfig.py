@@ -0,0 +1,46 @@
+# glconfig.py
+# Set PyOpenGL up for speed or for finding mistakes, before it is loaded.
+#
+# By default PyOpenGL asks OpenGL whether there was an error (glGetError)
+# after every call, and raises an exception if there was. That is a great
+# help while writing drawing code, but it is another call into OpenGL for
+# every call we make, every frame. In release mode we turn that off, along
+# with PyOpenGL's logging of calls. Either way, PyOpenGL uses its
+# OpenGL_accelerate module, which does some of its work in C, if it is
+# installed (pip install PyOpenGL-accelerate).
+#
+# Release mode is on when Python is run with -O (python -O maze.py), or
+# when MAZE_RELEASE=1 is set in the environment. PyOpenGL reads these
+# settings from the environment when it is first imported, so this must be
+# imported before anything imports OpenGL; maze.py and offscreen.py import
+# it first. Any of PyOpenGL's settings already in the environment, like
+# PYOPENGL_ERROR_CHECKING, are left alone.
+
+import os
+import sys
+
+# How PyOpenGL was set up:
+#   release     True in release mode
+#   late        True if OpenGL had already been imported before us, so
+#               these settings didn't make any difference
+GLConfig = {
+    "release":  not __debug__ or os.environ.get("MAZE_RELEASE") == "1",
+    "late":     "OpenGL" in sys.modules,
+}
+
+if GLConfig["release"]:
+    os.environ.setdefault("PYOPENGL_ERROR_CHECKING", "0")
+    os.environ.setdefault("PYOPENGL_ERROR_LOGGING", "0")
+    os.environ.setdefault("PYOPENGL_CONTEXT_CHECKING", "0")
+os.environ.setdefault("PYOPENGL_USE_ACCELERATE", "1")
+
+# Describe how PyOpenGL is set up, for printing. This loads OpenGL if it
+# isn't loaded already.
+def glconfig_describe():
+    import OpenGL
+    from OpenGL import acceleratesupport
+    return "%s mode, error checking %s, accelerate %s%s" % (
+        "release" if GLConfig["release"] else "debug",
+        "on" if OpenGL.ERROR_CHECKING else "off",
+        "on" if acceleratesupport.ACCELERATE_AVAILABLE else "not installed",
+        " (set up too late)" if GLConfig["late"] else "")
@@ -0,0 +1,220 @@
+# glcount.py
+# Count the OpenGL calls we make.
+#
+# Every OpenGL call from Python goes through PyOpenGL into C and back,
+# which takes a microsecond or so even when OpenGL itself does nothing, so
+# how many calls a frame makes matters as much as what they draw. This
+# counts, for each frame:
+#   calls       every OpenGL (and GLU) call, and how many of each
+#   draws       calls which draw something: glBegin, glDrawArrays,
+#               glMultiDrawArrays, glDrawElements and glDrawPixels
+#   vertices    how many vertices those draw, from the glVertex calls and
+#               the counts given to glDrawArrays and friends
+#   matrix      calls which change a matrix (glLoadMatrixf, glRotatef...)
+#   state       calls which change other state (glEnable, glBindBuffer...)
+#
+# Display lists are counted when they are made: the draws, vertices and
+# changes in a list go to the list rather than the frame, and each
+# glCallList adds them to the frame. Only glCallList itself counts as a
+# call, as the list is run inside OpenGL.
+#
+# It works by replacing the OpenGL functions a module got with
+# "from OpenGL.GL import *" with ones which count and then call the real
+# function (see glcount_install), so it costs nothing unless it is turned
+# on, and makes calls slower while it is. maze.py turns it on with
+# --gl-count, and shows the counts in the overlay (F3) and when we quit.
+
+# The kinds of call we count specially, by function name.
+GLCOUNT_KINDS = {}
+for name in ("glVertex2f", "glVertex2i", "glVertex3f", "glVertex3fv",
+             "glVertex3d", "glVertex3dv"):
+    GLCOUNT_KINDS[name] = "vertex"
+for name in ("glBegin", "glDrawPixels"):
+    GLCOUNT_KINDS[name] = "draw"
+GLCOUNT_KINDS["glDrawArrays"]       = "arrays"
+GLCOUNT_KINDS["glMultiDrawArrays"]  = "multi"
+GLCOUNT_KINDS["glDrawElements"]     = "elements"
+GLCOUNT_KINDS["glNewList"]          = "newlist"
+GLCOUNT_KINDS["glEndList"]          = "endlist"
+GLCOUNT_KINDS["glCallList"]         = "calllist"
+for name in ("glLoadMatrixf", "glLoadMatrixd", "glLoadIdentity",
+             "glMultMatrixf", "glMultMatrixd", "glRotatef", "glRotated",
+             "glTranslatef", "glTranslated", "glScalef", "glScaled",
+             "glPushMatrix", "glPopMatrix", "glMatrixMode", "glOrtho",
+             "glFrustum", "gluPerspective", "gluLookAt"):
+    GLCOUNT_KINDS[name] = "matrix"
+for name in ("glEnable", "glDisable", "glEnableClientState",
+             "glDisableClientState", "glPushAttrib", "glPopAttrib",
+             "glBindBuffer", "glBindFramebuffer", "glBindRenderbuffer",
+             "glBindTexture", "glVertexPointer", "glColorPointer",
+             "glNormalPointer", "glInterleavedArrays", "glLightfv",
+             "glLightf", "glMaterialfv", "glColorMaterial", "glPointSize",
+             "glLineWidth", "glViewport", "glScissor", "glWindowPos2i",
+             "glTexEnvi", "glTexParameteri", "glClearColor", "glDepthFunc",
+             "glBlendFunc", "glUseProgram"):
+    GLCOUNT_KINDS[name] = "state"
+
+# The numbers we keep for each frame, and for each display list.
+GLCOUNT_FIELDS = ("calls", "draws", "vertices", "matrix", "state")
+
+# The counting:
+#   on          True while the counting functions are installed
+#   saved       the real functions, as (module, name, function)
+#   frame       the counts for the frame being drawn now: a dict of
+#               GLCOUNT_FIELDS, and "names", a dict of calls by function
+#   last        the counts for the last frame, or None
+#   setup       the counts from before the first frame, or None
+#   total       the counts for all the frames added together
+#   frames      how many frames are in total
+#   lists       the counts for each display list, by list number
+#   compiling   the counts for the display list being made, or None
+GLCount = {
+    "on":       False,
+}
+
+# Make a new set of counts.
+def glcount_new():
+    counts = dict.fromkeys(GLCOUNT_FIELDS, 0)
+    counts["names"] = {}
+    return counts
+
+# Start counting the OpenGL calls the given modules make. Each module must
+# have imported the OpenGL functions into itself, as
+# "from OpenGL.GL import *" does.
+def glcount_install(*modules):
+    if not GLCount["on"]:
+        GLCount.update(on=True, saved=[], frame=glcount_new(), last=None,
+            setup=None, total=glcount_new(), frames=0, lists={},
+            compiling=None)
+    for module in modules:
+        for (name, function) in list(vars(module).items()):
+            if glcount_is_gl(name) and callable(function):
+                GLCount["saved"].append((module, name, function))
+                setattr(module, name, glcount_wrap(name, function))
+
+# Stop counting, and put the real functions back. The counts are kept.
+def glcount_uninstall():
+    if GLCount["on"]:
+        for (module, name, function) in reversed(GLCount["saved"]):
+            setattr(module, name, function)
+        GLCount["saved"] = []
+        GLCount["on"] = False
+
+# Is this the name of an OpenGL or GLU function, like glBegin or
+# gluPerspective? (The constants are all capitals, like GL_QUADS.)
+def glcount_is_gl(name):
+    if name.startswith("glu"):
+        return name[3:4].isupper()
+    return name.startswith("gl") and name[2:3].isupper()
+
+# Make a function which counts a call to function, called name, and then
+# calls it.
+def glcount_wrap(name, function):
+    kind = GLCOUNT_KINDS.get(name)
+
+    def counted(*args, **kwargs):
+        frame = GLCount["frame"]
+        frame["calls"] += 1
+        names = frame["names"]
+        names[name] = names.get(name, 0) + 1
+        if kind is not None:
+            glcount_kind(kind, args)
+        return function(*args, **kwargs)
+
+    counted.__name__ = name
+    counted.__wrapped__ = function
+    return counted
+
+# Count a call of one of the GLCOUNT_KINDS.
+def glcount_kind(kind, args):
+    # While a display list is being made, the calls don't draw anything
+    # yet, so count them for the list.
+    counts = GLCount["compiling"] or GLCount["frame"]
+    if kind == "vertex":
+        counts["vertices"] += 1
+    elif kind == "draw":
+        counts["draws"] += 1
+    elif kind == "arrays":
+        # glDrawArrays(mode, first, count)
+        counts["draws"] += 1
+        counts["vertices"] += int(args[2])
+    elif kind == "multi":
+        # glMultiDrawArrays(mode, firsts, counts, drawcount)
+        counts["draws"] += 1
+        counts["vertices"] += int(sum(args[2][:args[3]]))
+    elif kind == "elements":
+        # glDrawElements(mode, count, type, indices)
+        counts["draws"] += 1
+        counts["vertices"] += int(args[1])
+    elif kind == "matrix":
+        counts["matrix"] += 1
+    elif kind == "state":
+        counts["state"] += 1
+    elif kind == "newlist":
+        GLCount["compiling"] = glcount_new()
+        GLCount["lists"][args[0]] = GLCount["compiling"]
+    elif kind == "endlist":
+        GLCount["compiling"] = None
+    elif kind == "calllist":
+        made = GLCount["lists"].get(args[0])
+        if made:
+            for field in ("draws", "vertices", "matrix", "state"):
+                counts[field] += made[field]
+
+# Add one set of counts to another.
+def glcount_add(total, counts):
+    for field in GLCOUNT_FIELDS:
+        total[field] += counts[field]
+    names = total["names"]
+    for (name, n) in counts["names"].items():
+        names[name] = names.get(name, 0) + n
+
+# Say everything counted so far was setting up (like building the world),
+# rather than part of a frame.
+def glcount_end_setup():
+    if GLCount["on"]:
+        GLCount["setup"] = GLCount["frame"]
+        GLCount["frame"] = glcount_new()
+
+# Finish counting a frame, and start the next. Call this after each frame
+# is drawn.
+def glcount_end_frame():
+    if GLCount["on"]:
+        frame = GLCount["frame"]
+        glcount_add(GLCount["total"], frame)
+        GLCount["frames"] += 1
+        GLCount["last"]  = frame
+        GLCount["frame"] = glcount_new()
+
+# The counts for the last frame, as lines for the overlay, or no lines if
+# we aren't counting.
+def glcount_overlay_text():
+    last = GLCount.get("last")
+    if not GLCount["on"] or last is None:
+        return []
+    return ["gl calls %d" % last["calls"],
+            "draws    %d" % last["draws"],
+            "vertices %d" % last["vertices"],
+            "matrix   %d" % last["matrix"],
+            "state    %d" % last["state"]]
+
+# A summary of what we counted, as lines of text: the setup counts, the
+# average per frame, and the functions called most often per frame.
+def glcount_summary(top=10):
+    if "total" not in GLCount:
+        return []
+    lines   = []
+    setup   = GLCount["setup"]
+    if setup:
+        lines.append("GL setup: " + ", ".join("%s %d" % (field, setup[field])
+            for field in GLCOUNT_FIELDS))
+    frames  = GLCount["frames"]
+    if frames:
+        total = GLCount["total"]
+        lines.append("GL per frame (%d frames): " % frames + ", ".join(
+            "%s %.1f" % (field, total[field] / frames)
+            for field in GLCOUNT_FIELDS))
+        names = sorted(total["names"].items(), key=lambda item: -item[1])
+        for (name, n) in names[:top]:
+            lines.append("  %-24s %8.1f" % (name, n / frames))
+    return lines
@@ -0,0 +1,114 @@
+# headless.py
+# Run the maze physics without a display, as fast as we can.
+#
+# This steps the world for a number of ticks with no window, no OpenGL and
+# no waiting between ticks. Instead of reading the keyboard it follows a
+# script, which says which bindings (see Key_Bindings in keys.py) to run on
+# which tick. A script file has one line per binding, like this:
+#
+#   # tick  function            arguments
+#   0       player_walk         1
+#   40      player_jump         True
+#   60      camera_look_leftright -5
+#   100     player_walk         0
+#
+# Blank lines and lines starting with # are ignored. The arguments are
+# Python literals.
+#
+# Run it as
+#   python headless.py [--script FILE] [--ticks N] [--quiet] [--level FILE]
+# It prints how many ticks were run and how many ticks per second that is.
+
+import os
+import argparse
+from ast            import literal_eval
+from contextlib     import redirect_stdout
+from time           import perf_counter
+
+from physics        import *
+
+# Read a script file. Returns a list of (tick, binding) tuples, sorted
+# by tick. Bindings on the same tick stay in the order they were written.
+def script_load(path):
+    script = []
+    with open(path) as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            words = line.split()
+            if len(words) < 2:
+                raise ValueError("%s:%d: need a tick and a function"
+                    % (path, lineno))
+            tick    = int(words[0])
+            binding = [words[1]] + [literal_eval(w) for w in words[2:]]
+            script.append((tick, binding))
+    script.sort(key=lambda s: s[0])
+    return script
+
+# Run the physics for the given number of ticks, following a script (a
+# list of (tick, binding) tuples, sorted by tick). If control is given it
+# is called before every tick, after the script, so it can press keys
+# too; bot.py uses this. We stop early if the game ends. Returns the
+# number of ticks we actually ran.
+def run(ticks, script=(), control=None):
+    next_input = 0
+    tick = 0
+    while tick < ticks and not Game.over:
+        # Run any bindings for this tick, like mainloop handles keys.
+        while (next_input < len(script)
+                and script[next_input][0] <= tick):
+            run_binding(script[next_input][1])
+            next_input += 1
+        if control:
+            control()
+
+        physics_tick()
+        tick += 1
+
+    return tick
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the maze physics without a display.")
+    parser.add_argument("--script", help="file of bindings to run")
+    parser.add_argument("--ticks", type=int, default=10000,
+        help="how many ticks to run (default 10000)")
+    parser.add_argument("--quiet", action="store_true",
+        help="throw away the messages the physics prints")
+    parser.add_argument("--level", help="level file to load (see level.py)")
+    parser.add_argument("--log", help="log levels, e.g. physics=debug "
+        "(see log.py)")
+    args = parser.parse_args(argv)
+
+    if args.log:
+        from log import log_config
+        log_config(args.log)
+
+    if args.level:
+        from level import level_use
+        level_use(args.level)
+
+    script = []
+    if args.script:
+        script = script_load(args.script)
+
+    init_player()
+    camera_init()
+
+    start = perf_counter()
+    if args.quiet:
+        with open(os.devnull, "w") as null, redirect_stdout(null):
+            done = run(args.ticks, script)
+    else:
+        done = run(args.ticks, script)
+    elapsed = perf_counter() - start
+
+    print("Ran %d ticks in %.3fs (%.0f ticks/sec)"
+        % (done, elapsed, done / elapsed if elapsed else 0))
+    print("Player position", Player.pos)
+    if Game.over:
+        print("Game over:", Game.over)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# keys.py
+# What all the keys do.
+#
+# The bindings are kept here rather than in maze.py so that replay.py can
+# use them without loading pygame and OpenGL, which take a while. That
+# means we can't use pygame's names for the keys, so the key codes pygame
+# gives them are written out below. Recordings (see replay.py) save these
+# codes, so they must stay the same; maze.py calls keys_check to make sure
+# they match pygame's.
+
+K_ESCAPE    = 27
+K_SPACE     = 32
+K_a         = 97
+K_d         = 100
+K_i         = 105
+K_j         = 106
+K_k         = 107
+K_l         = 108
+K_q         = 113
+K_s         = 115
+K_w         = 119
+K_F3        = 1073741884
+
+# The names of the key codes above.
+KEY_NAMES = ("K_ESCAPE", "K_SPACE", "K_a", "K_d", "K_i", "K_j", "K_k",
+             "K_l", "K_q", "K_s", "K_w", "K_F3")
+
+# This defines what all the keys do. Each keycode maps to a 2-element tuple;
+# the first says what to do on keydown, the second what to do on keyup.
+# The names are looked up as functions in maze.py, which includes
+# everything from physics.py.
+Key_Bindings = {
+    K_ESCAPE:   (["event_post_quit"],               None),
+    K_q:        (["event_post_quit"],               None),
+    K_i:        (["camera_look_updown", 5],         None),
+    K_k:        (["camera_look_updown", -5],        None),
+    K_j:        (["camera_look_leftright", -5],     None),
+    K_l:        (["camera_look_leftright", 5],      None),
+    K_w:        (["player_walk", 1],                ["player_walk", 0]),
+    K_s:        (["player_walk", -1],               ["player_walk", 0]),
+    K_a:        (["player_strafe", -1],             ["player_strafe", 0]),
+    K_d:        (["player_strafe", 1],              ["player_strafe", 0]),
+    K_SPACE:    (["player_jump", True],             None),
+    K_F3:       (["overlay_toggle"],                None),
+}
+
+# Check the key codes above are the ones pygame uses. Raises RuntimeError
+# if they aren't.
+def keys_check(pygame):
+    for name in KEY_NAMES:
+        if getattr(pygame, name) != globals()[name]:
+            raise RuntimeError("key code for %s is %d in keys.py but %d in"
+                " pygame" % (name, globals()[name], getattr(pygame, name)))
@@ -0,0 +1,151 @@
+# level.py
+# Save and load levels as binary files.
+#
+# World.floors is normally a list of dicts, which is fine for a few
+# floors but slow to build and big in memory for a generated level with a
+# million of them. A level file instead holds every floor as a fixed-size
+# record of float32 numbers, so we can map the file straight into memory
+# and use it as a NumPy array without reading or copying anything.
+#
+# The file starts with a header:
+#   magic       4 bytes, b"MAZE"
+#   version     uint32, currently 1
+#   count       uint64, the number of floors
+#   doom_z      float32, World.doom_z
+#   (4 bytes of padding)
+# followed by count records of 9 float32s each:
+#   x1, y1, x2, y2, z, red, green, blue, win
+# win is 1 for a winning platform and 0 otherwise. Everything is
+# little-endian.
+#
+# Run 'python level.py FILE' to save the built-in level from physics.py
+# as a level file.
+
+import sys
+import mmap
+import struct
+import numpy as np
+
+HEADER          = struct.Struct("<4sIQf4x")
+MAGIC           = b"MAZE"
+VERSION         = 1
+RECORD_FLOATS   = 9
+
+# A list of floors stored in columns rather than as dicts. This behaves
+# like a list of floor dicts, so it can be used as World.floors, but
+# code which knows about it can use the columns directly:
+#   coords      an (n, 5) array of (x1, y1, x2, y2, z)
+#   colour      an (n, 3) array of (red, green, blue)
+#   win         an (n,) array, 1 for winning platforms
+# Each dict is made when it is asked for, so changing one doesn't change
+# the level; assign a whole floor dict to an item to do that.
+class LevelFloors:
+    def __init__(self, records, source=None):
+        self.records    = records
+        self.coords     = records[:,0:5]
+        self.colour     = records[:,5:8]
+        self.win        = records[:,8]
+        # Whatever the records are stored in, such as an mmap. We keep a
+        # reference to it so it stays open as long as we do.
+        self.source     = source
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        r = self.records[i].tolist()
+        return {
+            "coords":   tuple(r[0:5]),
+            "colour":   tuple(r[5:8]),
+            "win":      r[8] != 0,
+        }
+
+    def __setitem__(self, i, floor):
+        self.records[i,0:5] = floor["coords"]
+        self.records[i,5:8] = floor["colour"]
+        self.records[i,8]   = 1 if floor["win"] else 0
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+# Get the floors as columns: returns (coords, colour, win) arrays like the
+# ones LevelFloors has. For a LevelFloors these are the arrays it already
+# has; for a list of dicts they are built. We check for the columns the
+# same way floor_coords in floorindex.py does, which can't import this
+# file as it mustn't need NumPy.
+def level_columns(floors):
+    if hasattr(floors, "coords"):
+        return (floors.coords, floors.colour, floors.win)
+    n = len(floors)
+    return (
+        np.array([f["coords"] for f in floors],
+            dtype=np.float64).reshape(n, 5),
+        np.array([f["colour"] for f in floors],
+            dtype=np.float32).reshape(n, 3),
+        np.array([1 if f["win"] else 0 for f in floors], dtype=np.float32),
+    )
+
+# Turn a list of floors into an (n, 9) float32 array of records.
+def level_records(floors):
+    (coords, colour, win) = level_columns(floors)
+    records = np.empty((len(floors), RECORD_FLOATS), dtype="<f4")
+    records[:,0:5]  = coords
+    records[:,5:8]  = colour
+    records[:,8]    = win
+    return records
+
+# Save a level (a dict with floors, walls and doom_z, see WorldState in
+# state.py) to a level file.
+def level_save(path, world):
+    records = level_records(world["floors"])
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(records), world["doom_z"]))
+        f.write(records.tobytes())
+
+# Load a level file. Returns a level dict, with a LevelFloors as the
+# floors. Level files don't have walls yet, so the level has none. The
+# file is mapped into memory copy-on-write, so the floors can be changed
+# without changing the file.
+def level_load(path):
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    if len(mm) < HEADER.size:
+        raise ValueError("%s: not a level file" % path)
+    (magic, version, count, doom_z) = HEADER.unpack_from(mm)
+    if magic != MAGIC:
+        raise ValueError("%s: not a level file" % path)
+    if version != VERSION:
+        raise ValueError("%s: level file version %d, not %d"
+            % (path, version, VERSION))
+    if len(mm) < HEADER.size + count * RECORD_FLOATS * 4:
+        raise ValueError("%s: level file is too short" % path)
+
+    records = np.frombuffer(mm, dtype="<f4", count=count * RECORD_FLOATS,
+        offset=HEADER.size).reshape(count, RECORD_FLOATS)
+
+    return {
+        "floors":   LevelFloors(records, mm),
+        "walls":    [],
+        "doom_z":   doom_z,
+    }
+
+# Load a level file into World.
+def level_use(path):
+    from physics import World
+    World.load(level_load(path))
+
+def main(argv):
+    if len(argv) != 2:
+        print("Usage: python level.py FILE")
+        print("Saves the built-in level as a level file.")
+        return 1
+    from physics import World
+    level_save(argv[1], World.as_level())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
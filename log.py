@@ -0,0 +1,186 @@
+# log.py
+# Messages about what the game is doing, for debugging.
+#
+# Printing straight to the terminal every tick slows the game down a lot,
+# especially when the output is going through a pipe or to a slow
+# terminal. Instead, messages go through here:
+#
+#   - Every message belongs to a subsystem ("physics", "camera"...) and has
+#     a level (LOG_DEBUG, LOG_INFO...). Each subsystem only shows messages
+#     at or above its level, and by default that is LOG_WARNING, so the
+#     every-tick debug messages cost one dict lookup and do nothing else.
+#   - Messages which are shown are put in a buffer, and a background
+#     thread writes the buffer out a few times a second, so the game never
+#     waits for the terminal.
+#   - The same message can only be shown LOG_RATE times a second. After
+#     that we count how many we skipped and say so once it is allowed again.
+#
+# Set the levels with log_config, or with the MAZE_LOG environment
+# variable, e.g. MAZE_LOG="physics=debug,camera=info". A name without a
+# subsystem, like MAZE_LOG=debug, sets the level for everything.
+
+import os
+import sys
+import atexit
+import threading
+from collections    import deque
+from time           import perf_counter, sleep
+
+LOG_DEBUG       = 10
+LOG_INFO        = 20
+LOG_WARNING     = 30
+LOG_ERROR       = 40
+
+LOG_NAMES = {
+    "debug":    LOG_DEBUG,
+    "info":     LOG_INFO,
+    "warning":  LOG_WARNING,
+    "error":    LOG_ERROR,
+}
+
+# What to call each level in the output.
+LOG_LABELS = {v: k.upper() for (k, v) in LOG_NAMES.items()}
+
+# How many times a second the same message can be shown.
+LOG_RATE = 10
+
+# How often the background thread writes the buffer out, in seconds.
+LOG_INTERVAL = 0.1
+
+Log = {
+    # The level for each subsystem, and for any subsystem not listed.
+    "levels":   {},
+    "default":  LOG_WARNING,
+    # Where to write to; None means sys.stderr.
+    "stream":   None,
+    # Messages waiting to be written.
+    "buffer":   deque(),
+    # For each (subsystem, level, message): (when its second started, how
+    # many were shown in that second, how many were skipped).
+    "counts":   {},
+    # The background thread which writes the buffer out.
+    "thread":   None,
+    # Held while changing counts or starting the thread, as messages can
+    # come from more than one thread (see physthread.py).
+    "lock":     threading.Lock(),
+    "start":    perf_counter(),
+}
+
+# Set the levels from a string like "physics=debug,camera=info" or "debug".
+# Raises ValueError if a level name isn't one of LOG_NAMES.
+def log_config(spec):
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        (name, eq, level) = part.rpartition("=")
+        if level.lower() not in LOG_NAMES:
+            raise ValueError("unknown log level %r" % level)
+        if name:
+            Log["levels"][name] = LOG_NAMES[level.lower()]
+        else:
+            Log["default"] = LOG_NAMES[level.lower()]
+
+# Would a message for this subsystem at this level be shown? Use this to
+# skip working out something expensive that is only needed for a message.
+def log_enabled(subsystem, level):
+    return level >= Log["levels"].get(subsystem, Log["default"])
+
+# Log a message. The message is made with message % args, but only if it
+# is going to be shown.
+def log_message(subsystem, level, message, *args):
+    if level < Log["levels"].get(subsystem, Log["default"]):
+        return
+
+    # Rate limit by subsystem and message, before the args are filled in,
+    # so "Player move from %s to %s" counts as one message however the
+    # player moves.
+    now     = perf_counter()
+    key     = (subsystem, level, message)
+    # The counts are changed under the lock, and the "skipped" line is
+    # written after letting go of it.
+    report  = 0
+    with Log["lock"]:
+        (second, shown, skipped) = Log["counts"].get(key, (now, 0, 0))
+        if now - second >= 1:
+            report = skipped
+            (second, shown, skipped) = (now, 0, 0)
+        if shown >= LOG_RATE:
+            Log["counts"][key] = (second, shown, skipped + 1)
+            return
+        Log["counts"][key] = (second, shown + 1, skipped)
+
+    if report:
+        log_write(now, subsystem, level,
+            "(skipped %d more like %r)" % (report, message))
+    if args:
+        message = message % args
+    log_write(now, subsystem, level, message)
+
+def log_debug(subsystem, message, *args):
+    log_message(subsystem, LOG_DEBUG, message, *args)
+
+def log_info(subsystem, message, *args):
+    log_message(subsystem, LOG_INFO, message, *args)
+
+def log_warning(subsystem, message, *args):
+    log_message(subsystem, LOG_WARNING, message, *args)
+
+def log_error(subsystem, message, *args):
+    log_message(subsystem, LOG_ERROR, message, *args)
+
+# Put a finished line in the buffer, starting the background thread if it
+# isn't running yet.
+def log_write(now, subsystem, level, message):
+    Log["buffer"].append("%9.3f %-7s %s: %s\n"
+        % (now - Log["start"], LOG_LABELS.get(level, level), subsystem,
+           message))
+    if Log["thread"] is None:
+        with Log["lock"]:
+            if Log["thread"] is None:
+                Log["thread"] = threading.Thread(target=log_thread,
+                                    daemon=True, name="log")
+                Log["thread"].start()
+
+# Say how many messages were skipped, for every message whose second is
+# over (or for all of them if everything is true), so a message which
+# stops coming still gets its count shown.
+def log_skipped(everything=False):
+    now = perf_counter()
+    found = []
+    with Log["lock"]:
+        for (key, (second, shown, skipped)) in list(Log["counts"].items()):
+            if skipped and (everything or now - second >= 1):
+                Log["counts"][key] = (second, shown, 0)
+                found.append((key, skipped))
+    for ((subsystem, level, message), skipped) in found:
+        log_write(now, subsystem, level,
+            "(skipped %d more like %r)" % (skipped, message))
+
+# Write out everything in the buffer.
+def log_flush():
+    lines = []
+    buffer = Log["buffer"]
+    while buffer:
+        lines.append(buffer.popleft())
+    if lines:
+        stream = Log["stream"] or sys.stderr
+        stream.write("".join(lines))
+        stream.flush()
+
+# The background thread: write the buffer out every LOG_INTERVAL seconds.
+def log_thread():
+    while True:
+        sleep(LOG_INTERVAL)
+        log_skipped()
+        log_flush()
+
+# Write out the last messages when the program ends.
+def log_quit():
+    log_skipped(True)
+    log_flush()
+
+atexit.register(log_quit)
+
+if "MAZE_LOG" in os.environ:
+    log_config(os.environ["MAZE_LOG"])
@@ -2,175 +2,102 @@
 # maze.py
 # Playing with OpenGL
 
-from math           import radians, sin, cos, fmod, pi
+import sys
+import argparse
+# This must come before OpenGL is loaded, to set up release mode.
+from glconfig       import glconfig_describe
 import pygame
 from pygame.locals  import *
 from pygame.event   import Event
 from OpenGL.GL      import *
 from OpenGL.GLU     import *
 
+# The game state and physics live in physics.py.
+from physics        import *
+from state          import State
+from keys           import Key_Bindings, keys_check
+from replay         import Replay, replay_record_start, replay_record_key, \
+                           replay_record_stop, replay_save
+from perf           import perf_frame_start, perf_mark, perf_stats, \
+                           perf_current, perf_write_csv, PERF_PHASES
+from physthread     import physthread_running, physthread_start, \
+                           physthread_stop, physthread_key, physthread_pose
+from pacing         import PACING_POLICIES, pacing_init, \
+                           pacing_display_flags, pacing_idle_wait, \
+                           pacing_events, pacing_elapsed, pacing_wait, \
+                           pacing_fps
+from scale          import Scale, SCALE_MIN, SCALE_MAX, scale_init, \
+                           scale_begin, scale_end, scale_update, scale_quit
+from glcount        import glcount_install, glcount_end_setup, \
+                           glcount_end_frame, glcount_overlay_text, \
+                           glcount_summary
+
+# Drawing from vertex buffers needs NumPy. If we haven't got it we can
+# still use display lists.
+try:
+    import vbo
+except ImportError:
+    vbo = None
+
+# Working out the camera matrices ourselves needs NumPy too. If we haven't
+# got it OpenGL works them out instead.
+try:
+    import view
+except ImportError:
+    view = None
+
 # Data
 
 # Information about the display.
-Display = {
-    # The size of window we open.
-    "winsize":  (1024, 768),
-    # The framerate we are aiming for.
-    "fps":      80,
-}
-
-# This defines what all the keys do. Each keycode maps to a 2-element tuple;
-# the first says what to do on keydown, the second what to do on keyup.
-# The names are looked up as functions in the current module.
-Key_Bindings = {
-    K_ESCAPE:   (["event_post_quit"],               None),
-    K_q:        (["event_post_quit"],               None),
-    K_i:        (["camera_look_updown", 5],         None),
-    K_k:        (["camera_look_updown", -5],        None),
-    K_j:        (["camera_look_leftright", -5],     None),
-    K_l:        (["camera_look_leftright", 5],      None),
-    K_w:        (["player_walk", 1],                ["player_walk", 0]),
-    K_s:        (["player_walk", -1],               ["player_walk", 0]),
-    K_a:        (["player_strafe", -1],             ["player_strafe", 0]),
-    K_d:        (["player_strafe", 1],              ["player_strafe", 0]),
-    K_SPACE:    (["player_jump", True],             None),
-}
-
-# This defines the world (the level layout).
-World = {
-    # A list of all the floors. Floors are horizontal rectangles. Each
-    # floor has a dict with these keys:
-    #   coords      A tuple of (x1, y1, x2, y2, z) defining the rectangle
-    #   colour      A tuple of (red, green, blue)
-    #   win         True if this is a winning platform, False otherwise
-    "floors": [
-        { "coords":     (-10, -10, 10, 10, -1),
-          "colour":     (0.5, 0, 0),
-          "win":        False,
-        },
-        { "coords":     (-10, 10, 0, 15, -1),
-          "colour":     (0, 0.5, 0),
-          "win":        True,
-        },
-        { "coords":     (0, 10, 10, 15, -1),
-          "colour":     (0, 0, 0.6),
-          "win":        False,
-        },
-        { "coords":     (0, 0, 5, 5, 2),
-          "colour":     (1, 0, 1),
-          "win":        False,
-        },
-        { "coords":     (0, 6, 5, 11, 4),
-          "colour":     (1, 1, 0),
-          "win":        False,
-        },
-        { "coords":     (6, 6, 12, 11, 6),
-          "colour":     (1, 1, 1),
-          "win":        False,
-        }
-    ],
-
-    # We die if we fall this low.
-    "doom_z":   -20,
-}
-
-# This dict has information about the camera. The camera moves with the
-# player but has its own direction. Most of these values are just dummies
-# which will be set up by camera_init.
-Camera = {
-    # Are we up to date with the player position?
-    "uptodate": False,
-    # Where is the camera position, relative to the player position?
-    "offset":   [0, 0, 1],
-    # The current position of the camera.
-    "pos":      [0, 0, 0],
-    # The current camera angle, horizontal and vertical.
-    "angle":    [0, 0],
-    # The vector the player walks along.
-    "walk_vec": [0, 0, 0],
-    # The vector the player walks sideways along.
-    "strafe_vec": [0, 0, 0],
-}
-    
-# This dict has information about the player.
-Player = {
-    # Our current position
-    "pos":      [-1, 0, 0],
-    # Our current veolcity (our speed in the X, Y and Z directions)
-    "vel":      [0, 0, 0],
-    # Our current walk speed.
-    "walk":     0,
-    # Our current strafe speed.
-    "strafe":   0,
-    # True if we are currently jumping.
-    "jump":     False,
-}
-
-# The speeds at which the player walks, jumps and falls.
-# These are not in sensible units at the moment.
-Speed = {
-    "walk":     0.1,
-    "jump":     0.4,
-    "fall":     0.02,
+class DisplayState(State):
+    __slots__ = ("winsize", "fps", "pacing", "physics_thread", "renderer",
+                 "scale", "scale_min", "gl_count", "perf_csv")
+
+    def __init__(self):
+        # The size of window we open.
+        self.winsize    = (1024, 768)
+        # The framerate we are aiming for.
+        self.fps        = 80
+        # How to wait between frames: "fixed", "vsync" or "adaptive" (see
+        # pacing.py).
+        self.pacing     = "fixed"
+        # Run the physics on its own thread (see physthread.py), so slow
+        # frames don't hold it up?
+        self.physics_thread = True
+        # How to draw the world: "vbo" to use vertex buffers, or "list" to
+        # use a display list. We fall back to "list" if we can't use vertex
+        # buffers.
+        self.renderer   = "vbo"
+        # The scale to draw the world at (see scale.py), or None to turn it
+        # down when frames are too slow, but not below scale_min.
+        self.scale      = None
+        self.scale_min  = SCALE_MIN
+        # Count the OpenGL calls each frame makes (see glcount.py)?
+        self.gl_count   = False
+        # Where to save the frame timings when we quit, or None not to.
+        self.perf_csv   = "perf.csv"
+
+Display = DisplayState()
+
+# The performance overlay, which shows how long each part of the frame
+# is taking. F3 turns it on and off.
+Overlay = {
+    # Are we showing it?
+    "show":     False,
+    # How many frames to wait between updating the numbers.
+    "every":    20,
+    # How many frames until we update them next.
+    "wait":     0,
+    # The text as pixels ready for glDrawPixels, and its size.
+    "pixels":   None,
+    "size":     (0, 0),
+    # The font, once we've loaded it.
+    "font":     None,
 }
 
 # This holds display list numbers, to be used by the render functions.
 DL = {}
 
-# Vector operations
-# These are mathematical operations on 3D vectors. Maybe we should be using
-# a library instead?
-# Vectors are represented as 3-element lists. Currently passing in a 3-element
-# tuple will work as well.
-
-# Add two vectors
-def vec_add(a, b):
-    return [a[0]+b[0], a[1]+b[1], a[2]+b[2]]
-
-# Multiply a vector by a number
-def vec_mul(v, s):
-    return [v[0]*s, v[1]*s, v[2]*s]
-
-# Find the length of a vector
-def vec_norm(v):
-    return sqrt(v[0]*v[0] + v[1]*v[1] + v[2]*v[2])
-
-# Find a vector of length 1 in the same direction as v
-def vec_unit(v):
-    n = vec_norm(v)
-    return [v[0]/n, v[1]/n, v[2]/n]
-
-# Vector dot product
-def vec_dot(a, b):
-    return a[0]*b[0] + a[1]*b[1] + a[2]*b[2]
-
-# Vector cross product
-def vec_cross(a, b):
-    return [a[1]*b[2] - a[2]*b[1],
-            a[2]*b[0] - a[0]*b[2],
-            a[0]*b[1] - a[1]*b[0]]
-
-# Physics
-
-# Find the floor below a given position.
-# v is the point in space we want to start from.
-# Returns one of the dictionaries from World["floors"], or None.
-# This assumes floors are horizontal rectangles.
-def find_floor_below(v):
-    found = None
-    for f in World["floors"]:
-        c = f["coords"]
-        if v[0] < c[0] or v[1] < c[1]:
-            continue
-        if v[0] > c[2] or v[1] > c[3]:
-            continue
-        if v[2] < c[4]:
-            continue
-        if found and c[4] <= found["coords"][4]:
-            continue
-        found = f
-    return found
-
 # Drawing
 # These functions draw 3D objects. Most of them are used to build display
 # lists rather than called to render every frame.
@@ -229,13 +156,11 @@ def draw_origin_marker():
     glVertex3f(0, 0, 1)
     glEnd()
 
-FLOOR_THICKNESS = 0.2
-
-# Draw the floors out of World["floors"]. This breaks each rectangle into
+# Draw the floors out of World.floors. This breaks each rectangle into
 # two triangles but doesn't subdivide any further; this will probably need
 # changing when we get lights and/or textures.
 def draw_floors ():
-    for f in World["floors"]:
+    for f in World.floors:
         (x1, y1, x2, y2, z) = f["coords"]
         glColor(f["colour"])
         
@@ -282,6 +207,51 @@ def draw_floors ():
         glVertex3f(x2, y2, z)
         glEnd()
 
+# Draw the walls out of World.walls. Each wall is a box, drawn as six
+# quads.
+def draw_walls ():
+    for w in World.walls:
+        (x1, y1, z1, x2, y2, z2) = w["coords"]
+        glColor(w["colour"])
+
+        glBegin(GL_QUADS)
+        glNormal3f(0, 0, 1)
+        glVertex3f(x1, y1, z2)
+        glVertex3f(x2, y1, z2)
+        glVertex3f(x2, y2, z2)
+        glVertex3f(x1, y2, z2)
+
+        glNormal3f(0, 0, -1)
+        glVertex3f(x1, y1, z1)
+        glVertex3f(x1, y2, z1)
+        glVertex3f(x2, y2, z1)
+        glVertex3f(x2, y1, z1)
+
+        glNormal3f(0, -1, 0)
+        glVertex3f(x1, y1, z1)
+        glVertex3f(x2, y1, z1)
+        glVertex3f(x2, y1, z2)
+        glVertex3f(x1, y1, z2)
+
+        glNormal3f(0, 1, 0)
+        glVertex3f(x1, y2, z2)
+        glVertex3f(x2, y2, z2)
+        glVertex3f(x2, y2, z1)
+        glVertex3f(x1, y2, z1)
+
+        glNormal3f(-1, 0, 0)
+        glVertex3f(x1, y1, z1)
+        glVertex3f(x1, y1, z2)
+        glVertex3f(x1, y2, z2)
+        glVertex3f(x1, y2, z1)
+
+        glNormal3f(1, 0, 0)
+        glVertex3f(x2, y1, z1)
+        glVertex3f(x2, y2, z1)
+        glVertex3f(x2, y2, z2)
+        glVertex3f(x2, y1, z2)
+        glEnd()
+
 def draw_world_lights ():
     glLightfv(GL_LIGHT0, GL_AMBIENT,    [0.3, 0.3, 0.3, 1])
     glLightfv(GL_LIGHT0, GL_DIFFUSE,    [0.7, 0.7, 0.7, 1])
@@ -290,10 +260,22 @@ def draw_world_lights ():
 # Init
 # Initialise various parts of the game.
 
-# Start up pygame and open the window.
+# Start up pygame and open the window. We only start the parts of pygame
+# we use (pygame.init would start the sound and joysticks as well, which
+# can be slow), and the font only when the overlay is first shown.
 def init_display():
-    pygame.init()
-    pygame.display.set_mode(Display["winsize"], OPENGL|DOUBLEBUF)
+    keys_check(pygame)
+    pygame.display.init()
+    try:
+        pygame.display.set_mode(Display.winsize, OPENGL|DOUBLEBUF,
+            **pacing_display_flags(Display.pacing))
+    except pygame.error:
+        if Display.pacing != "vsync":
+            raise
+        # We can't have vsync here, so just draw at Display.fps.
+        print("Can't use vsync, using fixed pacing")
+        Display.pacing = "fixed"
+        pygame.display.set_mode(Display.winsize, OPENGL|DOUBLEBUF)
 
 # Set up the initial OpenGL state, including the projection matrix.
 def init_opengl():
@@ -306,23 +288,43 @@ def init_opengl():
 
     glPointSize(5)
 
-    winsize = Display["winsize"]
+    winsize = Display.winsize
     aspect  = winsize[0]/winsize[1]
 
     glMatrixMode(GL_PROJECTION)
-    glLoadIdentity()
-    gluPerspective(45.0, aspect, 0.1, 100.0)
+    if view:
+        view.view_set_projection(45.0, aspect, 0.1, 100.0)
+        glLoadMatrixf(view.View["proj_gl"])
+    else:
+        glLoadIdentity()
+        gluPerspective(45.0, aspect, 0.1, 100.0)
 
     glMatrixMode(GL_MODELVIEW)
 
+# Start counting the OpenGL calls made by the modules which draw (see
+# glcount.py).
+def init_gl_count():
+    import scale
+    modules = [sys.modules[__name__], scale]
+    if vbo:
+        modules.append(vbo)
+    glcount_install(*modules)
+
 # Build a display list representing the world, so we don't have to
-# calculate all the triangles every frame.
+# calculate all the triangles every frame. If we can, we put the floors in
+# a vertex buffer instead, which is much quicker to build for big worlds.
 def init_world():
+    if Display.renderer == "vbo" and vbo and vbo.vbo_supported():
+        vbo.vbo_init()
+        return
+
+    Display.renderer = "list"
     dl = glGenLists(1)
     glNewList(dl, GL_COMPILE)
     #draw_cube_10()
     draw_world_lights()
     draw_floors()
+    draw_walls()
     draw_origin_marker()
     glEndList()
 
@@ -336,12 +338,26 @@ def init_world():
 def render_clear():
     glClear(GL_COLOR_BUFFER_BIT|GL_DEPTH_BUFFER_BIT)
 
-# Position the camera based on the player's current position. We put
-# the camera 1 unit above the player's position.
-def render_camera():
-    pos     = Camera["pos"]
-    angle   = Camera["angle"]
-    
+# Where to draw the camera from and which way it looks, as (pos, angle).
+# We put the camera 1 unit above the player's position. alpha says how far
+# between the last two physics ticks we are (see physics_advance). When
+# the physics is on its own thread, physthread_pose gives us this instead.
+def render_pose(alpha):
+    return (camera_render_pos(alpha), tuple(Camera.angle))
+
+# Position the camera. view.py works out the matrix, only when the camera
+# has moved or turned, and we load it in one go.
+def render_camera(pose):
+    (pos, angle) = pose
+    if view:
+        view.view_update(pos, angle)
+        glLoadMatrixf(view.View["view_gl"])
+    else:
+        render_camera_gl(pos, angle)
+
+# Position the camera by asking OpenGL to do the sums, if we can't do
+# them with NumPy. This makes the same matrix as view_update in view.py.
+def render_camera_gl(pos, angle):
     # Clear the previous camera position
     glLoadIdentity()
     # Annoyingly, the camera starts pointing down (-Z).
@@ -364,182 +380,101 @@ def render_camera():
     # are moving the world rather than moving the camera.
     glTranslatef(-pos[0], -pos[1], -pos[2])
 
-# This is called to render every frame. We clear the window, position the
-# camera, and then call the display list to draw the world.
-def render():
-    render_clear()
-    render_camera()
-    glCallList(DL["world"])
-
-# Camera
-
-# Tell the camera it needs to update itself
-def camera_needs_update ():
-    Camera["uptodate"] = False
-
-# Update the vectors for moving the player.
-def camera_update_movement_vectors ():
-    angle   = Camera["angle"]
-
-    # This is the angle we walk along, in radians
-    walk    = radians(angle[0])
-
-    # This is the angle we walk sideways along
-    strafe  = walk - pi/2
-
-    # This is the direction we walk forwards
-    Camera["walk_vec"] = [cos(walk), sin(walk), 0]
-
-    # This is the direction we walk right
-    Camera["strafe_vec"] = [cos(strafe), sin(strafe), 0]
-
-    print("Camera angle", angle)
-    #print("New vectors walk", Camera["walk_vec"],
-    #        "strafe", Camera["strafe_vec"])
-    
-    camera_needs_update()
-
-# Look up or down.
-def camera_look_updown (by):
-    angle = Camera["angle"]
-    
-    new = angle[1] + by
-    if (new > 90):
-        new = 90
-    if (new < -90):
-        new = -90
-    angle[1] = new
-
-    print("New camera angle", angle)    
-    camera_needs_update()
-
-# Look left or right. -ve means look left.
-def camera_look_leftright (by):
-    angle = Camera["angle"]
-
-    # This fmod() function divides by 360 and takes the remainder.
-    # This makes sure we are always between 0 and 360 degrees.
-    # We subtract 'by' because angles are measured CCW but we want
-    # a +ve 'by' to turn us right. Otherwise it's confusing.
-    angle[0] = fmod(angle[0] - by, 360)
-    if (angle[0] < 0):
-        angle[0] += 360
-    
-    camera_update_movement_vectors()
-
-# Update the camera position based on the player position
-def camera_update_position ():
-    # If we are already up to date there is nothing to do
-    if (Camera["uptodate"]):
-        return
-
-    # Find our position from the player position and our offset.
-    pos = vec_add(Player["pos"], Camera["offset"])
-    Camera["pos"] = pos
-
-    print("Camera position", pos)
-
-    Camera["uptodate"] = True
-
-def camera_init ():
-    camera_update_movement_vectors()
-    camera_update_position()
-
-def camera_physics ():
-    camera_update_position()
+# Draw the world from the vertex buffer. This draws the same things as
+# the display list built by init_world.
+def render_world_vbo():
+    draw_world_lights()
+    vbo.vbo_draw()
+    draw_origin_marker()
 
-# Player
+# Turn the performance overlay on or off.
+def overlay_toggle():
+    Overlay["show"] = not Overlay["show"]
+    Overlay["wait"] = 0
+
+# Make the lines of text for the overlay.
+def overlay_text():
+    stats = perf_stats()
+    lines = ["%-8s %7s %7s" % ("ms", "p50", "p99")]
+    for phase in PERF_PHASES:
+        if phase in stats:
+            lines.append("%-8s %7.2f %7.2f" % ((phase,) + stats[phase]))
+    if Display.renderer == "vbo":
+        lines.append("chunks   %d/%d" %
+            (vbo.VBO["visible"], vbo.vbo_chunk_count()))
+    lines.append("scale    %.2f" % Scale["scale"])
+    return lines + glcount_overlay_text()
+
+# Turn the overlay text into pixels. This is slow-ish so we only do it
+# every few frames.
+def overlay_update():
+    if Overlay["font"] is None:
+        pygame.font.init()
+        Overlay["font"] = pygame.font.SysFont("monospace", 14)
+    font    = Overlay["font"]
+    lines   = [font.render(l, True, (255, 255, 255), (0, 0, 0))
+                for l in overlay_text()]
+    width   = max(l.get_width() for l in lines)
+    height  = sum(l.get_height() for l in lines)
+    surface = pygame.Surface((width, height))
+    y = 0
+    for l in lines:
+        surface.blit(l, (0, y))
+        y += l.get_height()
+
+    # OpenGL wants the bottom row first.
+    Overlay["pixels"]   = pygame.image.tostring(surface, "RGBA", True)
+    Overlay["size"]     = (width, height)
+
+# Draw the overlay in the top left corner of the window.
+def render_overlay():
+    if Overlay["wait"] <= 0:
+        overlay_update()
+        Overlay["wait"] = Overlay["every"]
+    Overlay["wait"] -= 1
+
+    (width, height) = Overlay["size"]
+    glDisable(GL_LIGHTING)
+    glDisable(GL_DEPTH_TEST)
+    glWindowPos2i(10, Display.winsize[1] - 10 - height)
+    glDrawPixels(width, height, GL_RGBA, GL_UNSIGNED_BYTE, Overlay["pixels"])
+    glEnable(GL_DEPTH_TEST)
+    glEnable(GL_LIGHTING)
 
-# Nothing to do at the moment.
-def init_player():
-    pass
+# What the last frame we drew showed (see render_key), or None if we need
+# to draw the next frame whatever it shows.
+Drawn = {"key": None}
 
-# The player has died...
-def player_die ():
-    print("AAAARGH!!!")
-    event_post_quit()
+# Everything which decides what a frame drawn with the camera at pose
+# would look like: where the camera is and which way it is looking, and
+# the world. The Player isn't drawn, so it only matters through the camera.
+def render_key(pose):
+    return (tuple(pose[0]), pose[1], World.changes)
 
-# The player has won...
-def player_win ():
-    print("YaaaY!!!!")
-    event_post_quit()
+# Would a frame with this key look different from the last one we drew?
+# The overlay changes by itself, so while it is showing we always draw.
+def render_needed(key):
+    return Overlay["show"] or key != Drawn["key"]
 
-# Set the speed we're trying to walk. We will only move if we're on the
-# ground.
-def player_walk (to):
-    Player["walk"] = to * Speed["walk"]
-
-# Set the speed we're trying to walk sideways. 
-def player_strafe (to):
-    Player["strafe"] = to * Speed["walk"]
-
-# Set the flag to show we're jumping. We will only jump if we're on the
-# ground.
-def player_jump (to):
-    Player["jump"] = to
-
-def player_physics(ticks):
-    pos     = Player["pos"]
-    vel     = Player["vel"]
-    walk    = Player["walk"]
-    strafe  = Player["strafe"]
-    jump    = Player["jump"]
-
-    walk_vec    = Camera["walk_vec"]
-    strafe_vec  = Camera["strafe_vec"]
-
-    # Assume we are falling.
-    falling = True
-
-    # Find the floor below us. If there is a floor, and we are close
-    # enough to it, we are not falling.
-    floor = find_floor_below(pos)
-    if (floor):
-        floor_z = floor["coords"][4] + 0.01
-        if (pos[2] <= floor_z):
-            falling = False
-
-    if (falling):
-        # If we are falling, increase our velocity in the downwards z direction
-        # by the fall speed (actually an acceleration). 
-        vel[2] -= Speed["fall"]
+# This is called to render every frame. We clear the window, position the
+# camera, and then call the display list to draw the world. The camera is
+# drawn at pose if it is given, otherwise at render_pose(alpha). If we are
+# drawing at a lower resolution (see scale.py) the world is drawn smaller
+# and then stretched over the window.
+def render(alpha=1, pose=None):
+    if pose is None:
+        pose = render_pose(alpha)
+    scaled = scale_begin()
+    render_clear()
+    render_camera(pose)
+    if Display.renderer == "vbo":
+        render_world_vbo()
     else:
-        # Otherwise, start by multiplying our walk vector by our
-        # walk speed (which might be negative to walk backwards).
-        vel = vec_mul(walk_vec, walk)
-        # Then add our strafe (sideways) vector.
-        vel = vec_add(vel, vec_mul(strafe_vec, strafe))
-        # Then, if we are jumping, set our z velocity to be the jump speed
-        # and turn off the jump (we only jump once).
-        if (jump):
-            vel[2] = Speed["jump"]
-            player_jump(False)
-
-    # Save our velocity for next time
-    Player["vel"] = vel
-
-    # If there is nothing to do, return
-    if (vel[0] == 0 and vel[1] == 0 and vel[2] == 0):
-        return
-
-    # Take the velocity vector we have calculated and add it to our position
-    # vector to give our new position.
-    pos = vec_add(pos, vel)    
-
-    # If we have fallen through the floor put us back on top of the floor
-    # so that we land on it.
-    if (floor and pos[2] < floor_z):
-        pos[2] = floor_z
-
-    print("Player move from", Player["pos"], "to", pos)
-
-    # If we fall too far we die.
-    if (pos[2] < World["doom_z"]):
-        player_die()
-
-    # Save our new position and tell the camera we've moved.
-    Player["pos"] = pos
-    camera_needs_update()
+        glCallList(DL["world"])
+    if scaled:
+        scale_end()
+    if Overlay["show"]:
+        render_overlay()
 
 # Events
 # These functions manage things that happen while the program is running.
@@ -548,6 +483,10 @@ def player_physics(ticks):
 def event_post_quit ():
     pygame.event.post(Event(QUIT))
 
+# The physics calls this when the player wins or dies. We just quit.
+def event_game_over (how):
+    event_post_quit()
+
 # Handle a key-up or key-down event. k is the keycode, down is True or False.
 def handle_key(k, down):
     # If the keycode is not in our dict, we have nothing to do.
@@ -555,13 +494,27 @@ def handle_key(k, down):
         return
 
     # Find the entry for the keycode, and choose the first part for keydown
-    # and the second for keyup. If we have None then there is nothing to do.
+    # and the second for keyup.
     bindings = Key_Bindings[k]
     if (down):
         binding = bindings[0]
     else:
         binding = bindings[1]
 
+    # If the physics is on its own thread, send it the key. It saves the
+    # key if we are recording, and runs the binding if it is a physics one,
+    # before its next tick.
+    if (physthread_running()):
+        if (binding is not None and binding_is_physics(binding)):
+            physthread_key(k, down, binding)
+            return
+        physthread_key(k, down, None)
+
+    # Otherwise, if we are recording, save the key so it can be played back.
+    elif (Replay["recording"]):
+        replay_record_key(k, down)
+
+    # If we have None then there is nothing to do.
     if (binding is None):
         return
 
@@ -579,16 +532,51 @@ def handle_key(k, down):
 # This is the main loop that runs the whole game. We wait for events
 # and handle them as we need to.
 def mainloop():
-    # Set up a clock to keep track of the framerate.
-    clock   = pygame.time.Clock()    
-    fps     = Display["fps"]
-    
+    # Get ready to wait between frames (see pacing.py).
+    pacing_init(Display.pacing, Display.fps)
+
+    # Start the physics thread, if we are using one. From now on only it
+    # changes the game; we just draw what it tells us.
+    threaded = Display.physics_thread
+    if threaded:
+        physthread_start()
+    try:
+        mainloop_frames(threaded)
+    finally:
+        if threaded:
+            physthread_stop()
+
+# Draw frames until we quit. threaded says whether the physics is running
+# on its own thread.
+def mainloop_frames(threaded):
     while True:
+        # Start timing the frame. Each perf_mark below records how long
+        # that part of the frame took.
+        perf_frame_start()
+
+        # If running the physics wouldn't change anything, and we have
+        # already drawn what we can see, sleep until a key is pressed.
+        # The player isn't moving, so where we are between ticks doesn't
+        # matter.
+        if threaded:
+            (pose, idle) = physthread_pose()
+        else:
+            (pose, idle) = (render_pose(1), physics_idle())
+        if idle and not render_needed(render_key(pose)):
+            pacing_idle_wait()
+            perf_mark("wait")
+
         # Check for events and deal with them.
-        events = pygame.event.get()
+        events = pacing_events()
         for event in events:
             if event.type == QUIT:
-                print("FPS: ", clock.get_fps())
+                print("FPS: ", pacing_fps())
+                if Display.renderer == "vbo":
+                    vbo.vbo_print_stats()
+                if Display.perf_csv:
+                    perf_write_csv(Display.perf_csv)
+                for line in glcount_summary():
+                    print(line)
                 return
 
             elif event.type == KEYDOWN:
@@ -597,22 +585,104 @@ def mainloop():
             elif event.type == KEYUP:
                 handle_key(event.key, False)
 
-        # Draw the frame. We draw on the 'back of the page' and then
-        # flip the page over so we don't see a half-drawn picture.        
-        render()
-        pygame.display.flip()
-
-        # Run the physics. Pass in the time taken since the last frame.
-        player_physics(clock.get_time())
-        camera_physics()
+            elif event.type == VIDEOEXPOSE:
+                # The window needs drawing again.
+                Drawn["key"] = None
+        perf_mark("events")
+
+        # Run the physics. Pass in the time taken since the last frame;
+        # this runs however many fixed-length ticks fit into that time.
+        # If the physics has its own thread, just see where it has got to.
+        if threaded:
+            (pose, idle) = physthread_pose()
+        else:
+            pose = render_pose(physics_advance(pacing_elapsed()))
+        perf_mark("physics")
+
+        # Draw the frame, if it would look different from the last one.
+        # We draw on the 'back of the page' and then flip the page over
+        # so we don't see a half-drawn picture.
+        key     = render_key(pose)
+        drew    = render_needed(key)
+        if drew:
+            render(pose=pose)
+            Drawn["key"] = key
+            perf_mark("render")
+            pygame.display.flip()
+            perf_mark("flip")
+            glcount_end_frame()
+
+            # Tell scale.py how long drawing took, so it can change the
+            # scale if we are too slow. With vsync the flip waits for the
+            # screen, which isn't time spent drawing, so only count that
+            # time with the other policies.
+            ms = perf_current("render")
+            if Display.pacing != "vsync":
+                ms += perf_current("flip")
+            scale_update(ms)
 
         # Wait if necessary so that we don't draw more frames per second
         # than we want. Any more is just wasting processor time.
-        clock.tick(fps)
+        pacing_wait(drew)
+        perf_mark("wait")
 
 # Main
 
-def main():
+# Read a scale from the command line: a number more than 0 and at most
+# SCALE_MAX, like scale_init wants.
+def arg_scale(text):
+    try:
+        scale = float(text)
+    except ValueError:
+        scale = None
+    if scale is None or not 0 < scale <= SCALE_MAX:
+        raise argparse.ArgumentTypeError(
+            "must be a number more than 0 and at most %g, not %r"
+            % (SCALE_MAX, text))
+    return scale
+
+# Read --scale: a scale, or "auto", which gives None.
+def arg_scale_or_auto(text):
+    if text == "auto":
+        return None
+    return arg_scale(text)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play the maze game.")
+    parser.add_argument("level", nargs="?",
+        help="level file to play instead of the built-in level")
+    parser.add_argument("--record",
+        help="record the keys pressed to this file (see replay.py)")
+    parser.add_argument("--pacing", choices=PACING_POLICIES,
+        default=Display.pacing,
+        help="how to wait between frames (default %s)" % Display.pacing)
+    parser.add_argument("--no-physics-thread", action="store_true",
+        help="run the physics between frames instead of on its own thread")
+    parser.add_argument("--gl-count", action="store_true",
+        help="count the OpenGL calls each frame makes, and show them in the"
+             " overlay and when we quit")
+    parser.add_argument("--scale", type=arg_scale_or_auto, default=None,
+        help="draw the world at this fraction of the window size, or 'auto'"
+             " to lower it when frames are slow (default auto)")
+    parser.add_argument("--scale-min", type=arg_scale,
+        default=Display.scale_min,
+        help="the lowest scale 'auto' can use (default %g)"
+             % Display.scale_min)
+    args = parser.parse_args(argv)
+    Display.scale = args.scale
+    Display.scale_min = args.scale_min
+    Display.gl_count = args.gl_count
+    Display.pacing = args.pacing
+    if args.no_physics_thread:
+        Display.physics_thread = False
+
+    # If we were given a level file, play that instead of the built-in level.
+    if args.level:
+        from level import level_use
+        level_use(args.level)
+
+    print("OpenGL:", glconfig_describe())
+
     # Open the window and setup pygame
     init_display()
 
@@ -620,20 +690,33 @@ def main():
     # runs even if there's an error. Otherwise the window doesn't go away.
     try:
         # Run the other initialisation
+        if Display.gl_count:
+            init_gl_count()
         init_opengl()
+        scale_init(Display.winsize, Display.fps, Display.scale,
+            Display.scale_min)
         init_world()
+        glcount_end_setup()
         init_player()
         camera_init()
+        Game.on_over = event_game_over
+        if args.record:
+            replay_record_start(args.level)
 
         # Go into the main loop, which doesn't return until we quit the game.
         mainloop()
     finally:
-        # Make sure the window is closed when we finish.
+        if args.record:
+            replay_record_stop()
+            replay_save(args.record)
+        # Throw away the scaling texture while we still have OpenGL, and
+        # make sure the window is closed when we finish.
+        scale_quit()
         pygame.display.quit()
 
-main()
+if __name__ == "__main__":
+    main()
 
-# walls
 # Jump through platforms
 # hold a direction
 #looking up and down
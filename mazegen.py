@@ -0,0 +1,198 @@
+# mazegen.py
+# Make levels instead of placing every floor by hand.
+#
+# Each generator makes a level with about the number of floors asked for,
+# starting from a floor under the place the Player starts (-1, 0, 0) and
+# ending with a winning platform which can be reached from there. The same
+# seed always gives the same level.
+#
+# The kinds of level are:
+#   maze    a grid maze: square platforms joined by narrow bridges, with
+#           gaps too wide to jump where the maze has walls
+#   tower   platforms spiralling upwards, each a small jump above the last
+#   chain   a long wandering line of platforms with gaps to jump
+#
+# The gaps and steps are kept well inside what the default Speed settings
+# can jump: a jump goes about 4 units up and 4 units along.
+#
+# Run 'python mazegen.py KIND COUNT FILE [SEED]' to save a level file
+# (see level.py).
+
+import sys
+import random
+import numpy as np
+
+from level          import LevelFloors, RECORD_FLOATS, level_save
+
+# The colour of winning platforms.
+WIN_COLOUR = (0, 1, 0)
+
+# How far below the lowest floor we die.
+DOOM_DEPTH = 20
+
+# Maze layout: each maze cell is a square platform MAZE_CELL across, one
+# every MAZE_PITCH units, and the bridges between them are MAZE_BRIDGE wide.
+MAZE_CELL       = 4
+MAZE_PITCH      = 10
+MAZE_BRIDGE     = 2
+
+# Collects floors as rows of coords, colour and win, and makes a world
+# out of them at the end.
+def floors_new(count):
+    return {"records": np.zeros((count, RECORD_FLOATS), dtype="<f4"),
+            "n": 0}
+
+def floors_add(floors, coords, colour, win=False):
+    if floors["n"] == len(floors["records"]):
+        floors["records"] = np.concatenate(
+            (floors["records"], np.zeros_like(floors["records"])))
+    floors["records"][floors["n"]] = coords + colour + (1 if win else 0,)
+    floors["n"] += 1
+
+def floors_world(floors):
+    records = floors["records"][:floors["n"]]
+    return {
+        "floors":   LevelFloors(records),
+        "walls":    [],
+        "doom_z":   float(records[:,4].min()) - DOOM_DEPTH,
+    }
+
+# A random colour which isn't too dark and isn't the winning green.
+def random_colour(rng):
+    return (rng.uniform(0.3, 1), rng.uniform(0, 0.6), rng.uniform(0.3, 1))
+
+# Make a grid maze with about count floors. Every cell has a platform and
+# every passage a bridge, so there are about two floors per cell. The maze
+# is made by a random depth-first walk, so every cell can be reached; the
+# winning platform is the cell furthest along the walk from the start.
+def gen_maze(count, seed=0):
+    rng     = random.Random(seed)
+    side    = max(2, int((count / 2) ** 0.5))
+    floors  = floors_new(side * side * 2)
+
+    # Cell (0, 0) is centred on where the Player starts.
+    def cell_coords(cx, cy):
+        x = cx * MAZE_PITCH - 1 - MAZE_CELL/2
+        y = cy * MAZE_PITCH - MAZE_CELL/2
+        return (x, y, x + MAZE_CELL, y + MAZE_CELL)
+
+    seen    = {(0, 0)}
+    stack   = [(0, 0)]
+    depth   = {(0, 0): 0}
+    while stack:
+        (cx, cy) = stack[-1]
+        nexts = [(cx + dx, cy + dy)
+                 for (dx, dy) in ((1, 0), (-1, 0), (0, 1), (0, -1))
+                 if 0 <= cx + dx < side and 0 <= cy + dy < side
+                    and (cx + dx, cy + dy) not in seen]
+        if not nexts:
+            stack.pop()
+            continue
+        (nx, ny) = rng.choice(nexts)
+        seen.add((nx, ny))
+        depth[(nx, ny)] = len(stack)
+        stack.append((nx, ny))
+
+        # A bridge across the gap between the two cells.
+        (ax1, ay1, ax2, ay2) = cell_coords(min(cx, nx), min(cy, ny))
+        h = (MAZE_CELL - MAZE_BRIDGE) / 2
+        if nx != cx:
+            bridge = (ax2, ay1 + h, ax2 + MAZE_PITCH - MAZE_CELL, ay2 - h, 0)
+        else:
+            bridge = (ax1 + h, ay2, ax2 - h, ay2 + MAZE_PITCH - MAZE_CELL, 0)
+        floors_add(floors, bridge, (0.4, 0.4, 0.4))
+
+    goal = max(depth, key=lambda c: (depth[c], c))
+    for cy in range(side):
+        for cx in range(side):
+            win = (cx, cy) == goal
+            floors_add(floors, cell_coords(cx, cy) + (0,),
+                WIN_COLOUR if win else random_colour(rng), win)
+
+    return floors_world(floors)
+
+# Make a tower of count platforms spiralling upwards. Each platform is
+# 3 units across, up to 1.5 units higher than the last and 1 to 1.5 units
+# away from it, going round a square.
+def gen_tower(count, seed=0):
+    rng     = random.Random(seed)
+    floors  = floors_new(count)
+    size    = 3
+    # Walk round a square, turning every few steps.
+    dirs    = ((1, 0), (0, 1), (-1, 0), (0, -1))
+    x       = -1 - size/2
+    y       = -size/2
+    z       = 0
+    for i in range(count):
+        win = i == count - 1
+        floors_add(floors, (x, y, x + size, y + size, z),
+            WIN_COLOUR if win else random_colour(rng), win)
+        (dx, dy) = dirs[(i // 4) % 4]
+        step = size + rng.uniform(1, 1.5)
+        x += dx * step
+        y += dy * step
+        z += rng.uniform(0.5, 1.5)
+
+    return floors_world(floors)
+
+# Make a chain of count platforms wandering across the world. Each
+# platform is 2 to 4 units across, with a gap of up to 1.5 units to the
+# next one, which can be up to 1.5 units higher or lower.
+def gen_chain(count, seed=0):
+    rng     = random.Random(seed)
+    floors  = floors_new(count)
+    (x, y, z) = (-1.0, 0.0, 0.0)
+    (dx, dy) = (1, 0)
+    (w, h)  = (rng.uniform(2, 4), rng.uniform(2, 4))
+    for i in range(count):
+        win = i == count - 1
+        floors_add(floors, (x - w/2, y - h/2, x + w/2, y + h/2, z),
+            WIN_COLOUR if win else random_colour(rng), win)
+
+        # Sometimes turn. We only ever go along +X, +Y or -Y, and never
+        # straight from +Y to -Y, so the chain never doubles back on
+        # itself. Platforms either side of a corner can still overlap a
+        # little when seen from above, at different heights.
+        if rng.random() < 0.2:
+            if dx:
+                (dx, dy) = rng.choice(((0, 1), (0, -1)))
+            else:
+                (dx, dy) = (1, 0)
+
+        (nw, nh) = (rng.uniform(2, 4), rng.uniform(2, 4))
+        gap = rng.uniform(0.5, 1.5)
+        x += dx * (w/2 + gap + nw/2)
+        y += dy * (h/2 + gap + nh/2)
+        z += rng.uniform(-1.5, 1.5)
+        (w, h) = (nw, nh)
+
+    return floors_world(floors)
+
+GENERATORS = {
+    "maze":     gen_maze,
+    "tower":    gen_tower,
+    "chain":    gen_chain,
+}
+
+# Make a level of the given kind. Returns a level dict (see WorldState
+# in state.py). Raises ValueError if count is less than 1, as a level
+# needs at least a floor to start on.
+def gen_level(kind, count, seed=0):
+    if count < 1:
+        raise ValueError("a level needs at least 1 floor, not %d" % count)
+    return GENERATORS[kind](count, seed)
+
+def main(argv):
+    if len(argv) not in (4, 5) or argv[1] not in GENERATORS:
+        print("Usage: python mazegen.py KIND COUNT FILE [SEED]")
+        print("KIND is one of:", ", ".join(sorted(GENERATORS)))
+        return 1
+    if int(argv[2]) < 1:
+        print("COUNT must be at least 1")
+        return 1
+    seed = int(argv[4]) if len(argv) == 5 else 0
+    level_save(argv[3], gen_level(argv[1], int(argv[2]), seed))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,95 @@
+# offscreen.py
+# Make an OpenGL context with no window.
+#
+# Benchmarks and tests need to draw things on machines with no display.
+# EGL can give us an OpenGL context without any window at all (Mesa calls
+# this 'surfaceless'), and we draw into a framebuffer object instead of
+# the screen. With Mesa's llvmpipe this works with no graphics card too.
+#
+# PyOpenGL decides how to talk to OpenGL when it is first imported, so
+# this module must be imported before anything else imports OpenGL.
+
+import os
+os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+import glconfig
+
+import ctypes
+import OpenGL
+if not OpenGL.ERROR_CHECKING:
+    # PyOpenGL's EGL module goes wrong when error checking is off (see
+    # glconfig.py), because it doesn't set _error_checker. Set it for it.
+    from OpenGL.raw.EGL import _errors
+    if not hasattr(_errors, "_error_checker"):
+        _errors._error_checker = None
+from OpenGL         import EGL
+from OpenGL.GL      import *
+
+# This holds the context and framebuffer once they are made.
+Offscreen = {}
+
+# Make an OpenGL context and a framebuffer of the given size (width,
+# height) to draw into, and make them current. Raises RuntimeError if
+# we can't.
+def offscreen_init(size):
+    display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+    if not EGL.eglInitialize(display, None, None):
+        raise RuntimeError("can't initialise EGL")
+    EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+
+    attrs   = (EGL.EGLint * 5)(
+        EGL.EGL_SURFACE_TYPE,       EGL.EGL_PBUFFER_BIT,
+        EGL.EGL_RENDERABLE_TYPE,    EGL.EGL_OPENGL_BIT,
+        EGL.EGL_NONE)
+    config  = EGL.EGLConfig()
+    count   = EGL.EGLint()
+    if (not EGL.eglChooseConfig(display, attrs, ctypes.pointer(config), 1,
+                ctypes.pointer(count))
+            or count.value < 1):
+        raise RuntimeError("no EGL config for desktop OpenGL")
+
+    context = EGL.eglCreateContext(display, config, EGL.EGL_NO_CONTEXT, None)
+    if not context:
+        raise RuntimeError("can't create an EGL context")
+    if not EGL.eglMakeCurrent(display, EGL.EGL_NO_SURFACE,
+            EGL.EGL_NO_SURFACE, context):
+        raise RuntimeError("can't make the EGL context current")
+
+    Offscreen["display"]    = display
+    Offscreen["context"]    = context
+    offscreen_framebuffer(size)
+
+# Make a framebuffer with colour and depth buffers of the given size, and
+# draw into it from now on.
+def offscreen_framebuffer(size):
+    (width, height) = size
+
+    fb = glGenFramebuffers(1)
+    glBindFramebuffer(GL_FRAMEBUFFER, fb)
+    (colour, depth) = glGenRenderbuffers(2)
+
+    glBindRenderbuffer(GL_RENDERBUFFER, colour)
+    glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, width, height)
+    glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0,
+        GL_RENDERBUFFER, colour)
+
+    glBindRenderbuffer(GL_RENDERBUFFER, depth)
+    glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24,
+        width, height)
+    glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT,
+        GL_RENDERBUFFER, depth)
+
+    if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+        raise RuntimeError("framebuffer is not complete")
+
+    glViewport(0, 0, width, height)
+    Offscreen["framebuffer"]    = fb
+    Offscreen["size"]           = size
+
+# Stop using the context.
+def offscreen_quit():
+    if "display" in Offscreen:
+        EGL.eglMakeCurrent(Offscreen["display"], EGL.EGL_NO_SURFACE,
+            EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+        EGL.eglTerminate(Offscreen["display"])
+        Offscreen.clear()
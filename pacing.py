@@ -0,0 +1,127 @@
+# pacing.py
+# Decide how long to wait between frames, and wait without using the
+# processor.
+#
+# mainloop in maze.py used to draw and flip a frame Display.fps times a
+# second whatever was going on, which kept one processor busy even with
+# nobody playing. Now it only draws a frame if it would look different from
+# the last one (see render_needed in maze.py), and when the game is idle
+# (see physics_idle in physics.py) and there is nothing new to draw, it
+# sleeps in pygame.event.wait until a key is pressed, for up to
+# PACING_IDLE_WAIT milliseconds at a time. A key wakes it straight away,
+# so waiting doesn't make the game any slower to respond. The time spent
+# idle isn't given to the physics afterwards, as nothing would have
+# happened in it anyway.
+#
+# While things are moving, how we wait between frames is set by the
+# policy:
+#   fixed       draw at most fps frames a second, sleeping in between with
+#               pygame's Clock, as the game always used to.
+#   vsync       let pygame.display.flip wait for the screen to refresh, so
+#               we draw one frame per refresh. This needs the display to be
+#               opened with vsync; see pacing_display_flags.
+#   adaptive    draw at most fps frames a second, but wait with
+#               pygame.event.wait rather than sleeping, so a key pressed
+#               part way through the wait is handled and drawn straight
+#               away instead of at the next frame.
+# Frames we don't draw are paced with the fixed policy, since there is no
+# flip to wait on.
+
+import pygame
+from pygame.locals  import *
+from time           import perf_counter
+
+PACING_POLICIES = ("fixed", "vsync", "adaptive")
+
+# The longest we sleep at once when idle, in milliseconds. We wake up this
+# often even if nothing happens, so the window is never stuck for long.
+PACING_IDLE_WAIT = 250
+
+# The most frames a second we draw with the vsync policy. If the driver
+# doesn't really do vsync, flip doesn't wait at all, and without this we
+# would draw frames as fast as we could.
+PACING_VSYNC_MAX = 240
+
+# The events mainloop uses. Everything else (like the mouse moving over
+# the window) is thrown away by pygame, so it doesn't wake us up.
+PACING_EVENTS = [QUIT, KEYDOWN, KEYUP, VIDEOEXPOSE]
+
+# How we are pacing frames:
+#   policy      one of PACING_POLICIES
+#   fps         the most frames a second to draw
+#   clock       a pygame Clock, used for waiting and to measure the fps
+#   last        when pacing_elapsed was last called, from perf_counter
+#   start       when the frame started, from perf_counter
+#   pending     events pygame.event.wait gave us which haven't been
+#               handled yet
+Pacing = {}
+
+# Get ready to pace frames. This must be called after the display has
+# been opened.
+def pacing_init(policy, fps):
+    if policy not in PACING_POLICIES:
+        raise ValueError("unknown pacing policy %r" % (policy,))
+    Pacing["policy"]    = policy
+    Pacing["fps"]       = fps
+    Pacing["clock"]     = pygame.time.Clock()
+    Pacing["last"]      = perf_counter()
+    Pacing["start"]     = Pacing["last"]
+    Pacing["pending"]   = []
+    pygame.event.set_blocked(None)
+    pygame.event.set_allowed(PACING_EVENTS)
+
+# The keyword arguments to give pygame.display.set_mode for a policy.
+def pacing_display_flags(policy):
+    if policy == "vsync":
+        return {"vsync": 1}
+    return {}
+
+# Sleep until an event comes, or for PACING_IDLE_WAIT milliseconds.
+# The time we slept isn't counted by pacing_elapsed.
+def pacing_idle_wait():
+    event = pygame.event.wait(PACING_IDLE_WAIT)
+    if event.type != NOEVENT:
+        Pacing["pending"].append(event)
+    Pacing["last"]  = perf_counter()
+    Pacing["start"] = Pacing["last"]
+    # Don't let the Clock count the sleep as one long frame either.
+    Pacing["clock"].tick()
+
+# Get the events to handle this frame, oldest first.
+def pacing_events():
+    events = Pacing["pending"] + pygame.event.get()
+    Pacing["pending"] = []
+    return events
+
+# How many milliseconds have gone by since the last time we asked, for
+# physics_advance.
+def pacing_elapsed():
+    now = perf_counter()
+    ms  = (now - Pacing["last"]) * 1000
+    Pacing["last"] = now
+    return ms
+
+# Wait until it is time for the next frame. drew is True if we drew and
+# flipped a frame this time round.
+def pacing_wait(drew):
+    policy  = Pacing["policy"]
+    clock   = Pacing["clock"]
+    if policy == "vsync" and drew:
+        # The flip has already waited for the screen.
+        clock.tick(PACING_VSYNC_MAX)
+    elif policy == "adaptive":
+        # Wait for an event until the next frame is due.
+        left = int(1000 / Pacing["fps"]
+                   - (perf_counter() - Pacing["start"]) * 1000)
+        if left > 0:
+            event = pygame.event.wait(left)
+            if event.type != NOEVENT:
+                Pacing["pending"].append(event)
+        clock.tick()
+    else:
+        clock.tick(Pacing["fps"])
+    Pacing["start"] = perf_counter()
+
+# How many frames a second we have been managing lately.
+def pacing_fps():
+    return Pacing["clock"].get_fps()
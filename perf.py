@@ -0,0 +1,102 @@
+# perf.py
+# Time how long each part of a frame takes.
+#
+# mainloop calls perf_frame_start at the start of every frame and
+# perf_mark after each part of the frame (handling events, running the
+# physics, drawing...). The time since the previous mark is saved for that
+# part, in a buffer which holds the last PERF_FRAMES frames; when it is
+# full the oldest frames are written over. This costs a few calls to
+# perf_counter per frame, so it can stay on all the time.
+#
+# perf_stats works out the median and 99th percentile times from the
+# buffer, for the overlay in maze.py, and perf_write_csv saves the whole
+# buffer so stutters can be looked at afterwards.
+
+from array          import array
+from time           import perf_counter
+
+# The parts of a frame, in the order mainloop runs them. "frame" is the
+# whole frame and is filled in by perf_frame_start.
+PERF_PHASES = ("events", "physics", "render", "flip", "wait", "frame")
+
+# How many frames to keep.
+PERF_FRAMES = 1024
+
+# The buffer and where we are in it.
+Perf = {
+    # One row of PERF_PHASES times (in milliseconds) per frame.
+    "times":    array("d", bytes(8 * PERF_FRAMES * len(PERF_PHASES))),
+    # How many frames have been finished altogether.
+    "frames":   0,
+    # When the current frame started, and when the last mark was.
+    "start":    None,
+    "last":     None,
+}
+
+# Where each phase goes in a row.
+PERF_COLUMN = {p: i for (i, p) in enumerate(PERF_PHASES)}
+
+# Start a new frame. This finishes the previous frame, if there was one,
+# by saving its total time.
+def perf_frame_start():
+    now = perf_counter()
+    if Perf["start"] is not None:
+        row = (Perf["frames"] % PERF_FRAMES) * len(PERF_PHASES)
+        Perf["times"][row + PERF_COLUMN["frame"]] = \
+            (now - Perf["start"]) * 1000
+        Perf["frames"] += 1
+    Perf["start"]   = now
+    Perf["last"]    = now
+
+    # Clear the new row, in case some phases don't get marked this frame.
+    row = (Perf["frames"] % PERF_FRAMES) * len(PERF_PHASES)
+    for i in range(len(PERF_PHASES)):
+        Perf["times"][row + i] = 0
+
+# Save the time since the last mark as the time for this phase.
+def perf_mark(phase):
+    now = perf_counter()
+    row = (Perf["frames"] % PERF_FRAMES) * len(PERF_PHASES)
+    Perf["times"][row + PERF_COLUMN[phase]] += (now - Perf["last"]) * 1000
+    Perf["last"] = now
+
+# How long phase has taken so far in the frame being timed now, in
+# milliseconds.
+def perf_current(phase):
+    row = (Perf["frames"] % PERF_FRAMES) * len(PERF_PHASES)
+    return Perf["times"][row + PERF_COLUMN[phase]]
+
+# Get the finished frames in the buffer, oldest first, as a list of rows.
+# The frame being timed now is using one row, so at most PERF_FRAMES - 1
+# finished frames are kept.
+def perf_rows():
+    n       = min(Perf["frames"], PERF_FRAMES - 1)
+    first   = Perf["frames"] - n
+    width   = len(PERF_PHASES)
+    rows    = []
+    for f in range(first, Perf["frames"]):
+        row = (f % PERF_FRAMES) * width
+        rows.append(Perf["times"][row:row + width].tolist())
+    return rows
+
+# Work out the median and 99th percentile time of each phase over the
+# frames in the buffer. Returns a dict of phase: (p50, p99), in
+# milliseconds, or an empty dict if there are no frames yet.
+def perf_stats():
+    rows  = perf_rows()
+    stats = {}
+    if not rows:
+        return stats
+    for (i, phase) in enumerate(PERF_PHASES):
+        times = sorted(r[i] for r in rows)
+        stats[phase] = (times[len(times)//2],
+                        times[min(len(times) - 1, int(len(times) * 0.99))])
+    return stats
+
+# Save the frames in the buffer to a CSV file, one line per frame.
+def perf_write_csv(path):
+    with open(path, "w") as f:
+        f.write("frame," + ",".join(p + "_ms" for p in PERF_PHASES) + "\n")
+        rows  = perf_rows()
+        for (n, row) in enumerate(rows, Perf["frames"] - len(rows)):
+            f.write("%d," % n + ",".join("%.3f" % t for t in row) + "\n")
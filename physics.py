@@ -0,0 +1,562 @@
+# physics.py
+# The game state and the physics of the maze game. This doesn't use pygame
+# or OpenGL, so it can be run without a display (see headless.py).
+
+from math           import radians, sin, cos, fmod, pi, sqrt
+
+from floorindex     import floor_index_build, floor_index_find, \
+                           floor_index_find_at, floor_index_stale, \
+                           floor_index_sweep
+from aabbtree       import aabb_tree_build, aabb_tree_query
+from log            import log_debug
+from vec3           import Vec3
+from state          import WorldState, CameraState, PlayerState, \
+                           PhysicsState, GameState
+
+# Data
+
+# This defines the world (the level layout). See WorldState in state.py
+# for what the floors and walls are.
+World = WorldState(
+    floors = [
+        { "coords":     (-10, -10, 10, 10, -1),
+          "colour":     (0.5, 0, 0),
+          "win":        False,
+        },
+        { "coords":     (-10, 10, 0, 15, -1),
+          "colour":     (0, 0.5, 0),
+          "win":        True,
+        },
+        { "coords":     (0, 10, 10, 15, -1),
+          "colour":     (0, 0, 0.6),
+          "win":        False,
+        },
+        { "coords":     (0, 0, 5, 5, 2),
+          "colour":     (1, 0, 1),
+          "win":        False,
+        },
+        { "coords":     (0, 6, 5, 11, 4),
+          "colour":     (1, 1, 0),
+          "win":        False,
+        },
+        { "coords":     (6, 6, 12, 11, 6),
+          "colour":     (1, 1, 1),
+          "win":        False,
+        }
+    ],
+    walls = [
+        { "coords":     (-10, -10, -1, -9.8, 10, 1),
+          "colour":     (0.6, 0.6, 0.6),
+        },
+    ],
+    doom_z = -20,
+)
+
+# How thick the floors are. Only the top of a floor matters to the
+# physics, but they are drawn as boxes this thick.
+FLOOR_THICKNESS = 0.2
+
+# The camera and the player. The fields are in CameraState and PlayerState
+# in state.py. The vectors are Vec3s (see vec3.py), which the physics
+# changes in place rather than making new ones every tick.
+Camera = CameraState()
+Player = PlayerState()
+
+# The speeds at which the player walks, jumps and falls.
+# These are not in sensible units at the moment; they are how far we move
+# (or how much our speed changes) in one physics tick.
+Speed = {
+    "walk":     0.1,
+    "jump":     0.4,
+    "fall":     0.02,
+}
+
+# The physics clock, and what is happening in the game as a whole. See
+# PhysicsState and GameState in state.py.
+Physics = PhysicsState()
+Game = GameState()
+
+# Vectors player_physics uses to work things out in, so it doesn't have to
+# make new ones every tick.
+Scratch = {
+    # Where the player was at the start of the tick.
+    "old":      Vec3(),
+}
+
+# Vector operations
+# These are mathematical operations on 3D vectors. Maybe we should be using
+# a library instead?
+# Vectors are represented as 3-element lists. Currently passing in a 3-element
+# tuple will work as well. These make a new list every time; in the physics
+# we use the Vec3 methods instead, which change a vector in place.
+
+# Add two vectors
+def vec_add(a, b):
+    return [a[0]+b[0], a[1]+b[1], a[2]+b[2]]
+
+# Multiply a vector by a number
+def vec_mul(v, s):
+    return [v[0]*s, v[1]*s, v[2]*s]
+
+# Find the length of a vector
+def vec_norm(v):
+    return sqrt(v[0]*v[0] + v[1]*v[1] + v[2]*v[2])
+
+# Find a vector of length 1 in the same direction as v
+def vec_unit(v):
+    n = vec_norm(v)
+    return [v[0]/n, v[1]/n, v[2]/n]
+
+# Vector dot product
+def vec_dot(a, b):
+    return a[0]*b[0] + a[1]*b[1] + a[2]*b[2]
+
+# Vector cross product
+def vec_cross(a, b):
+    return [a[1]*b[2] - a[2]*b[1],
+            a[2]*b[0] - a[0]*b[2],
+            a[0]*b[1] - a[1]*b[0]]
+
+# Physics
+
+# How far above a floor the player stands. Anything closer than this
+# counts as standing on the floor.
+FLOOR_STAND = 0.01
+
+# Find the floor below a given position.
+# v is the point in space we want to start from.
+# Returns one of the dictionaries from World.floors, or None.
+# This assumes floors are horizontal rectangles. We use the index in
+# World.floor_index rather than looking at every floor; it gets rebuilt if
+# World.floors has changed length, otherwise call world_floors_changed().
+def find_floor_below(v):
+    return floor_index_find(world_floor_index(), v)
+
+# The same as find_floor_below, for the point (x, y, z).
+def find_floor_at(x, y, z):
+    n = floor_index_find_at(world_floor_index(), x, y, z)
+    if n is None:
+        return None
+    return World.floors[n]
+
+# Find the first floor we would land on moving from a to b. If there is
+# one, b is moved to where we land, on top of the floor, and we return
+# True; if we don't go down through the top of any floor on the way we
+# return False. Checking the whole line rather than just the floor below a
+# means we can't fall through a floor by moving too far in one tick.
+def find_floor_landing(a, b):
+    hit = floor_index_sweep(world_floor_index(), a, b, FLOOR_STAND)
+    if hit is None:
+        return False
+    (n, x, y) = hit
+    b.set(x, y, World.floors[n]["coords"][4] + FLOOR_STAND)
+    return True
+
+# Get the index over World.floors, building it if we need to.
+def world_floor_index():
+    index = World.floor_index
+    if index is None or floor_index_stale(index, World.floors):
+        world_floors_changed()
+        index = World.floor_index
+    return index
+
+# Rebuild the floor index. This must be called if the floors are edited
+# without adding or removing any.
+def world_floors_changed():
+    World.floor_index = floor_index_build(World.floors)
+    World.changed()
+
+# How wide and tall the player is, for bumping into walls. The player is a
+# box PLAYER_RADIUS out from their position each way, from their feet up
+# to PLAYER_HEIGHT above them.
+PLAYER_RADIUS = 0.25
+PLAYER_HEIGHT = 1
+
+# Get the AABB tree over World.walls, building it if we need to. Like
+# the floor index, it is rebuilt if the list of walls changes length;
+# otherwise call world_walls_changed().
+def world_wall_index():
+    index = World.wall_index
+    if (index is None or index["walls"] is not World.walls
+            or index["count"] != len(index["walls"])):
+        world_walls_changed()
+        index = World.wall_index
+    return index
+
+# Rebuild the wall tree. This must be called if the walls are edited
+# without adding or removing any.
+def world_walls_changed():
+    walls = World.walls
+    World.changed()
+    World.wall_index = {
+        "walls":    walls,
+        "count":    len(walls),
+        "tree":     aabb_tree_build([w["coords"] for w in walls]),
+    }
+
+# Find the walls the player could touch moving from a to b. Returns a list
+# of their coords.
+def find_walls_near(a, b):
+    index = world_wall_index()
+    if not index["count"]:
+        return []
+    r = PLAYER_RADIUS
+    box = (min(a[0], b[0]) - r, min(a[1], b[1]) - r, min(a[2], b[2]),
+           max(a[0], b[0]) + r, max(a[1], b[1]) + r,
+           max(a[2], b[2]) + PLAYER_HEIGHT)
+    walls = index["walls"]
+    return [walls[n]["coords"] for n in aabb_tree_query(index["tree"], box)]
+
+# wall_collide's answer when nothing stopped us.
+NOT_STOPPED = (False, False)
+
+# Stop the player going through walls moving from a to b. We move along x
+# first and then along y, and stop each one at the first wall in the way,
+# so the player slides along walls rather than sticking to them. Up and
+# down movement isn't changed. b is moved to where we stop, and we return
+# whether x and y were stopped.
+def wall_collide(a, b):
+    walls = find_walls_near(a, b)
+    if not walls:
+        return NOT_STOPPED
+    z1  = min(a[2], b[2])
+    z2  = max(a[2], b[2]) + PLAYER_HEIGHT
+    x   = wall_collide_axis(walls, 0, a[0], b[0], a[1], z1, z2)
+    y   = wall_collide_axis(walls, 1, a[1], b[1], x, z1, z2)
+    stopped = (x != b[0], y != b[1])
+    b[0] = x
+    b[1] = y
+    return stopped
+
+# Move along one axis (0 for x, 1 for y) from p to q, with the other axis
+# at o and the player between heights z1 and z2. Returns where we stop.
+# Walls we only just touch don't stop us, and neither do walls we are
+# already inside, so we can always get out of them.
+def wall_collide_axis(walls, axis, p, q, o, z1, z2):
+    r       = PLAYER_RADIUS
+    other   = 1 - axis
+    for c in walls:
+        if not (c[other] < o + r and c[other + 3] > o - r
+                and c[2] < z2 and c[5] > z1):
+            continue
+        if q > p and p + r <= c[axis] < q + r:
+            q = c[axis] - r
+        elif q < p and q - r < c[axis + 3] <= p - r:
+            q = c[axis + 3] + r
+    return q
+
+# Camera
+
+# Tell the camera it needs to update itself
+def camera_needs_update ():
+    Camera.uptodate = False
+
+# Update the vectors for moving the player.
+def camera_update_movement_vectors ():
+    angle   = Camera.angle
+
+    # This is the angle we walk along, in radians
+    walk    = radians(angle[0])
+
+    # This is the angle we walk sideways along
+    strafe  = walk - pi/2
+
+    # This is the direction we walk forwards
+    Camera.walk_vec.set(cos(walk), sin(walk), 0)
+
+    # This is the direction we walk right
+    Camera.strafe_vec.set(cos(strafe), sin(strafe), 0)
+
+    log_debug("camera", "Camera angle %s", angle)
+    #log_debug("camera", "New vectors walk %s strafe %s",
+    #        Camera.walk_vec, Camera.strafe_vec)
+    
+    camera_needs_update()
+
+# Look up or down.
+def camera_look_updown (by):
+    angle = Camera.angle
+    
+    new = angle[1] + by
+    if (new > 90):
+        new = 90
+    if (new < -90):
+        new = -90
+    angle[1] = new
+
+    log_debug("camera", "New camera angle %s", angle)
+    camera_needs_update()
+
+# Look left or right. -ve means look left.
+def camera_look_leftright (by):
+    angle = Camera.angle
+
+    # This fmod() function divides by 360 and takes the remainder.
+    # This makes sure we are always between 0 and 360 degrees.
+    # We subtract 'by' because angles are measured CCW but we want
+    # a +ve 'by' to turn us right. Otherwise it's confusing.
+    angle[0] = fmod(angle[0] - by, 360)
+    if (angle[0] < 0):
+        angle[0] += 360
+    
+    camera_update_movement_vectors()
+
+# Update the camera position based on the player position
+def camera_update_position ():
+    # If we are already up to date there is nothing to do
+    if (Camera.uptodate):
+        return
+
+    # Find our position from the player position and our offset.
+    pos = Camera.pos.set_sum(Player.pos, Camera.offset)
+
+    log_debug("camera", "Camera position %s", pos)
+
+    Camera.uptodate = True
+
+def camera_init ():
+    camera_update_movement_vectors()
+    camera_update_position()
+    Camera.prev_pos.copy_from(Camera.pos)
+
+def camera_physics ():
+    camera_update_position()
+
+# Find where to draw the camera from. alpha is how far we are between the
+# previous tick and the current one, from 0 to 1; we draw the camera that
+# far along the line between where it was and where it is now.
+def camera_render_pos (alpha):
+    prev    = Camera.prev_pos
+    pos     = Camera.pos
+    return [p + (c - p)*alpha for (p, c) in zip(prev, pos)]
+
+# Player
+
+# Nothing to do at the moment.
+def init_player():
+    pass
+
+# Put the Player back at the start, standing still and looking straight
+# ahead, ready for another game. The numbers are put back into the same
+# vectors, as restore does, so anything holding on to Player.pos still
+# sees where the Player is.
+def player_reset():
+    Player.pos.set(-1, 0, 0)
+    Player.vel.set(0, 0, 0)
+    Player.walk     = 0
+    Player.strafe   = 0
+    Player.jump     = False
+    Camera.angle[:] = (0, 0)
+    Camera.uptodate = False
+    Game.over       = None
+    camera_init()
+
+# The game is over. how is "die" or "win".
+def game_over (how):
+    Game.over = how
+    if (Game.on_over):
+        Game.on_over(how)
+
+# The player has died...
+def player_die ():
+    print("AAAARGH!!!")
+    game_over("die")
+
+# The player has won...
+def player_win ():
+    print("YaaaY!!!!")
+    game_over("win")
+
+# Set the speed we're trying to walk. We will only move if we're on the
+# ground.
+def player_walk (to):
+    Player.walk = to * Speed["walk"]
+
+# Set the speed we're trying to walk sideways. 
+def player_strafe (to):
+    Player.strafe = to * Speed["walk"]
+
+# Set the flag to show we're jumping. We will only jump if we're on the
+# ground.
+def player_jump (to):
+    Player.jump = to
+
+def player_physics(ticks):
+    pos     = Player.pos
+    vel     = Player.vel
+    walk    = Player.walk
+    strafe  = Player.strafe
+    jump    = Player.jump
+
+    walk_vec    = Camera.walk_vec
+    strafe_vec  = Camera.strafe_vec
+
+    # Assume we are falling.
+    falling = True
+
+    # Find the floor below us. If there is a floor, and we are close
+    # enough to it, we are not falling.
+    floor = find_floor_at(pos.x, pos.y, pos.z)
+    if (floor):
+        floor_z = floor["coords"][4] + FLOOR_STAND
+        if (pos.z <= floor_z):
+            falling = False
+
+    if (falling):
+        # If we are falling, increase our velocity in the downwards z direction
+        # by the fall speed (actually an acceleration). 
+        vel.z -= Speed["fall"]
+    elif (floor["win"]):
+        # If we are standing on a winning platform, we have won.
+        player_win()
+        return
+    else:
+        # Otherwise, start by multiplying our walk vector by our
+        # walk speed (which might be negative to walk backwards).
+        vel.set_scaled(walk_vec, walk)
+        # Then add our strafe (sideways) vector.
+        vel.add_scaled(strafe_vec, strafe)
+        # Then, if we are jumping, set our z velocity to be the jump speed
+        # and turn off the jump (we only jump once).
+        if (jump):
+            vel.z = Speed["jump"]
+            player_jump(False)
+
+    # If there is nothing to do, return
+    if (vel.is_zero()):
+        return
+
+    # Remember where we started, then add the velocity vector we have
+    # calculated to our position vector to give our new position.
+    old = Scratch["old"].copy_from(pos)
+    pos.add(vel)
+
+    # Walls stop us moving sideways, and we lose our speed that way.
+    (stop_x, stop_y) = wall_collide(old, pos)
+    if (stop_x):
+        vel.x = 0
+    if (stop_y):
+        vel.y = 0
+
+    if (vel.z < 0):
+        # If we are coming down, land on the first floor we go through the
+        # top of on the way, at the point where we hit it.
+        find_floor_landing(old, pos)
+    elif (floor and pos.z < floor_z):
+        # If we are standing just below the top of the floor, step up onto
+        # it.
+        pos.z = floor_z
+
+    log_debug("physics", "Player move from %s to %s", old, pos)
+
+    # If we fall too far we die.
+    if (pos.z < World.doom_z):
+        player_die()
+
+    # Tell the camera we've moved.
+    camera_needs_update()
+
+# Would a physics tick do nothing at all? That is when the player isn't
+# trying to walk, strafe or jump, and is standing on a floor which isn't a
+# winning one, and the camera has caught up with them; or when the game is
+# over. The main loop can sleep instead of running ticks then (see
+# pacing.py). This must match what player_physics does.
+def physics_idle():
+    if Game.over:
+        return True
+    if Player.walk or Player.strafe or Player.jump:
+        return False
+    if Camera.prev_pos != Camera.pos:
+        return False
+    pos     = Player.pos
+    floor   = find_floor_at(pos.x, pos.y, pos.z)
+    return (floor is not None and not floor["win"]
+            and pos.z <= floor["coords"][4] + FLOOR_STAND)
+
+# Bindings
+# A binding is a list like ["player_walk", 1]: the name of one of the
+# functions above, followed by the arguments to call it with. Key_Bindings
+# in keys.py and the scripts used by headless.py are made of these.
+
+# Run a binding.
+def run_binding(binding):
+    function = globals()[binding[0]]
+    function(*binding[1:])
+
+# Is a binding for one of the functions here, rather than something like
+# quitting or showing the overlay which doesn't change the game?
+def binding_is_physics(binding):
+    return callable(globals().get(binding[0]))
+
+# Clock
+# These functions run the physics at a fixed rate.
+
+# The length of one tick, in milliseconds.
+def physics_tick_ms():
+    return 1000 / Physics.rate
+
+# Run one physics tick.
+def physics_tick():
+    Camera.prev_pos.copy_from(Camera.pos)
+    player_physics(physics_tick_ms())
+    camera_physics()
+    Physics.tick += 1
+    if (Physics.on_tick):
+        Physics.on_tick()
+
+# Run as many ticks as we need to catch up with ms milliseconds of real
+# time. Time left over which isn't a whole tick is saved for next time.
+# Returns how far we are between the last tick and the next one, from
+# 0 to 1, so the renderer can draw things part way between ticks. Once the
+# game is over no more ticks run, so time stops adding up.
+def physics_advance(ms):
+    dt  = physics_tick_ms()
+    acc = Physics.acc
+    if not Game.over:
+        acc += ms
+
+    ticks = 0
+    while acc >= dt and not Game.over:
+        if ticks >= Physics.max_catchup:
+            # We've run as many as we are allowed. Drop the whole ticks
+            # we haven't run and keep the part-tick.
+            acc = fmod(acc, dt)
+            break
+        physics_tick()
+        acc -= dt
+        ticks += 1
+
+    Physics.acc = acc
+    # The game may have ended with whole ticks still to run, which never
+    # will be, so don't go past the last tick.
+    return min(acc / dt, 1.0)
+
+# Snapshots
+# A snapshot of the whole game is a tuple with a snapshot of each of
+# States (see state.py). Restoring one puts the game back exactly as it
+# was, so we can go back and run ticks again, check a replay against saved
+# states, or keep several games going in one process and switch between
+# them: restore a game's snapshot, run it, and take a new snapshot.
+# Speed isn't saved; it is a setting, shared by every game.
+States = (World, Player, Camera, Physics, Game)
+
+# Save the whole game.
+def physics_snapshot():
+    return tuple([state.snapshot() for state in States])
+
+# Put the whole game back as it was when snap was taken.
+def physics_restore(snap):
+    for (state, saved) in zip(States, snap):
+        state.restore(saved)
+
+# Make a snapshot of a new game on a level (a dict like level_load gives),
+# with the Player at the start. The current game isn't changed.
+def physics_new_game(level):
+    current = physics_snapshot()
+    World.load(level)
+    Physics.acc     = 0
+    Physics.tick    = 0
+    player_reset()
+    snap = physics_snapshot()
+    physics_restore(current)
+    return snap
@@ -0,0 +1,161 @@
+# physthread.py
+# Run the physics on a thread of its own.
+#
+# Normally mainloop in maze.py runs the physics ticks and then draws a
+# frame, so a slow frame (a slow flip, waiting for vsync, or a software
+# renderer) holds up the physics, and slow physics holds up the frame.
+# Instead, the physics thread runs ticks Physics.rate times a second by
+# the clock, whatever the drawing is doing, and the main thread just
+# draws.
+#
+# The two threads share as little as they can:
+#  * Keys go to the physics thread through a queue (physthread_key). It
+#    runs their bindings, and records them if we are recording, before
+#    the next tick, so a key is used at the next tick however long the
+#    frame takes.
+#  * After every tick the physics thread makes a new tuple with what the
+#    renderer needs (see physthread_publish) and puts it in
+#    PhysThread["latest"]. The tuple is never changed, and putting it
+#    there is a single assignment, so the renderer never sees half a tick
+#    and neither thread has to wait for a lock. The renderer takes the
+#    latest one and draws the camera part way between its last two
+#    positions (see physthread_pose), like physics_advance does.
+# Only the physics thread changes Player, Camera and Physics while it is
+# running, so the main thread must only read the published tuple.
+#
+# When the game is idle (see physics_idle) the physics thread sleeps until
+# a key comes, like mainloop does (see pacing.py).
+#
+# If the physics raises an exception, the thread keeps it and stops, and
+# physthread_pose raises it again on the main thread, so the game stops
+# rather than going on drawing a world which never moves.
+
+import threading
+from queue          import SimpleQueue, Empty
+from time           import perf_counter, sleep
+
+from physics        import Camera, Physics, Game, run_binding, \
+                           physics_tick, physics_idle
+from replay         import Replay, replay_record_key
+
+# The longest the physics thread sleeps at once when idle, in seconds.
+PHYSTHREAD_IDLE_WAIT = 0.25
+
+# The physics thread:
+#   thread      the threading.Thread, or None if it isn't running
+#   queue       the keys waiting for the next tick
+#   stop        a threading.Event which is set to make the thread stop
+#   latest      the last tuple published, see physthread_publish
+#   error       the exception which stopped the thread, or None
+PhysThread = {
+    "thread":   None,
+}
+
+# Is the physics thread running?
+def physthread_running():
+    return PhysThread["thread"] is not None
+
+# Start the physics thread. The physics must be set up already.
+def physthread_start():
+    PhysThread["queue"] = SimpleQueue()
+    PhysThread["stop"]  = threading.Event()
+    PhysThread["error"] = None
+    physthread_publish(perf_counter())
+    thread = threading.Thread(target=physthread_run, name="physics",
+        daemon=True)
+    PhysThread["thread"] = thread
+    thread.start()
+
+# Stop the physics thread and wait for it to finish.
+def physthread_stop():
+    PhysThread["stop"].set()
+    # Wake it up, in case it is asleep waiting for a key.
+    PhysThread["queue"].put(None)
+    PhysThread["thread"].join()
+    PhysThread["thread"] = None
+
+# Send a key going down or up to the physics thread. binding is the
+# physics binding to run for it, or None if there isn't one; the key is
+# still recorded.
+def physthread_key(key, down, binding):
+    PhysThread["queue"].put((key, down, binding))
+
+# Run a key from the queue. This is called on the physics thread.
+def physthread_input(item):
+    if item is None:
+        return
+    (key, down, binding) = item
+    if Replay["recording"]:
+        replay_record_key(key, down)
+    if binding is not None:
+        run_binding(binding)
+
+# Run all the keys waiting in the queue.
+def physthread_input_all():
+    queue = PhysThread["queue"]
+    while not queue.empty():
+        physthread_input(queue.get())
+
+# Publish what the renderer needs after a tick. when is the time the tick
+# was due, from perf_counter. The tuple is
+#   (when, tick, idle, prev_pos, pos, angle)
+# where idle is physics_idle(), and prev_pos, pos and angle are the
+# Camera's as tuples.
+def physthread_publish(when):
+    PhysThread["latest"] = (when, Physics.tick, physics_idle(),
+        tuple(Camera.prev_pos), tuple(Camera.pos), tuple(Camera.angle))
+
+# Where to draw the camera from now, from the latest tuple. Returns
+# ((pos, angle), idle), like render_pose in maze.py, and whether the
+# physics is idle. If the physics thread has stopped with an exception,
+# this raises it.
+def physthread_pose():
+    error = PhysThread["error"]
+    if error is not None:
+        raise error
+    (when, tick, idle, prev, pos, angle) = PhysThread["latest"]
+    alpha = min(1, (perf_counter() - when) * Physics.rate)
+    return (([p + (c - p)*alpha for (p, c) in zip(prev, pos)], angle), idle)
+
+# The physics thread itself. Run ticks when they are due, catching up
+# after a slow tick by up to Physics.max_catchup ticks, like
+# physics_advance does. If anything goes wrong, the exception is kept for
+# physthread_pose.
+def physthread_run():
+    try:
+        physthread_ticks()
+    except Exception as error:
+        PhysThread["error"] = error
+
+# Run ticks until we are told to stop.
+def physthread_ticks():
+    queue   = PhysThread["queue"]
+    stop    = PhysThread["stop"]
+    dt      = 1 / Physics.rate
+    due     = perf_counter()
+    while not stop.is_set():
+        now = perf_counter()
+        if now < due:
+            sleep(due - now)
+            continue
+
+        physthread_input_all()
+        ticks = 0
+        while due <= now and ticks < Physics.max_catchup and not Game.over:
+            physics_tick()
+            due     += dt
+            ticks   += 1
+        if due <= now:
+            # We are too far behind; give up on the ticks we've missed.
+            due = now + dt
+        physthread_publish(due - dt)
+
+        # If nothing will happen until a key is pressed, sleep until one
+        # is, and then start ticking again from then.
+        if physics_idle() and queue.empty():
+            try:
+                item = queue.get(timeout=PHYSTHREAD_IDLE_WAIT)
+            except Empty:
+                item = None
+            physthread_input(item)
+            due = perf_counter()
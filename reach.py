@@ -0,0 +1,397 @@
+# reach.py
+# Work out which floors the player can get to from which, without playing.
+#
+# A jump goes up at Speed["jump"] and slows down by Speed["fall"] every
+# tick, while moving sideways at the walking speed. So after k ticks in the
+# air the player has risen
+#
+#   k * jump - fall * k * (k - 1) / 2
+#
+# (the same sums player_physics does) and moved k times the walking speed
+# along the ground. Walking diagonally (walking and strafing at once) is
+# the fastest, at Speed["walk"] * sqrt(2) per tick. There is no steering
+# in the air, so once a jump starts, where it comes down is fixed: it lands
+# on a floor part way through the tick in which it goes down through the
+# top of it (see reach_landing). So a jump from one floor can land on
+# another if, at one of the speeds the player can move at, it comes down
+# at least as far away as the nearest part of the other floor and no
+# further than the furthest part. Walking off the edge of a floor works
+# the same way, except that we start falling straight away.
+#
+# This is an estimate: it doesn't know about floors in the way, which the
+# player might hit first, or about walls. It is good enough for bots to
+# follow and for checking that a generated level can be won. Falls further
+# than REACH_DROP are left out: in a tall level there is almost always
+# another floor in the way, and counting them would link every floor to
+# every floor below it.
+#
+# The reachability graph has an edge from floor a to floor b if a jump
+# from a can land on b. To find the floors to check for each floor we use
+# the floor index from floorindex.py, so we only look at floors close
+# enough to jump to rather than at every pair of floors. The last few
+# graphs made, for each list of floors and each Speed setting, are kept in
+# Reach, so changing Speed and back doesn't mean building them again.
+#
+# Run 'python reach.py [LEVEL]' to check whether a level can be won.
+
+import sys
+from math           import sqrt, hypot, floor
+from collections    import deque
+from time           import perf_counter
+
+from physics        import World, Speed, Player, world_floor_index
+from floorindex     import floor_coords, floor_index_near, \
+                           floor_index_find_number
+
+# The furthest a jump can come down below the floor it started from. This
+# is the same as mazegen.py leaves below a level before you die.
+REACH_DROP = 20
+
+# The graphs we have built, by (id of the floors list, Speed settings,
+# margin), the one used longest ago first.
+Reach = {}
+
+# How many graphs to keep in Reach. Every Speed setting needs a graph of
+# its own, so something which tries lots of settings, like sweep.py,
+# would otherwise keep all of them.
+REACH_KEEP = 4
+
+# The Speed settings a graph depends on, as a tuple.
+def reach_speed():
+    return (Speed["walk"], Speed["jump"], Speed["fall"])
+
+# The most ticks a jump can stay at or above dz (relative to where it
+# started), or 0 if it can't get that high at all.
+def reach_ticks(dz, speed):
+    (walk, jump, fall) = speed
+    if fall <= 0:
+        # We never come down, so this would go on for ever.
+        raise ValueError("Speed['fall'] must be more than 0")
+
+    # Solve jump*k - fall*k*(k - 1)/2 = dz for the larger k.
+    b       = jump + fall/2
+    disc    = b*b - 2*fall*dz
+    if disc < 0:
+        return 0
+    k = int(floor((b + sqrt(disc)) / fall))
+    # The sum above can be rounded a little differently, so check.
+    while k >= 1 and jump*k - fall*k*(k - 1)/2 < dz:
+        k -= 1
+    return max(k, 0)
+
+# How high a jump can go.
+def reach_height(speed):
+    (walk, jump, fall) = speed
+    # The top of the jump is when the speed upwards runs out.
+    k = max(1, int(jump / fall + 0.5))
+    return max(jump*i - fall*i*(i - 1)/2 for i in (k - 1, k, k + 1) if i > 0)
+
+# How many ticks after leaving the ground we come down through dz
+# (relative to where we started), starting off going up at rise. A jump
+# starts at Speed["jump"]; walking off the edge of a floor starts at
+# -Speed["fall"], as we start falling in the first tick. We land part way
+# through a tick (see find_floor_landing in physics.py), so this is part
+# way between two whole numbers. Returns None if we never get up to dz.
+def reach_landing(dz, rise, speed):
+    (walk, jump, fall) = speed
+    # The last whole tick at or above dz; we go below it in the next.
+    k = reach_ticks(dz, (walk, rise, fall))
+    if k == 0 and dz > 0:
+        return None
+    above = rise*k - fall*k*(k - 1)/2
+    below = above + rise - fall*k
+    return k + (above - dz) / (above - below)
+
+# How far along the ground a jump can go before it drops below dz. This
+# is never less than how far reach_edge lets a jump or a walk off the
+# edge go.
+def reach_radius(dz, speed):
+    return speed[0] * sqrt(2) * (reach_ticks(dz, speed) + 1)
+
+# The furthest a point of floor b which isn't over floor a can be from a
+# point of a, or None if all of b is under (or over) a. If facing is
+# True, only the points on the edges of a which face the point of b
+# count, as those are where we can walk off a towards it.
+def reach_far(a, b, facing):
+    (ax1, ay1, ax2, ay2, az) = a
+    (bx1, by1, bx2, by2, bz) = b
+    corners = ((ax1, ay1), (ax1, ay2), (ax2, ay1), (ax2, ay2))
+    # The parts of b beyond each edge of a, with the corners at the ends
+    # of that edge. The furthest point of an edge is always one of them.
+    parts = (
+        ((bx1, by1, min(bx2, ax1), by2), corners[0:2]),
+        ((max(bx1, ax2), by1, bx2, by2), corners[2:4]),
+        ((bx1, by1, bx2, min(by2, ay1)), corners[0::2]),
+        ((bx1, max(by1, ay2), bx2, by2), corners[1::2]))
+    far = None
+    for ((x1, y1, x2, y2), ends) in parts:
+        if x1 > x2 or y1 > y2:
+            continue
+        for (cx, cy) in (ends if facing else corners):
+            d = hypot(max(x2 - cx, cx - x1), max(y2 - cy, cy - y1))
+            if far is None or d > far:
+                far = d
+    return far
+
+# The floor with coords c made smaller by margin all round, but not so
+# small that it goes inside out.
+def reach_shrink(c, margin):
+    (x1, y1, x2, y2, z) = c
+    mx = min(margin, (x2 - x1) / 2)
+    my = min(margin, (y2 - y1) / 2)
+    return (x1 + mx, y1 + my, x2 - mx, y2 - my, z)
+
+# Can a jump from the floor with coords a, or walking off its edge, land
+# on the floor with coords b? If margin is given, we must jump from and
+# land at least that far in from the edges of the floors (where they are
+# big enough), so the jump still works if we don't get it exactly right.
+def reach_edge(a, b, speed, margin=0):
+    if margin:
+        (a, b) = (reach_shrink(a, margin), reach_shrink(b, margin))
+    (ax1, ay1, ax2, ay2, az) = a
+    (bx1, by1, bx2, by2, bz) = b
+    (walk, jump, fall) = speed
+    dz = bz - az
+    if dz < -REACH_DROP:
+        return False
+
+    # The shortest and longest distances between the two rectangles. We
+    # can't come down on a lower floor where it is under this one, as we
+    # would land on this one first, so then only the rest of it counts.
+    near = hypot(max(bx1 - ax2, ax1 - bx2, 0), max(by1 - ay2, ay1 - by2, 0))
+    far  = hypot(max(bx2 - ax1, ax2 - bx1), max(by2 - ay1, ay2 - by1))
+    if dz <= 0 and bx1 < ax2 and ax1 < bx2 and by1 < ay2 and ay1 < by2:
+        far = reach_far(a, b, False)
+        if far is None:
+            return False
+
+    # A jump comes down the speed we were moving at times the ticks it was
+    # in the air away from where it started, so that must be somewhere
+    # between the nearest and furthest points of the floor. We can walk or
+    # strafe, or do both, or stand still if the floor is higher.
+    steps = (walk, walk * sqrt(2))
+    if dz > 0:
+        steps = (0,) + steps
+    ticks = reach_landing(dz, jump, speed)
+    if ticks is not None:
+        for step in steps:
+            if near <= step * ticks <= far:
+                return True
+
+    # Walking off the edge, we are up to a step past it when we start to
+    # fall, so we come down up to a step further away than a jump would,
+    # but we can only walk off the edges facing the floor.
+    ticks = reach_landing(dz, -fall, speed)
+    if ticks is not None:
+        for step in (walk, walk * sqrt(2)):
+            if near <= step * (ticks + 1) and step * ticks <= far:
+                # That is the furthest from anywhere on this floor, so
+                # now check the edges facing it.
+                if step * ticks <= reach_far(a, b, True):
+                    return True
+    return False
+
+# Build the graph for a list of floors and a Speed setting, using index
+# (a floor index over the floors) to find nearby floors. Returns a dict:
+#   floors      the floors it is for
+#   count       how many floors there were
+#   speed       the Speed settings
+#   margin      the margin given to reach_edge
+#   low, high   the lowest and highest floor
+#   out         for each floor, the set of floors it can reach
+#   into        for each floor, the set of floors which can reach it
+#   paths       saved searches, see reach_search
+def reach_build(floors, speed, index, margin=0):
+    coords  = floor_coords(floors)
+    n       = len(coords)
+    graph   = {
+        "floors":   floors,
+        "count":    n,
+        "speed":    speed,
+        "margin":   margin,
+        "low":      min((c[4] for c in coords), default=0),
+        "high":     max((c[4] for c in coords), default=0),
+        "out":      [set() for i in range(n)],
+        "into":     [set() for i in range(n)],
+        "paths":    {},
+    }
+    for a in range(n):
+        reach_floor_out(graph, coords, index, a)
+    return graph
+
+# Work out the edges out of floor a.
+def reach_floor_out(graph, coords, index, a):
+    speed   = graph["speed"]
+    c       = coords[a]
+    # We can't go further than a jump which comes down to the lowest
+    # floor, or REACH_DROP below us.
+    r       = reach_radius(-min(c[4] - graph["low"], REACH_DROP), speed)
+    for b in floor_index_near(index, c[0] - r, c[1] - r, c[2] + r, c[3] + r,
+                              c[4] - REACH_DROP, c[4] + reach_height(speed)):
+        if b != a and reach_edge(c, coords[b], speed, graph["margin"]):
+            graph["out"][a].add(b)
+            graph["into"][b].add(a)
+
+# Work out the edges into floor b.
+def reach_floor_into(graph, coords, index, b):
+    speed   = graph["speed"]
+    c       = coords[b]
+    # The longest jump of all is from the highest floor down to the lowest.
+    r       = reach_radius(-min(graph["high"] - graph["low"], REACH_DROP),
+                speed)
+    for a in floor_index_near(index, c[0] - r, c[1] - r, c[2] + r, c[3] + r,
+                              c[4] - reach_height(speed), c[4] + REACH_DROP):
+        if a != b and reach_edge(coords[a], c, speed, graph["margin"]):
+            graph["out"][a].add(b)
+            graph["into"][b].add(a)
+
+# Some floors have changed: changed is a list of their numbers. Floors
+# added to the end of the list since the graph was made are counted as
+# changed too. index must be up to date with the floors. Only the edges to
+# and from those floors are worked out again, unless floors have been
+# removed, when we have to start again. Returns the updated graph, which
+# might be a new one.
+def reach_update(graph, changed, index):
+    floors  = graph["floors"]
+    coords  = floor_coords(floors)
+    if len(coords) < graph["count"]:
+        return reach_build(floors, graph["speed"], index, graph["margin"])
+    changed = set(changed) | set(range(graph["count"], len(coords)))
+    for n in changed:
+        graph["low"]    = min(graph["low"], coords[n][4])
+        graph["high"]   = max(graph["high"], coords[n][4])
+
+    for i in range(graph["count"], len(coords)):
+        graph["out"].append(set())
+        graph["into"].append(set())
+    graph["count"] = len(coords)
+
+    for n in changed:
+        for b in graph["out"][n]:
+            graph["into"][b].discard(n)
+        for a in graph["into"][n]:
+            graph["out"][a].discard(n)
+        graph["out"][n]     = set()
+        graph["into"][n]    = set()
+    for n in changed:
+        reach_floor_out(graph, coords, index, n)
+        reach_floor_into(graph, coords, index, n)
+    graph["paths"] = {}
+    return graph
+
+# Get the graph for World.floors with the current Speed settings and
+# margin (see reach_edge), building it if we need to. Floors added to the
+# end of the list are picked up by themselves; call reach_floors_changed
+# if floors are edited.
+def reach_graph(margin=0):
+    floors  = World.floors
+    key     = (id(floors), reach_speed(), margin)
+    # Take it out, and put it back at the end as the newest.
+    graph   = Reach.pop(key, None)
+    if graph is None or graph["floors"] is not floors:
+        graph = reach_build(floors, key[1], world_floor_index(), margin)
+    elif graph["count"] != len(floors):
+        graph = reach_update(graph, (), world_floor_index())
+    while len(Reach) >= REACH_KEEP:
+        del Reach[next(iter(Reach))]
+    Reach[key] = graph
+    return graph
+
+# Some floors in World.floors have been edited; changed is a list of
+# their numbers. Call world_floors_changed in physics.py first, so the
+# floor index is up to date. This updates the graphs for every Speed.
+def reach_floors_changed(changed):
+    floors  = World.floors
+    for (key, graph) in list(Reach.items()):
+        if graph["floors"] is floors:
+            Reach[key] = reach_update(graph, changed, world_floor_index())
+
+# Search the graph outwards from floor start, fewest jumps first. Returns
+# a list giving the floor we came from for every floor (-1 for start and
+# None for floors we can't get to). avoid is a set of (a, b) edges not to
+# use. The searches are saved in the graph, so asking for paths from the
+# same floor again is quick, unless there are edges to avoid.
+def reach_search(graph, start, avoid=()):
+    if not avoid and start in graph["paths"]:
+        return graph["paths"][start]
+    came    = [None] * graph["count"]
+    came[start] = -1
+    todo    = deque([start])
+    while todo:
+        a = todo.popleft()
+        for b in graph["out"][a]:
+            if came[b] is None and (a, b) not in avoid:
+                came[b] = a
+                todo.append(b)
+    if not avoid:
+        graph["paths"][start] = came
+    return came
+
+# Follow a search back from goal. Returns the floors from start to goal.
+def reach_follow(came, goal):
+    path = [goal]
+    while came[path[-1]] != -1:
+        path.append(came[path[-1]])
+    path.reverse()
+    return path
+
+# Find the fewest jumps from floor start to floor goal. Returns the list of
+# floor numbers to land on, starting with start and ending with goal, or
+# None if goal can't be reached.
+def reach_path(graph, start, goal):
+    came = reach_search(graph, start)
+    if came[goal] is None:
+        return None
+    return reach_follow(came, goal)
+
+# Find the fewest jumps from floor start to any winning floor, without
+# using the edges in avoid (see reach_search). Returns a list of floor
+# numbers like reach_path, or None.
+def reach_path_to_win(graph, start, avoid=()):
+    came    = reach_search(graph, start, avoid)
+    floors  = graph["floors"]
+    if hasattr(floors, "win"):
+        wins = floors.win.tolist()
+    else:
+        wins = [f["win"] for f in floors]
+    best    = None
+    for n in range(graph["count"]):
+        if came[n] is not None and wins[n]:
+            path = reach_follow(came, n)
+            if best is None or len(path) < len(best):
+                best = path
+    return best
+
+# The number of the floor below a position, or None.
+def reach_floor_at(pos):
+    return floor_index_find_number(world_floor_index(), pos)
+
+def main(argv):
+    if len(argv) > 2:
+        print("Usage: python reach.py [LEVEL]")
+        return 1
+    if len(argv) == 2:
+        from level import level_use
+        level_use(argv[1])
+
+    start   = perf_counter()
+    graph   = reach_graph()
+    elapsed = perf_counter() - start
+    edges   = sum(len(o) for o in graph["out"])
+    print("%d floors, %d jumps between them, built in %.3fs"
+        % (graph["count"], edges, elapsed))
+
+    floor = reach_floor_at(Player.pos)
+    if floor is None:
+        print("The player doesn't start on a floor")
+        return 1
+    path = reach_path_to_win(graph, floor)
+    if path is None:
+        print("No winning floor can be reached from floor %d" % floor)
+        return 1
+    print("A winning floor can be reached in %d jumps: %s"
+        % (len(path) - 1, " ".join(str(n) for n in path)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
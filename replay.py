@@ -0,0 +1,294 @@
+# replay.py
+# Record the keys pressed during a game and play them back exactly.
+#
+# The physics runs in fixed ticks (see physics_advance), so if the same
+# keys are pressed on the same ticks the game plays out exactly the same
+# way, however fast or slow the frames were. While recording we save
+# every key going down or up that handle_key in maze.py sees, with the
+# tick it happened on, and a checksum of the Player and Camera after every
+# tick. Playing back runs the ticks as fast as possible and checks the
+# checksums, so we find out straight away if the game doesn't play the
+# same any more, and how fast it runs.
+#
+# A recording file starts with a header:
+#   magic       4 bytes, b"MREC"
+#   version     uint32, currently 1
+#   keys        uint32, the number of key records
+#   ticks       uint32, the number of ticks recorded
+#   rate        float32, Physics.rate when it was recorded
+#   level       uint16 length and then that many bytes of UTF-8: the level
+#               file that was played, or nothing for the built-in level
+# then the key records, 9 bytes each:
+#   tick        uint32, the tick the key was pressed before
+#   key         uint32, the pygame key code
+#   down        uint8, 1 for KEYDOWN and 0 for KEYUP
+# and then one uint32 checksum per tick. Everything is little-endian.
+#
+# Run it as
+#   python maze.py --record FILE [LEVEL]    to record a game
+#   python replay.py [--render] FILE        to play it back
+#   python replay.py --video OUT FILE       to make a video of it
+# --video draws every tick without a window (see capture.py and
+# offscreen.py) and writes the frames to OUT, as a Y4M video if it ends in
+# .y4m or raw RGBA bytes otherwise.
+
+import sys
+import zlib
+import struct
+import argparse
+from array          import array
+from time           import perf_counter
+
+from physics        import *
+from keys           import Key_Bindings
+
+HEADER  = struct.Struct("<4sIIIf")
+LENGTH  = struct.Struct("<H")
+KEY     = struct.Struct("<IIB")
+MAGIC   = b"MREC"
+VERSION = 1
+
+# The recording being made or played back:
+#   recording   True while we are recording
+#   level       the level file, or None for the built-in level
+#   rate        Physics.rate
+#   start       the tick the recording started on
+#   ticks, keys, down
+#               the key records, in the order they happened
+#   sums        the checksum after each tick
+Replay = {
+    "recording":    False,
+}
+
+# Work out a checksum of everything about the Player and Camera which
+# changes as the game is played.
+def replay_checksum():
+    values = (list(Player.pos) + list(Player.vel)
+              + [Player.walk, Player.strafe, Player.jump]
+              + list(Camera.pos) + Camera.angle)
+    return zlib.crc32(struct.pack("<%dd" % len(values), *values))
+
+# Start recording. level is the level file being played, or None.
+def replay_record_start(level=None):
+    Replay["recording"] = True
+    Replay["level"]     = level
+    Replay["rate"]      = Physics.rate
+    Replay["start"]     = Physics.tick
+    Replay["ticks"]     = array("I")
+    Replay["keys"]      = array("I")
+    Replay["down"]      = array("B")
+    Replay["sums"]      = array("I")
+    Physics.on_tick  = replay_record_tick
+
+# Save a key going down or up. It will be played back before the next tick.
+def replay_record_key(key, down):
+    Replay["ticks"].append(Physics.tick - Replay["start"])
+    Replay["keys"].append(key)
+    Replay["down"].append(1 if down else 0)
+
+# Save the checksum after a tick. This is called by physics_tick.
+def replay_record_tick():
+    Replay["sums"].append(replay_checksum())
+
+# Stop recording.
+def replay_record_stop():
+    Replay["recording"] = False
+    Physics.on_tick  = None
+
+# Save the recording to a file.
+def replay_save(path):
+    level = (Replay["level"] or "").encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(Replay["keys"]),
+            len(Replay["sums"]), Replay["rate"]))
+        f.write(LENGTH.pack(len(level)))
+        f.write(level)
+        for i in range(len(Replay["keys"])):
+            f.write(KEY.pack(Replay["ticks"][i], Replay["keys"][i],
+                Replay["down"][i]))
+        f.write(Replay["sums"].tobytes())
+
+# Load a recording from a file into Replay. Raises ValueError if it isn't
+# a recording we understand.
+def replay_load(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < HEADER.size + LENGTH.size:
+        raise ValueError("%s: too short to be a recording" % path)
+    (magic, version, keys, ticks, rate) = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("%s: not a recording" % path)
+    if version != VERSION:
+        raise ValueError("%s: recording version %d, we need %d"
+            % (path, version, VERSION))
+    at = HEADER.size
+    (length,) = LENGTH.unpack_from(data, at)
+    at += LENGTH.size
+    level = data[at:at + length].decode("utf-8") or None
+    at += length
+    if len(data) != at + keys * KEY.size + ticks * 4:
+        raise ValueError("%s: wrong size for %d keys and %d ticks"
+            % (path, keys, ticks))
+
+    Replay["recording"] = False
+    Replay["level"]     = level
+    Replay["rate"]      = rate
+    Replay["start"]     = 0
+    Replay["ticks"]     = array("I")
+    Replay["keys"]      = array("I")
+    Replay["down"]      = array("B")
+    for (tick, key, down) in KEY.iter_unpack(data[at:at + keys * KEY.size]):
+        Replay["ticks"].append(tick)
+        Replay["keys"].append(key)
+        Replay["down"].append(down)
+    at += keys * KEY.size
+    Replay["sums"]      = array("I")
+    Replay["sums"].frombytes(data[at:])
+    if sys.byteorder != "little":
+        Replay["sums"].byteswap()
+
+# Play back the recording in Replay from the start of the game. For each
+# key we call on_key(key, down), and after each tick on_frame() if it is
+# given; on_frame can return False to stop. Returns (ticks, bad): how many
+# ticks we ran, and the first tick whose checksum was wrong or None.
+def replay_run(on_key, on_frame=None):
+    Physics.rate = Replay["rate"]
+    ticks   = Replay["ticks"]
+    n       = 0
+    for t in range(len(Replay["sums"])):
+        while n < len(ticks) and ticks[n] <= t:
+            on_key(Replay["keys"][n], Replay["down"][n])
+            n += 1
+        if Game.over:
+            return (t, t)
+        physics_tick()
+        if replay_checksum() != Replay["sums"][t]:
+            return (t + 1, t)
+        if on_frame and on_frame() is False:
+            return (t + 1, None)
+    return (len(Replay["sums"]), None)
+
+# Run the binding for a key going down or up, as handle_key does, but only
+# if it is one of the physics functions. Things like quitting or showing
+# the overlay don't change the game, so they are left out.
+def replay_key(key, down):
+    if key not in Key_Bindings:
+        return
+    binding = Key_Bindings[key][0 if down else 1]
+    if binding is not None and binding_is_physics(binding):
+        run_binding(binding)
+
+# Get ready to draw every tick into a capture framebuffer of the given size
+# and write the frames to path (see capture.py). If window is True we show
+# them in a window as well, otherwise we draw without one. Returns the
+# on_frame function for replay_run.
+def replay_video_start(maze, path, size, window):
+    maze.Display.winsize = size
+    if window:
+        maze.init_display()
+    else:
+        from offscreen import offscreen_init
+        offscreen_init(size)
+    import capture
+    capture.capture_init(size)
+    maze.init_opengl()
+    maze.init_world()
+    Replay["video"] = capture.capture_writer_open(path, size, Physics.rate)
+
+    def on_frame():
+        maze.render()
+        frame = capture.capture_read()
+        if frame is not None:
+            capture.capture_write(Replay["video"], frame)
+        if window:
+            capture.capture_blit()
+            maze.pygame.display.flip()
+            for event in maze.pygame.event.get():
+                if event.type == maze.QUIT:
+                    return False
+    return on_frame
+
+# Write the last few frames, which are still being read back, and close
+# the video.
+def replay_video_stop():
+    import capture
+    writer = Replay.pop("video", None)
+    if writer is None:
+        return
+    for frame in capture.capture_flush():
+        capture.capture_write(writer, frame)
+    capture.capture_writer_close(writer)
+    capture.capture_quit()
+    print("Wrote %d frames to %s" % (writer["frames"], writer["file"].name))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Play back a recording made with maze.py --record.")
+    parser.add_argument("file", help="recording to play back")
+    parser.add_argument("--render", action="store_true",
+        help="draw every tick in a window")
+    parser.add_argument("--video", metavar="OUT",
+        help="draw every tick and save the frames to OUT")
+    parser.add_argument("--size", type=int, nargs=2, default=(640, 480),
+        metavar=("WIDTH", "HEIGHT"), help="size of the video frames")
+    args = parser.parse_args(argv)
+
+    replay_load(args.file)
+
+    # Without a window we need an offscreen OpenGL context, and that has to
+    # be chosen before anything imports OpenGL.
+    if args.video and not args.render:
+        import offscreen
+
+    # Only load maze.py (and so pygame and OpenGL) if we are drawing. Load
+    # it now, so the time it takes isn't counted in the replay. This
+    # doesn't open a window.
+    if args.render or args.video:
+        import maze
+
+    if Replay["level"]:
+        from level import level_use
+        level_use(Replay["level"])
+
+    on_frame = None
+    if args.video:
+        on_frame = replay_video_start(maze, args.video, tuple(args.size),
+            args.render)
+    elif args.render:
+        maze.init_display()
+        maze.init_opengl()
+        maze.init_world()
+
+        # Draw every tick, as fast as we can, and stop if the window is
+        # closed.
+        def on_frame():
+            maze.render()
+            maze.pygame.display.flip()
+            for event in maze.pygame.event.get():
+                if event.type == maze.QUIT:
+                    return False
+
+    init_player()
+    camera_init()
+
+    try:
+        start = perf_counter()
+        (done, bad) = replay_run(replay_key, on_frame)
+        elapsed = perf_counter() - start
+    finally:
+        if args.video:
+            replay_video_stop()
+        if args.render:
+            maze.pygame.display.quit()
+
+    print("Replayed %d of %d ticks in %.3fs (%.0f ticks/sec)"
+        % (done, len(Replay["sums"]), elapsed,
+           done / elapsed if elapsed else 0))
+    if bad is not None:
+        print("Checksum wrong after tick %d" % bad)
+        return 1
+    print("Checksums OK")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+# scale.py
+# Draw the world at a lower resolution when frames take too long.
+#
+# Without a graphics card (with Mesa's llvmpipe, say) most of the time
+# spent drawing a frame goes on filling in pixels, so a big window is slow
+# however little is in it. Instead we can draw the world into a texture
+# smaller than the window, and then draw it stretched over the whole
+# window (see scale_begin and scale_end). A scale of 0.5 means half the
+# width and half the height, so only a quarter of the pixels to fill in.
+# The overlay is drawn afterwards, straight onto the window, so it stays
+# sharp.
+#
+# The scale can be fixed, or left to scale_update, which is told how long
+# each frame took to draw and turns the scale down when we are slower
+# than Display.fps, and slowly back up again when there is time to spare,
+# never going outside SCALE_MIN (or the minimum given to scale_init) and
+# SCALE_MAX. At a scale of 1 we draw straight onto the window as before,
+# so this costs nothing on machines which are fast enough.
+#
+# Stretching the texture means filling in every pixel of the window once,
+# so if the world is cheap to draw, drawing it smaller doesn't save
+# anything. scale_update keeps the time a frame took at full size, and if
+# a smaller scale turns out to be no quicker, it goes back to full size
+# and doesn't try again for SCALE_RETRY frames.
+
+from math           import sqrt
+from OpenGL.GL      import *
+
+# The smallest and largest scale we use.
+SCALE_MIN = 0.5
+SCALE_MAX = 1.0
+
+# Scales are rounded to a multiple of this, so small changes in the frame
+# times don't make us change the scale every frame.
+SCALE_ROUND = 0.05
+
+# We aim to spend at most this much of each frame drawing, so there is
+# some time left for everything else.
+SCALE_HEADROOM = 0.85
+
+# If we are using less than this much of what we are aiming for, we turn
+# the scale up by one SCALE_ROUND.
+SCALE_SPARE = 0.6
+
+# How many frames to wait after changing the scale before changing it
+# again, so the frame times have time to settle.
+SCALE_SETTLE = 10
+
+# How much of each new frame time goes into the average (see scale_update).
+SCALE_SMOOTHING = 0.2
+
+# How many frames to wait before trying a smaller scale again, after
+# finding it didn't help.
+SCALE_RETRY = 1000
+
+# The scaling:
+#   scale       the scale we are drawing at now
+#   fixed       True if the scale was fixed by scale_init
+#   min, max    the smallest and largest scale scale_update can use
+#   target      how long a frame can take, in milliseconds
+#   average     the average time to draw a frame at this scale, in
+#               milliseconds, or None until we have one
+#   frames      how many frames we have drawn at this scale
+#   full        the average time at a scale of 1, from before we last
+#               turned it down, or None
+#   retry       how many more frames to wait before turning the scale down
+#   size        the size of the window
+#   window      the framebuffer of the window (0 unless we were drawing
+#               into another one, see offscreen.py)
+#   framebuffer the framebuffer we draw into when the scale is below 1,
+#               with its colour texture and depth buffer
+Scale = {
+    "scale":    1.0,
+}
+
+# Get ready to scale. size is the size of the window and fps the frame
+# rate we are aiming for. scale is the scale to use all the time, or None
+# to let scale_update choose one between min_scale and SCALE_MAX. This
+# must be called after init_opengl.
+def scale_init(size, fps, scale=None, min_scale=SCALE_MIN):
+    (width, height) = size
+    if scale is not None and not 0 < scale <= SCALE_MAX:
+        raise ValueError("scale must be more than 0 and at most %g"
+            % SCALE_MAX)
+
+    Scale["window"] = glGetIntegerv(GL_FRAMEBUFFER_BINDING)
+
+    # The texture is as big as the window, so the scale can change without
+    # making it again; we only draw into the bottom left part of it.
+    texture = glGenTextures(1)
+    glBindTexture(GL_TEXTURE_2D, texture)
+    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA8, width, height, 0, GL_RGBA,
+        GL_UNSIGNED_BYTE, None)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+    glBindTexture(GL_TEXTURE_2D, 0)
+
+    depth = glGenRenderbuffers(1)
+    glBindRenderbuffer(GL_RENDERBUFFER, depth)
+    glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24,
+        width, height)
+
+    fb = glGenFramebuffers(1)
+    glBindFramebuffer(GL_FRAMEBUFFER, fb)
+    glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0,
+        GL_TEXTURE_2D, texture, 0)
+    glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT,
+        GL_RENDERBUFFER, depth)
+    complete = glCheckFramebufferStatus(GL_FRAMEBUFFER) \
+        == GL_FRAMEBUFFER_COMPLETE
+    glBindFramebuffer(GL_FRAMEBUFFER, Scale["window"])
+    if not complete:
+        raise RuntimeError("scale framebuffer is not complete")
+
+    Scale["framebuffer"]    = (fb, texture, depth)
+    Scale["size"]           = size
+    Scale["fixed"]          = scale is not None
+    Scale["scale"]          = scale if scale is not None else SCALE_MAX
+    Scale["min"]            = min(min_scale, SCALE_MAX)
+    Scale["max"]            = SCALE_MAX
+    Scale["target"]         = 1000 / fps
+    Scale["average"]        = None
+    Scale["frames"]         = 0
+    Scale["full"]           = None
+    Scale["retry"]          = 0
+
+# The size in pixels we draw the world at, at the current scale.
+def scale_size():
+    (width, height) = Scale["size"]
+    s = Scale["scale"]
+    return (max(1, round(width * s)), max(1, round(height * s)))
+
+# Start drawing a frame. If the scale is below 1 this draws into the
+# texture from now on, and returns True; scale_end must be called once the
+# world has been drawn. Otherwise we draw straight onto the window, and it
+# returns False.
+def scale_begin():
+    if "framebuffer" not in Scale or Scale["scale"] >= 1:
+        return False
+    glBindFramebuffer(GL_FRAMEBUFFER, Scale["framebuffer"][0])
+    glViewport(0, 0, *scale_size())
+    return True
+
+# Stretch what has been drawn into the texture over the whole window, and
+# draw onto the window again from now on.
+def scale_end():
+    (fb, texture, depth) = Scale["framebuffer"]
+    (width, height) = Scale["size"]
+    glBindFramebuffer(GL_FRAMEBUFFER, Scale["window"])
+    glViewport(0, 0, width, height)
+
+    glPushAttrib(GL_ENABLE_BIT)
+    glDisable(GL_LIGHTING)
+    glDisable(GL_DEPTH_TEST)
+    glEnable(GL_TEXTURE_2D)
+    glBindTexture(GL_TEXTURE_2D, texture)
+    glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_REPLACE)
+
+    # Draw a square over the whole window, from -1 to 1 both ways with no
+    # camera or projection, showing the part of the texture we drew into.
+    glMatrixMode(GL_PROJECTION)
+    glPushMatrix()
+    glLoadIdentity()
+    glMatrixMode(GL_MODELVIEW)
+    glPushMatrix()
+    glLoadIdentity()
+    (w, h) = scale_size()
+    (u, v) = (w / width, h / height)
+    glBegin(GL_QUADS)
+    glTexCoord2f(0, 0)
+    glVertex2f(-1, -1)
+    glTexCoord2f(u, 0)
+    glVertex2f(1, -1)
+    glTexCoord2f(u, v)
+    glVertex2f(1, 1)
+    glTexCoord2f(0, v)
+    glVertex2f(-1, 1)
+    glEnd()
+    glPopMatrix()
+    glMatrixMode(GL_PROJECTION)
+    glPopMatrix()
+    glMatrixMode(GL_MODELVIEW)
+
+    glBindTexture(GL_TEXTURE_2D, 0)
+    glPopAttrib()
+
+# Tell the controller a frame took ms milliseconds to draw, and change the
+# scale if we need to. Returns True if the scale changed.
+#
+# The time to fill in the pixels goes with the number of pixels, which
+# goes with the scale squared. So if frames are taking twice as long as we
+# want, we multiply the scale by the square root of a half. Going up we
+# only take one small step at a time, since a frame that is too slow is
+# worse than one which could have been a little sharper.
+def scale_update(ms):
+    if "size" not in Scale or Scale["fixed"]:
+        return False
+    if Scale["average"] is None:
+        Scale["average"] = ms
+    else:
+        Scale["average"] += (ms - Scale["average"]) * SCALE_SMOOTHING
+    Scale["frames"] += 1
+    if Scale["retry"] > 0:
+        Scale["retry"] -= 1
+    if Scale["frames"] < SCALE_SETTLE:
+        return False
+
+    scale   = Scale["scale"]
+    average = Scale["average"]
+    budget  = Scale["target"] * SCALE_HEADROOM
+    if scale < 1 and Scale["full"] is not None and average >= Scale["full"]:
+        # Drawing smaller isn't any quicker, so go back to full size.
+        scale = 1
+        Scale["retry"] = SCALE_RETRY
+    elif average > budget:
+        if Scale["retry"] > 0:
+            return False
+        if scale >= 1:
+            Scale["full"] = average
+        scale *= sqrt(budget / average)
+        # Round down, so we do get under the budget. The small number
+        # stops 0.7 / 0.05 = 13.999... rounding down to 13.
+        scale = int(scale / SCALE_ROUND + 1e-9) * SCALE_ROUND
+    elif average < budget * SCALE_SPARE:
+        scale += SCALE_ROUND
+    scale = round(min(Scale["max"], max(Scale["min"], scale)), 4)
+    if scale == Scale["scale"]:
+        return False
+
+    Scale["scale"]      = scale
+    Scale["average"]    = None
+    Scale["frames"]     = 0
+    return True
+
+# Stop scaling and throw away the texture.
+def scale_quit():
+    if "framebuffer" in Scale:
+        (fb, texture, depth) = Scale.pop("framebuffer")
+        glDeleteFramebuffers(1, [fb])
+        glDeleteTextures([texture])
+        glDeleteRenderbuffers(1, [depth])
+    Scale.clear()
+    Scale["scale"] = 1.0
@@ -0,0 +1,214 @@
+# state.py
+# The classes the game state is kept in.
+#
+# Each part of the game state (Player, Camera, World and so on) is an
+# object of one of these classes, with its fields in __slots__, so we write
+# Player.pos rather than Player["pos"]. Reading a slot is quicker than
+# looking a string up in a dict, the objects are smaller, and a misspelt
+# field name is an error instead of quietly making a new key.
+#
+# Every State can be saved and put back:
+#   snap = Player.snapshot()
+#   ...
+#   Player.restore(snap)
+# A snapshot is one flat tuple. Vec3s and lists (like Camera.angle) are
+# saved as the numbers in them, and restore puts the numbers back into the
+# same vectors, so nothing that holds on to Player.pos gets left behind.
+# Everything else is kept as it is, so a World snapshot shares its floors
+# with the World rather than copying them. A snapshot is only a few dozen
+# values, so it is cheap enough to take one every tick. physics_snapshot in
+# physics.py saves the whole game at once.
+#
+# By default snapshot saves every field. Classes with vectors in, or with
+# fields which shouldn't be saved, have their own snapshot and restore,
+# which must be changed when fields are added.
+
+from itertools      import count
+
+from vec3           import Vec3
+
+class State:
+    __slots__ = ()
+
+    # Save the fields. Returns a tuple.
+    def snapshot(self):
+        return tuple([getattr(self, name) for name in self.__slots__])
+
+    # Put back the fields from a snapshot. The snapshot isn't changed, so
+    # it can be restored again.
+    def restore(self, snap):
+        for (name, value) in zip(self.__slots__, snap):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return "%s(%s)" % (type(self).__name__, ", ".join("%s=%r"
+            % (name, getattr(self, name)) for name in self.__slots__))
+
+# The player. The vectors are Vec3s, which the physics changes in place.
+class PlayerState(State):
+    __slots__ = ("pos", "vel", "walk", "strafe", "jump")
+
+    def __init__(self):
+        # Our current position
+        self.pos    = Vec3(-1, 0, 0)
+        # Our current velocity (our speed in the X, Y and Z directions)
+        self.vel    = Vec3(0, 0, 0)
+        # Our current walk speed.
+        self.walk   = 0
+        # Our current strafe speed.
+        self.strafe = 0
+        # True if we are currently jumping.
+        self.jump   = False
+
+    def snapshot(self):
+        (p, v) = (self.pos, self.vel)
+        return (p.x, p.y, p.z, v.x, v.y, v.z,
+                self.walk, self.strafe, self.jump)
+
+    def restore(self, snap):
+        (p, v) = (self.pos, self.vel)
+        (p.x, p.y, p.z, v.x, v.y, v.z,
+         self.walk, self.strafe, self.jump) = snap
+
+# The camera. The camera moves with the player but has its own direction.
+# Most of these values are just dummies which will be set up by
+# camera_init.
+class CameraState(State):
+    __slots__ = ("uptodate", "offset", "pos", "prev_pos", "angle",
+                 "walk_vec", "strafe_vec")
+
+    def __init__(self):
+        # Are we up to date with the player position?
+        self.uptodate   = False
+        # Where is the camera position, relative to the player position?
+        self.offset     = Vec3(0, 0, 1)
+        # The current position of the camera.
+        self.pos        = Vec3(0, 0, 0)
+        # The position of the camera before the last physics tick.
+        self.prev_pos   = Vec3(0, 0, 0)
+        # The current camera angle, horizontal and vertical.
+        self.angle      = [0, 0]
+        # The vector the player walks along.
+        self.walk_vec   = Vec3(0, 0, 0)
+        # The vector the player walks sideways along.
+        self.strafe_vec = Vec3(0, 0, 0)
+
+    def snapshot(self):
+        (o, p, q, a) = (self.offset, self.pos, self.prev_pos, self.angle)
+        (w, s) = (self.walk_vec, self.strafe_vec)
+        return (self.uptodate, o.x, o.y, o.z, p.x, p.y, p.z, q.x, q.y, q.z,
+                a[0], a[1], w.x, w.y, w.z, s.x, s.y, s.z)
+
+    def restore(self, snap):
+        (o, p, q, a) = (self.offset, self.pos, self.prev_pos, self.angle)
+        (w, s) = (self.walk_vec, self.strafe_vec)
+        (self.uptodate, o.x, o.y, o.z, p.x, p.y, p.z, q.x, q.y, q.z,
+         a[0], a[1], w.x, w.y, w.z, s.x, s.y, s.z) = snap
+
+# The numbers for WorldState.changes. They all come from this one counter,
+# so no two worlds ever have the same number, even when one is put back
+# from a snapshot.
+World_Changes = count(1)
+
+# The world (the level layout). A level, as made by mazegen.py or loaded by
+# level.py, is a dict with floors, walls and doom_z; load puts one into a
+# World. The indexes over the floors and walls are kept with them, so
+# switching between worlds doesn't mean building them again.
+class WorldState(State):
+    __slots__ = ("floors", "walls", "doom_z", "floor_index", "wall_index",
+                 "changes")
+
+    def __init__(self, floors=(), walls=(), doom_z=-20):
+        # A list of all the floors. Floors are horizontal rectangles. Each
+        # floor has a dict with these keys:
+        #   coords      A tuple of (x1, y1, x2, y2, z) defining the rectangle
+        #   colour      A tuple of (red, green, blue)
+        #   win         True if this is a winning platform, False otherwise
+        self.floors     = list(floors)
+        # A list of all the walls. Walls are solid boxes which the player
+        # can't walk through; a wall is just a box which is thin one way.
+        # Only the sides of a wall stop the player: to stand on top of one,
+        # put a floor there too. Each wall has a dict with these keys:
+        #   coords      A tuple of (x1, y1, z1, x2, y2, z2) defining the box
+        #   colour      A tuple of (red, green, blue)
+        self.walls      = list(walls)
+        # We die if we fall this low.
+        self.doom_z     = doom_z
+        # The spatial index over the floors (see floorindex.py) and the
+        # AABB tree over the walls (see aabbtree.py), or None until they
+        # are needed. See world_floor_index and world_wall_index in
+        # physics.py.
+        self.floor_index = None
+        self.wall_index = None
+        # A number which is different every time the world changes (see
+        # changed). Whatever draws the world can keep this to tell when it
+        # needs drawing again.
+        self.changes    = next(World_Changes)
+
+    # Use a level. Levels without walls get none.
+    def load(self, level):
+        self.floors     = level["floors"]
+        self.walls      = level.get("walls", [])
+        self.doom_z     = level["doom_z"]
+        self.floor_index = None
+        self.wall_index = None
+        self.changed()
+
+    # Say the world has changed, by giving it a number it hasn't had
+    # before.
+    def changed(self):
+        self.changes    = next(World_Changes)
+
+    # The world as a level dict, for level_save.
+    def as_level(self):
+        return {"floors": self.floors, "walls": self.walls,
+                "doom_z": self.doom_z}
+
+# The physics clock. The physics always runs in ticks of the same length,
+# however fast or slow we are drawing frames, so the game plays the same at
+# any framerate.
+class PhysicsState(State):
+    __slots__ = ("rate", "max_catchup", "acc", "tick", "on_tick")
+
+    def __init__(self):
+        # How many ticks we run per second.
+        self.rate       = 80
+        # The most ticks we will run to catch up after one slow frame. If
+        # we are further behind than this we give up on the extra time,
+        # otherwise a slow frame makes the next frame slow as well and we
+        # never catch up.
+        self.max_catchup = 8
+        # How much time (in milliseconds) we have not yet run ticks for.
+        self.acc        = 0
+        # How many ticks we have run altogether.
+        self.tick       = 0
+        # A function to call after every tick, or None. replay.py uses
+        # this to record the state after each tick.
+        self.on_tick    = None
+
+    # The rate and on_tick are settings rather than part of the game, so
+    # they aren't saved.
+    def snapshot(self):
+        return (self.acc, self.tick)
+
+    def restore(self, snap):
+        (self.acc, self.tick) = snap
+
+# What is happening in the game as a whole.
+class GameState(State):
+    __slots__ = ("over", "on_over")
+
+    def __init__(self):
+        # None while we are playing; "die" or "win" once the game is over.
+        self.over       = None
+        # A function to call with "die" or "win" when the game is over, or
+        # None. Whoever is running the physics sets this so they can stop
+        # the game.
+        self.on_over    = None
+
+    # on_over isn't saved, like Physics.on_tick.
+    def snapshot(self):
+        return (self.over,)
+
+    def restore(self, snap):
+        (self.over,) = snap
@@ -0,0 +1,180 @@
+# sweep.py
+# Try lots of Speed settings on lots of levels at once.
+#
+# Tuning Speed["walk"], Speed["jump"] and Speed["fall"] by playing the
+# game is slow. This runs the physics headless (see headless.py) for every
+# combination of the Speed settings and level files asked for, with either
+# a script or the bot (see bot.py) pressing the keys, and makes a table of
+# which ones were won, which died, and how many ticks they took.
+#
+# The runs are shared out between processes, one per processor by
+# default, so a sweep over thousands of combinations takes minutes rather
+# than hours. Each process keeps the levels it has loaded (and their floor
+# and wall indexes), and the runs are sent out level by level, so each
+# process only loads each level once. The bot's reachability graph depends
+# on the Speed settings too, so it is made again for each run; reach.py
+# only keeps the last few.
+#
+# Speed settings are given as a list, like 0.08,0.1,0.12, or as a range
+# FIRST:LAST:COUNT, like 0.3:0.5:5 for five settings from 0.3 to 0.5.
+# Settings which aren't given stay as they are in physics.py.
+#
+# Run it as
+#   python sweep.py [--walk W] [--jump J] [--fall F] [--bot | --script FILE]
+#                   [--ticks N] [--jobs N] [--csv FILE] [LEVEL...]
+# With no level files it uses the built-in level.
+
+import os
+import sys
+import csv
+import argparse
+import itertools
+from contextlib     import redirect_stdout
+from multiprocessing import Pool
+from time           import perf_counter
+
+import physics
+import headless
+
+# The built-in level, so we can go back to it after loading others.
+BUILTIN = physics.World.snapshot()
+
+# The levels this process has loaded, by file name (None for the built-in
+# level). Each is a snapshot of World, which keeps the level's floor index
+# and wall tree too, so they are only built once.
+Sweep_Levels = {}
+
+# The columns of the results table.
+COLUMNS = ("level", "walk", "jump", "fall", "result", "ticks")
+
+# Turn a list of settings like "0.1,0.2" or a range like "0.1:0.5:5" into
+# a list of numbers.
+def sweep_values(text):
+    if ":" in text:
+        (first, last, count) = text.split(":")
+        (first, last, count) = (float(first), float(last), int(count))
+        if count < 2:
+            return [first]
+        return [first + (last - first) * i / (count - 1)
+                for i in range(count)]
+    return [float(t) for t in text.split(",")]
+
+# Make the list of runs: one (level, walk, jump, fall) tuple for every
+# combination, level by level.
+def sweep_jobs(levels, walks, jumps, falls):
+    return list(itertools.product(levels, walks, jumps, falls))
+
+# Get ready to run in a worker process. Throw away what the physics
+# prints, which would only slow us down.
+def sweep_worker_init():
+    sys.stdout = open(os.devnull, "w")
+
+# Make a level the World, loading it if we haven't already.
+def sweep_level(path):
+    if path not in Sweep_Levels:
+        if path is None:
+            physics.World.restore(BUILTIN)
+        else:
+            from level import level_load
+            physics.World.load(level_load(path))
+        physics.world_floor_index()
+        physics.world_wall_index()
+        Sweep_Levels[path] = physics.World.snapshot()
+    physics.World.restore(Sweep_Levels[path])
+
+# Do one run. job is (level, walk, jump, fall, script, ticks): script is a
+# list of (tick, binding) tuples, or None to use the bot. Returns a dict
+# with the COLUMNS; result is "win", "die" or "timeout".
+def sweep_run(job):
+    (level, walk, jump, fall, script, ticks) = job
+    sweep_level(level)
+    physics.Speed.update({"walk": walk, "jump": jump, "fall": fall})
+    physics.player_reset()
+
+    if script is None:
+        import bot
+        bot.bot_start()
+        done = headless.run(ticks, control=bot.bot_control)
+    else:
+        done = headless.run(ticks, script)
+
+    return {"level": level or "(built-in)", "walk": walk, "jump": jump,
+            "fall": fall, "result": physics.Game.over or "timeout",
+            "ticks": done}
+
+# Do all the runs, using jobs processes. Returns the results in the same
+# order as the runs. progress, if given, is called with the number of runs
+# done so far after each one finishes.
+def sweep(runs, script, ticks, jobs=None, progress=None):
+    work = [run + (script, ticks) for run in runs]
+    jobs = jobs or os.cpu_count() or 1
+    # Send the runs out in chunks, so the processes aren't waiting for
+    # each other, but small enough chunks that they all finish together.
+    chunk = max(1, len(work) // (jobs * 8))
+    results = []
+    with Pool(jobs, initializer=sweep_worker_init) as pool:
+        for row in pool.imap(sweep_run, work, chunk):
+            results.append(row)
+            if progress:
+                progress(len(results))
+    return results
+
+# Print the results as a table, followed by how many runs won, died and
+# ran out of time.
+def sweep_print(results):
+    width = max([len(r["level"]) for r in results] + [len("level")])
+    print("%-*s %8s %8s %8s %-8s %8s" % ((width,) + COLUMNS))
+    for r in results:
+        print("%-*s %8.4g %8.4g %8.4g %-8s %8d" % (width, r["level"],
+            r["walk"], r["jump"], r["fall"], r["result"], r["ticks"]))
+    counts = {}
+    for r in results:
+        counts[r["result"]] = counts.get(r["result"], 0) + 1
+    print(", ".join("%s: %d" % (k, counts[k]) for k in sorted(counts)))
+
+# Save the results to a CSV file.
+def sweep_write_csv(path, results):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, COLUMNS)
+        writer.writeheader()
+        writer.writerows(results)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the physics for every combination of Speed "
+                    "settings and levels.")
+    parser.add_argument("levels", nargs="*", metavar="LEVEL",
+        help="level files (default: the built-in level)")
+    for name in ("walk", "jump", "fall"):
+        parser.add_argument("--" + name, type=sweep_values,
+            default=[physics.Speed[name]],
+            help="Speed['%s'] settings, as A,B,C or FIRST:LAST:COUNT "
+                 "(default %g)" % (name, physics.Speed[name]))
+    how = parser.add_mutually_exclusive_group()
+    how.add_argument("--bot", action="store_true",
+        help="let the bot play (the default)")
+    how.add_argument("--script", help="follow a headless.py script instead")
+    parser.add_argument("--ticks", type=int, default=5000,
+        help="give up after this many ticks (default 5000)")
+    parser.add_argument("--jobs", type=int,
+        help="how many processes to use (default: one per processor)")
+    parser.add_argument("--csv", help="save the results to this CSV file")
+    args = parser.parse_args(argv)
+
+    script = headless.script_load(args.script) if args.script else None
+    runs = sweep_jobs(args.levels or [None], args.walk, args.jump, args.fall)
+
+    start = perf_counter()
+    def progress(done):
+        if done % 100 == 0 or done == len(runs):
+            print("%d/%d runs, %.1fs" % (done, len(runs),
+                perf_counter() - start), file=sys.stderr)
+    results = sweep(runs, script, args.ticks, args.jobs, progress)
+
+    sweep_print(results)
+    if args.csv:
+        sweep_write_csv(args.csv, results)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
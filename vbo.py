@@ -0,0 +1,261 @@
+# vbo.py
+# Draw the floors from a vertex buffer object (VBO).
+#
+# draw_floors in maze.py sends every vertex to OpenGL one call at a time,
+# which is slow to compile into a display list when there are a lot of
+# floors. Instead we work out all the vertices at once with NumPy, copy
+# them into a buffer on the graphics card once, and then draw the whole
+# lot with a single call every frame.
+#
+# The buffer holds a colour, a normal and a position for every vertex, one
+# after the other ('interleaved'). Each floor is a box made of 6 quads, so
+# it takes 24 vertices. Because every floor takes the same space we can
+# change one floor without rebuilding the rest (see vbo_update_floor).
+#
+# The floors are split into square chunks by where they are, and the floors
+# in each chunk are kept together in the buffer. Every frame we check each
+# chunk's bounding box against what the camera can see (the 'view
+# frustum', see view.py) and only draw the chunks which might be on the
+# screen.
+#
+# The walls go in a second buffer, made the same way. There are usually
+# far fewer walls than floors, so they are all drawn every frame.
+
+import ctypes
+import numpy as np
+from OpenGL.GL      import *
+
+from physics        import World, FLOOR_THICKNESS
+from level          import level_columns
+from view           import view_frustum_planes
+
+# Each vertex is 9 floats: red, green, blue, normal x, y, z, then x, y, z.
+VERTEX_FLOATS   = 9
+VERTEX_BYTES    = VERTEX_FLOATS * 4
+FLOOR_VERTICES  = 24
+
+# The faces of a floor. Each face has a normal and four corners; each
+# corner says which x (0 for x1, 1 for x2), which y, and which z (0 for
+# the top, 1 for the bottom) to use. The corners go round anticlockwise
+# seen from outside the box.
+FACES = [
+    ((0, 0, 1),     [(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0)]),
+    ((0, 0, -1),    [(0, 0, 1), (0, 1, 1), (1, 1, 1), (1, 0, 1)]),
+    ((0, -1, 0),    [(0, 0, 1), (1, 0, 1), (1, 0, 0), (0, 0, 0)]),
+    ((0, 1, 0),     [(0, 1, 0), (1, 1, 0), (1, 1, 1), (0, 1, 1)]),
+    ((-1, 0, 0),    [(0, 0, 1), (0, 0, 0), (0, 1, 0), (0, 1, 1)]),
+    ((1, 0, 0),     [(1, 0, 1), (1, 1, 1), (1, 1, 0), (1, 0, 0)]),
+]
+
+# The size of a chunk, in the X and Y directions.
+CHUNK_SIZE = 16
+
+# The same thing as arrays, one row per vertex of a floor.
+CORNERS = np.array([c for (n, cs) in FACES for c in cs])
+NORMALS = np.array([n for (n, cs) in FACES for c in cs], dtype=np.float32)
+
+# This holds the buffer and what is in it:
+#   buffer      the OpenGL buffer
+#   coords      an (n, 5) array of the floor coords, in buffer order
+#   slot        for each floor in World.floors, where it is in the buffer
+#   chunk_of    for each floor in buffer order, which chunk it is in
+#   first       for each chunk, the first vertex in the buffer
+#   count       for each chunk, how many vertices it has
+#   bbox        for each chunk, the (x1, y1, z1, x2, y2, z2) box around it
+#   visible     how many chunks we drew last frame
+#   drawn       how many chunks we have drawn altogether
+#   frames      how many frames we have drawn
+VBO = {}
+
+# Can we use VBOs? They need OpenGL 1.5, and there must be a current
+# OpenGL context before we can ask.
+def vbo_supported():
+    return bool(glGenBuffers)
+
+# Work out the vertices for some floors, from arrays of their coords and
+# colours (see level_columns). Returns a float32 array with one row per
+# vertex (24 rows per floor) of VERTEX_FLOATS columns.
+def vbo_vertices(coords, colour):
+    return vbo_box_vertices(vbo_floor_boxes(coords), colour)
+
+# Work out the vertices for some boxes, from an (n, 6) array of
+# (x1, y1, z1, x2, y2, z2) and an (n, 3) array of colours. Returns an array
+# like vbo_vertices.
+def vbo_box_vertices(boxes, colour):
+    n  = len(boxes)
+    xs = boxes[:,[0, 3]]
+    ys = boxes[:,[1, 4]]
+    zs = boxes[:,[5, 2]]
+
+    v = np.empty((n, FLOOR_VERTICES, VERTEX_FLOATS), dtype=np.float32)
+    v[:,:,0:3]  = colour[:,None,:]
+    v[:,:,3:6]  = NORMALS[None,:,:]
+    v[:,:,6]    = xs[:,CORNERS[:,0]]
+    v[:,:,7]    = ys[:,CORNERS[:,1]]
+    v[:,:,8]    = zs[:,CORNERS[:,2]]
+    return v.reshape(n * FLOOR_VERTICES, VERTEX_FLOATS)
+
+# Work out the box around each floor, as (x1, y1, z1, x2, y2, z2).
+def vbo_floor_boxes(coords):
+    return np.column_stack((coords[:,0], coords[:,1],
+        coords[:,4] - FLOOR_THICKNESS, coords[:,2], coords[:,3], coords[:,4]))
+
+# Work out the box around chunk number c.
+def vbo_chunk_bbox(c):
+    first   = VBO["first"][c] // FLOOR_VERTICES
+    last    = first + VBO["count"][c] // FLOOR_VERTICES
+    boxes   = vbo_floor_boxes(VBO["coords"][first:last])
+    VBO["bbox"][c,0:3] = boxes[:,0:3].min(axis=0)
+    VBO["bbox"][c,3:6] = boxes[:,3:6].max(axis=0)
+
+# Build the vertices for World.floors and copy them into a new buffer.
+def vbo_init():
+    vbo_free()
+
+    (coords, colour, win) = level_columns(World.floors)
+    n       = len(coords)
+
+    # Find which chunk each floor is in, from the middle of the floor, and
+    # sort the floors so each chunk's floors are together.
+    cx      = np.floor((coords[:,0] + coords[:,2]) / 2 / CHUNK_SIZE)
+    cy      = np.floor((coords[:,1] + coords[:,3]) / 2 / CHUNK_SIZE)
+    (keys, chunk) = np.unique(np.column_stack((cx, cy)), axis=0,
+                        return_inverse=True)
+    chunk   = chunk.reshape(-1)
+    order   = np.argsort(chunk, kind="stable")
+    sizes   = np.bincount(chunk, minlength=len(keys))
+
+    VBO["coords"]   = coords[order]
+    VBO["slot"]     = np.empty(n, dtype=np.int64)
+    VBO["slot"][order] = np.arange(n)
+    VBO["chunk_of"] = chunk[order]
+    VBO["first"]    = ((np.cumsum(sizes) - sizes)
+                        * FLOOR_VERTICES).astype(np.int32)
+    VBO["count"]    = (sizes * FLOOR_VERTICES).astype(np.int32)
+    VBO["visible"]  = 0
+    VBO["drawn"]    = 0
+    VBO["frames"]   = 0
+
+    # The chunk boxes are the smallest and largest corners of the floors
+    # in each chunk. reduceat does this for every chunk at once.
+    boxes   = vbo_floor_boxes(VBO["coords"])
+    starts  = VBO["first"] // FLOOR_VERTICES
+    VBO["bbox"] = np.empty((len(keys), 6))
+    if len(keys):
+        VBO["bbox"][:,0:3] = np.minimum.reduceat(boxes[:,0:3], starts)
+        VBO["bbox"][:,3:6] = np.maximum.reduceat(boxes[:,3:6], starts)
+
+    data = vbo_vertices(VBO["coords"], colour[order])
+    buf  = glGenBuffers(1)
+    glBindBuffer(GL_ARRAY_BUFFER, buf)
+    glBufferData(GL_ARRAY_BUFFER, data.nbytes, data, GL_STATIC_DRAW)
+    glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    VBO["buffer"]   = buf
+
+    vbo_init_walls()
+
+# Build the vertices for World.walls and copy them into their own
+# buffer.
+def vbo_init_walls():
+    walls   = World.walls
+    VBO["wall_vertices"] = len(walls) * FLOOR_VERTICES
+    if not walls:
+        return
+    boxes   = np.array([w["coords"] for w in walls], dtype=np.float64)
+    colour  = np.array([w["colour"] for w in walls], dtype=np.float32)
+    data    = vbo_box_vertices(boxes, colour)
+    buf     = glGenBuffers(1)
+    glBindBuffer(GL_ARRAY_BUFFER, buf)
+    glBufferData(GL_ARRAY_BUFFER, data.nbytes, data, GL_STATIC_DRAW)
+    glBindBuffer(GL_ARRAY_BUFFER, 0)
+    VBO["walls"] = buf
+
+# Throw away the buffers, if we have them.
+def vbo_free():
+    for name in ("buffer", "walls"):
+        if name in VBO:
+            glDeleteBuffers(1, [VBO[name]])
+            del VBO[name]
+
+# Floor number n in World.floors has changed, so copy its new vertices
+# into the buffer. Floors can't be added or removed this way; call
+# vbo_init again for that. The floor stays in the same chunk even if it
+# has moved, but the chunk's box is made big enough to hold it.
+def vbo_update_floor(n):
+    floor   = World.floors[n]
+    slot    = VBO["slot"][n]
+    (coords, colour, win) = level_columns([floor])
+    data    = vbo_vertices(coords, colour)
+
+    glBindBuffer(GL_ARRAY_BUFFER, VBO["buffer"])
+    glBufferSubData(GL_ARRAY_BUFFER, slot * FLOOR_VERTICES * VERTEX_BYTES,
+        data.nbytes, data)
+    glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    VBO["coords"][slot] = floor["coords"]
+    vbo_chunk_bbox(VBO["chunk_of"][slot])
+
+# Set up the vertex arrays to read from a buffer, the floor buffer if we
+# aren't told which.
+def vbo_bind(buf=None):
+    glBindBuffer(GL_ARRAY_BUFFER, VBO["buffer"] if buf is None else buf)
+    glEnableClientState(GL_COLOR_ARRAY)
+    glEnableClientState(GL_NORMAL_ARRAY)
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glColorPointer(3, GL_FLOAT, VERTEX_BYTES, ctypes.c_void_p(0))
+    glNormalPointer(GL_FLOAT, VERTEX_BYTES, ctypes.c_void_p(12))
+    glVertexPointer(3, GL_FLOAT, VERTEX_BYTES, ctypes.c_void_p(24))
+
+# Put the vertex array state back how we found it.
+def vbo_unbind():
+    glDisableClientState(GL_COLOR_ARRAY)
+    glDisableClientState(GL_NORMAL_ARRAY)
+    glDisableClientState(GL_VERTEX_ARRAY)
+    glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+# Find which chunks might be on the screen. Returns an array of True or
+# False for each chunk. A chunk is off the screen if its box is completely
+# outside any of the planes; we check this using the corner of the box
+# which is furthest inside each plane.
+def vbo_visible_chunks(planes):
+    bbox    = VBO["bbox"]
+    visible = np.ones(len(bbox), dtype=bool)
+    for (a, b, c, d) in planes:
+        x = bbox[:,3] if a >= 0 else bbox[:,0]
+        y = bbox[:,4] if b >= 0 else bbox[:,1]
+        z = bbox[:,5] if c >= 0 else bbox[:,2]
+        visible &= a*x + b*y + c*z + d >= 0
+    return visible
+
+# Draw the floors which might be on the screen, and the walls. This must be
+# called after the camera has been positioned. The planes around what the
+# camera can see come from view.py, so we don't have to ask OpenGL for the
+# matrices.
+def vbo_draw():
+    visible = vbo_visible_chunks(view_frustum_planes())
+    first   = VBO["first"][visible]
+    count   = VBO["count"][visible]
+    VBO["visible"] = len(first)
+    VBO["drawn"]   += len(first)
+    VBO["frames"]  += 1
+
+    if len(first):
+        vbo_bind()
+        glMultiDrawArrays(GL_QUADS, first, count, len(first))
+        vbo_unbind()
+
+    if VBO.get("wall_vertices"):
+        vbo_bind(VBO["walls"])
+        glDrawArrays(GL_QUADS, 0, VBO["wall_vertices"])
+        vbo_unbind()
+
+# How many chunks are there altogether?
+def vbo_chunk_count():
+    return len(VBO.get("bbox", ()))
+
+# Print how many chunks we have been drawing.
+def vbo_print_stats():
+    if VBO.get("frames"):
+        print("Chunks drawn per frame: %.1f of %d"
+            % (VBO["drawn"] / VBO["frames"], vbo_chunk_count()))
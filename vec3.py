@@ -0,0 +1,170 @@
+# vec3.py
+# A 3D vector type which can be changed in place.
+#
+# The vec_ functions in physics.py make a new list every time they are
+# called, and the physics calls several of them every tick. A Vec3 holds
+# its numbers in three slots, x, y and z, and has methods which change the
+# vector in place instead of making a new one. Each method returns the
+# vector, so they can be chained:
+#   v.set_scaled(walk_vec, walk).add_scaled(strafe_vec, strafe)
+# Because the vectors are changed in place, take a copy if you want to keep
+# the value a vector has now.
+#
+# Reading v.x is quicker than reading v[0] from a list, so code which runs
+# every tick should use the slots. A Vec3 can still be used like a
+# 3-element list (v[0], for x, y, z in v, printing) by code which doesn't
+# care about speed. The methods only take other Vec3s; use Vec3.of to make
+# one from a list.
+#
+# Every method does its sums one number at a time in the same order as the
+# vec_ functions, so the answers are exactly the same.
+#
+# The same sums for NumPy arrays of lots of vectors are in vecs.py. They
+# are kept apart so the physics, which only needs Vec3, doesn't have to
+# wait for NumPy to load.
+
+from math           import sqrt
+
+class Vec3:
+    __slots__ = ("x", "y", "z")
+
+    def __init__(self, x=0, y=0, z=0):
+        self.x = x
+        self.y = y
+        self.z = z
+
+    # Make a Vec3 from a list, tuple or another Vec3.
+    @classmethod
+    def of(cls, v):
+        return cls(v[0], v[1], v[2])
+
+    # A new vector with the same numbers.
+    def copy(self):
+        return Vec3(self.x, self.y, self.z)
+
+    # Set the numbers.
+    def set(self, x, y, z):
+        self.x = x
+        self.y = y
+        self.z = z
+        return self
+
+    # Set the numbers to be the same as v's.
+    def copy_from(self, v):
+        self.x = v.x
+        self.y = v.y
+        self.z = v.z
+        return self
+
+    # Add v to this vector.
+    def add(self, v):
+        self.x += v.x
+        self.y += v.y
+        self.z += v.z
+        return self
+
+    # Take v away from this vector.
+    def sub(self, v):
+        self.x -= v.x
+        self.y -= v.y
+        self.z -= v.z
+        return self
+
+    # Multiply this vector by a number.
+    def scale(self, s):
+        self.x *= s
+        self.y *= s
+        self.z *= s
+        return self
+
+    # Add v times s to this vector.
+    def add_scaled(self, v, s):
+        self.x += v.x*s
+        self.y += v.y*s
+        self.z += v.z*s
+        return self
+
+    # Set this vector to a + b.
+    def set_sum(self, a, b):
+        self.x = a.x + b.x
+        self.y = a.y + b.y
+        self.z = a.z + b.z
+        return self
+
+    # Set this vector to v times s.
+    def set_scaled(self, v, s):
+        self.x = v.x*s
+        self.y = v.y*s
+        self.z = v.z*s
+        return self
+
+    # Set this vector to the cross product of a and b. Neither can be this
+    # vector.
+    def set_cross(self, a, b):
+        self.x = a.y*b.z - a.z*b.y
+        self.y = a.z*b.x - a.x*b.z
+        self.z = a.x*b.y - a.y*b.x
+        return self
+
+    # The dot product of this vector and v.
+    def dot(self, v):
+        return self.x*v.x + self.y*v.y + self.z*v.z
+
+    # The length of this vector.
+    def norm(self):
+        return sqrt(self.x*self.x + self.y*self.y + self.z*self.z)
+
+    # Make this vector length 1, in the same direction.
+    def normalise(self):
+        n = self.norm()
+        self.x /= n
+        self.y /= n
+        self.z /= n
+        return self
+
+    # Is this vector all zeros?
+    def is_zero(self):
+        return self.x == 0 and self.y == 0 and self.z == 0
+
+    # These let a Vec3 be used like a list of 3 numbers.
+
+    def __len__(self):
+        return 3
+
+    def __getitem__(self, i):
+        if i == 0:
+            return self.x
+        if i == 1:
+            return self.y
+        if i == 2:
+            return self.z
+        # Negative numbers and slices.
+        return [self.x, self.y, self.z][i]
+
+    def __setitem__(self, i, value):
+        if i < 0:
+            i += 3
+        if i == 0:
+            self.x = value
+        elif i == 1:
+            self.y = value
+        elif i == 2:
+            self.z = value
+        else:
+            raise IndexError("Vec3 index out of range")
+
+    def __iter__(self):
+        return iter((self.x, self.y, self.z))
+
+    def __eq__(self, other):
+        try:
+            return len(other) == 3 and (self.x, self.y, self.z) == tuple(other)
+        except TypeError:
+            return NotImplemented
+
+    # Vectors can be changed, so they can't be used as dict keys.
+    __hash__ = None
+
+    # Show a vector like a list, so messages look the same as before.
+    def __repr__(self):
+        return repr([self.x, self.y, self.z])
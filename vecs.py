@@ -0,0 +1,44 @@
+# vecs.py
+# The sums Vec3 does (see vec3.py), for NumPy arrays of lots of vectors.
+#
+# The vecs_ functions work on arrays of shape (n, 3), one vector per row,
+# as batch.py uses. The ones which give vectors take an out array to put
+# the answer in, so they don't have to make a new array either.
+
+import numpy as np
+
+# a and b are (n, 3) arrays, s is a number or an (n,) array, and out is an
+# (n, 3) array to put the answer in, or None to make a new one. out can be
+# the same array as a or b.
+
+def vecs_add(a, b, out=None):
+    return np.add(a, b, out=out)
+
+def vecs_sub(a, b, out=None):
+    return np.subtract(a, b, out=out)
+
+def vecs_scale(a, s, out=None):
+    return np.multiply(a, np.reshape(s, (-1, 1)), out=out)
+
+# a + b*s.
+def vecs_add_scaled(a, b, s, out=None):
+    return np.add(a, b * np.reshape(s, (-1, 1)), out=out)
+
+def vecs_dot(a, b):
+    return a[:,0]*b[:,0] + a[:,1]*b[:,1] + a[:,2]*b[:,2]
+
+def vecs_norm(a):
+    return np.sqrt(vecs_dot(a, a))
+
+def vecs_unit(a, out=None):
+    return np.divide(a, vecs_norm(a)[:,None], out=out)
+
+# The cross product of each row of a with each row of b. out can't be a
+# or b.
+def vecs_cross(a, b, out=None):
+    if out is None:
+        out = np.empty(np.broadcast(a, b).shape)
+    out[:,0] = a[:,1]*b[:,2] - a[:,2]*b[:,1]
+    out[:,1] = a[:,2]*b[:,0] - a[:,0]*b[:,2]
+    out[:,2] = a[:,0]*b[:,1] - a[:,1]*b[:,0]
+    return out
@@ -0,0 +1,135 @@
+# view.py
+# The camera's view and projection matrices, worked out with NumPy.
+#
+# render_camera in maze.py used to position the camera with glLoadIdentity,
+# four glRotatef calls and a glTranslatef every frame, each one a call into
+# OpenGL through PyOpenGL, which is slow from Python. Instead we work out
+# the whole view matrix here and load it with one glLoadMatrixf. We only
+# work it out again when the camera has moved or turned, and the rotation
+# part only when it has turned.
+#
+# Keeping the matrices here also means we don't have to ask OpenGL for
+# them (with glGetFloatv, which makes Python wait for OpenGL) to work out
+# what the camera can see (see vbo.py), or which way a point on the screen
+# is looking (see view_ray).
+#
+# The matrices are 4x4 arrays which multiply column vectors, the same way
+# round as the OpenGL documentation writes them. OpenGL wants them column
+# by column, so the "gl" versions are transposed and put in a ctypes array
+# of 16 floats, ready for glLoadMatrixf. PyOpenGL takes a ctypes array
+# about twice as fast as a NumPy one.
+#
+# This doesn't use OpenGL itself, so it can be used without a display.
+
+import ctypes
+import numpy as np
+from math           import radians, sin, cos, tan
+
+# The matrices and what they were worked out for:
+#   proj        the projection matrix
+#   proj_gl     proj ready for glLoadMatrixf
+#   angle       the camera angle the rotation was worked out for
+#   rotation    the rotation part of the view matrix, for angle
+#   pos         the camera position the view matrix was worked out for
+#   view        the view (modelview) matrix
+#   view_gl     view ready for glLoadMatrixf
+#   planes      the frustum planes for proj and view, or None until needed
+View = {}
+
+# The type of the "gl" matrices.
+GLMatrix = ctypes.c_float * 16
+
+# Make a matrix ready for glLoadMatrixf.
+def view_gl_matrix(m):
+    return GLMatrix(*m.T.ravel().tolist())
+
+# A matrix to rotate by a degrees about the axis (x, y, z), which must be
+# length 1. This is the same matrix glRotatef makes.
+def view_rotate(a, x, y, z):
+    a = radians(a)
+    (c, s) = (cos(a), sin(a))
+    t = 1 - c
+    return np.array([
+        [x*x*t + c,     x*y*t - z*s,    x*z*t + y*s,    0],
+        [y*x*t + z*s,   y*y*t + c,      y*z*t - x*s,    0],
+        [x*z*t - y*s,   y*z*t + x*s,    z*z*t + c,      0],
+        [0,             0,              0,              1]])
+
+# The camera starts pointing down -Z. This turns it to point down +X with
+# +Y upwards, like the first two glRotatef calls in render_camera_gl
+# in maze.py.
+VIEW_BASE = view_rotate(90, 0, 0, 1) @ view_rotate(90, 0, 1, 0)
+
+# Set the projection matrix, the same as gluPerspective would: fovy is
+# the field of view up and down in degrees, aspect is the width of the
+# window divided by its height, and near and far are how close and far
+# away things can be drawn.
+def view_set_projection(fovy, aspect, near, far):
+    f = 1 / tan(radians(fovy) / 2)
+    (a, b) = ((far + near) / (near - far), 2*far*near / (near - far))
+    View["proj"] = np.array([
+        [f / aspect,    0,  0,  0],
+        [0,             f,  0,  0],
+        [0,             0,  a,  b],
+        [0,             0,  -1, 0]])
+    View["proj_gl"] = view_gl_matrix(View["proj"])
+    View["planes"]  = None
+
+# Work out the view matrix for a camera at pos, looking along angle
+# (horizontal and vertical, in degrees, like Camera.angle). If the camera
+# hasn't moved or turned since last time we keep the matrix we have.
+# Returns True if the matrix changed.
+def view_update(pos, angle):
+    (x, y, z) = pos
+    (h, v) = angle
+    if View.get("pos") == (x, y, z) and View.get("angle") == (h, v):
+        return False
+
+    if View.get("angle") != (h, v):
+        # Everything is backwards because we are moving the world rather
+        # than moving the camera. For looking up and down we would expect
+        # a turn about -Y, and for looking round one about +Z, so we turn
+        # the other way.
+        View["rotation"] = (VIEW_BASE @ view_rotate(v, 0, 1, 0)
+                            @ view_rotate(h, 0, 0, -1))
+        View["angle"] = (h, v)
+
+    # Then move the world so the camera is at the origin. This is the
+    # rotation followed by a translation of -pos.
+    rotation = View["rotation"]
+    view = rotation.copy()
+    view[:3,3] = -(rotation[:3,:3] @ (x, y, z))
+    View["view"]    = view
+    View["view_gl"] = view_gl_matrix(view)
+    View["pos"]     = (x, y, z)
+    View["planes"]  = None
+    return True
+
+# Work out the planes around what the camera can see. Returns a (6, 4)
+# array; a point p is inside plane (a, b, c, d) if
+# a*p[0] + b*p[1] + c*p[2] + d >= 0. They are only worked out again when
+# the camera has changed.
+def view_frustum_planes():
+    if View["planes"] is None:
+        m = View["proj"] @ View["view"]
+        View["planes"] = np.array([m[3] + m[0], m[3] - m[0],
+                                   m[3] + m[1], m[3] - m[1],
+                                   m[3] + m[2], m[3] - m[2]])
+    return View["planes"]
+
+# Find which way the camera is looking through pixel (x, y) of a window
+# winsize big, with (0, 0) at the top left like pygame's mouse position.
+# Returns (start, direction): the point on the near plane under the pixel,
+# and a length 1 vector pointing into the screen, both as arrays.
+def view_ray(x, y, winsize):
+    (w, h)  = winsize
+    inverse = np.linalg.inv(View["proj"] @ View["view"])
+    # Screen coordinates go from -1 to 1, with y upwards.
+    sx = 2 * (x + 0.5) / w - 1
+    sy = 1 - 2 * (y + 0.5) / h
+    near = inverse @ (sx, sy, -1, 1)
+    far  = inverse @ (sx, sy, 1, 1)
+    near = near[:3] / near[3]
+    far  = far[:3] / far[3]
+    d = far - near
+    return (near, d / np.linalg.norm(d))